@@ -0,0 +1,398 @@
+import argparse
+import math
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import fitdecode
+
+import telemetry
+from telemetry import FIT_UTC_REFERENCE, decode_fit, fit_cache_path, load_fit, postprocess
+from timeline import SyncMap, build_frame_timeline, forward_fill
+from hud import HUD_FIELDS, HUD_HEADER, ass_time, generate_ass
+
+
+# ------------------------------------------------------------
+# SYNTHETIC FIT FILES
+# ------------------------------------------------------------
+
+FIT_CRC_TABLE = (
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+)
+
+def fit_crc(data, crc=0):
+    for byte in data:
+        tmp = FIT_CRC_TABLE[crc & 0xF]
+        crc = ((crc >> 4) & 0x0FFF) ^ tmp ^ FIT_CRC_TABLE[byte & 0xF]
+        tmp = FIT_CRC_TABLE[crc & 0xF]
+        crc = ((crc >> 4) & 0x0FFF) ^ tmp ^ FIT_CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+def fit_definition(local, global_num, fields):
+    """fields: [(field_def_num, size, base_type)], little-endian."""
+    out = struct.pack("<BBBHB", 0x40 | local, 0, 0, global_num, len(fields))
+    for num, size, base in fields:
+        out += struct.pack("<BBB", num, size, base)
+    return out
+
+def write_synthetic_fit(path, hours=6.0, start_epoch=1_750_000_000, gap_sec=0):
+    """
+    A 1 Hz ride with the message mix a head unit writes: a record per
+    second plus HRV every second, an event every minute and device_info
+    every ten minutes. gap_sec leaves a hole (no records) mid-ride.
+    """
+    n = int(hours * 3600)
+    t0 = int(start_epoch - FIT_UTC_REFERENCE)
+    sc = (1 << 31) / 180.0
+
+    body = bytearray()
+    body += fit_definition(0, 0, [(0, 1, 0x00), (1, 2, 0x84), (4, 4, 0x86)])          # file_id
+    body += struct.pack("<BBHI", 0, 4, 1, t0)
+    body += fit_definition(1, 20, [                                                  # record
+        (253, 4, 0x86), (0, 4, 0x85), (1, 4, 0x85), (2, 2, 0x84), (3, 1, 0x02),
+        (4, 1, 0x02), (5, 4, 0x86), (6, 2, 0x84), (7, 2, 0x84),
+    ])
+    body += fit_definition(2, 78, [(0, 10, 0x84)])                                   # hrv (5 × uint16)
+    body += fit_definition(3, 21, [(253, 4, 0x86), (0, 1, 0x00), (1, 1, 0x00)])      # event
+    body += fit_definition(4, 23, [(253, 4, 0x86), (0, 1, 0x02), (2, 2, 0x84)])      # device_info
+
+    dist = 0.0
+    for i in range(n):
+        if gap_sec and n // 2 <= i < n // 2 + gap_sec:
+            continue
+        speed = 8.0 + 3.0 * math.sin(i / 300.0)
+        dist += speed
+        lat = 45.0 + 0.02 * math.sin(i / 2000.0)
+        lon = -122.0 + 0.02 * math.cos(i / 2000.0)
+        alt = 120.0 + 40.0 * math.sin(i / 900.0)
+        body += struct.pack(
+            "<BIiiHBBIHH", 1, t0 + i, int(lat * sc), int(lon * sc),
+            int((alt + 500) * 5), 120 + i % 40, 85 + i % 10, int(dist * 100),
+            int(speed * 1000), 180 + i % 60,
+        )
+        body += struct.pack("<B5H", 2, *([800 + i % 50] * 5))
+        if i % 60 == 0:
+            body += struct.pack("<BIBB", 3, t0 + i, 0, 0)
+        if i % 600 == 0:
+            body += struct.pack("<BIBH", 4, t0 + i, 0, 1)
+
+    header = struct.pack("<BBHI4s", 14, 0x20, 2132, len(body), b".FIT")
+    header += struct.pack("<H", fit_crc(header))
+    data = header + bytes(body)
+    with open(path, "wb") as f:
+        f.write(data + struct.pack("<H", fit_crc(data)))
+    return path
+
+
+# ------------------------------------------------------------
+# PARSE BENCHMARK
+# ------------------------------------------------------------
+
+def legacy_load_fit(path):
+    """The per-message dict loader both tools used before telemetry.decode_fit()."""
+    pts = []
+    with fitdecode.FitReader(path) as fit:
+        for frame in fit:
+            if not isinstance(frame, fitdecode.records.FitDataMessage):
+                continue
+            row = {f.name: f.value for f in frame.fields}
+            ts = row.get("timestamp")
+            if ts is None:
+                continue
+            if ts.tzinfo is not None:
+                ts = ts.astimezone().replace(tzinfo=None)
+            lat_sc = row.get("position_lat")
+            lon_sc = row.get("position_long")
+            pts.append({
+                "timestamp": ts,
+                "lat": None if lat_sc is None else lat_sc * (180.0 / 2**31),
+                "lon": None if lon_sc is None else lon_sc * (180.0 / 2**31),
+                "speed": row.get("enhanced_speed") or row.get("speed"),
+                "hr": row.get("heart_rate"),
+                "cadence": row.get("cadence"),
+                "power": row.get("power"),
+                "altitude": row.get("enhanced_altitude") or row.get("altitude"),
+                "distance": row.get("distance"),
+            })
+    pts.sort(key=lambda p: p["timestamp"])
+    return pts
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench_parse(fit_path=None, hours=6.0, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        if fit_path is None:
+            fit_path = write_synthetic_fit(os.path.join(tmp, "ride.fit"), hours)
+        size_mb = os.path.getsize(fit_path) / 1e6
+
+        rows = []
+        legacy_sec, legacy = timed(lambda: legacy_load_fit(fit_path), repeat)
+        rows.append(("legacy dicts", legacy_sec, len(legacy)))
+        for crc in ("warn", "disabled"):
+            sec, tele = timed(lambda: decode_fit(fit_path, check_crc=crc), repeat)
+            rows.append((f"filtered crc={crc}", sec, len(tele)))
+
+        cache = fit_cache_path(fit_path)
+        if cache.exists():
+            cache.unlink()
+        load_fit(fit_path)  # populate
+        sec, tele = timed(lambda: load_fit(fit_path), repeat)
+        rows.append(("npz cache hit", sec, len(tele)))
+        if Path(fit_path).parent != Path(tmp):
+            cache.unlink()
+
+    print("\n=== FIT PARSE ===")
+    print(f"{Path(fit_path).name}: {size_mb:.1f} MB, best of {repeat}")
+    print(f"{'loader':<22} {'seconds':>9} {'rows':>8} {'speedup':>8}")
+    for name, sec, count in rows:
+        print(f"{name:<22} {sec:9.3f} {count:8d} {legacy_sec / sec:7.1f}x")
+    print(f"columnar telemetry: {tele.nbytes / 1024:.0f} KiB (loader v{telemetry.LOADER_VERSION})")
+
+
+# ------------------------------------------------------------
+# FRAME TIMELINE BENCHMARK
+# ------------------------------------------------------------
+
+def make_synthetic_groups(tele, duration, count=3, pause_sec=120):
+    """count equal GoPro groups; each later group resumes pause_sec further into the FIT."""
+    groups = []
+    length = duration / count
+    for gi in range(count):
+        start = gi * length
+        groups.append({
+            "group_key": f"{1100 + gi}",
+            "video_start_sec": start,
+            "video_end_sec": start + length,
+            "anchor_video_sec": start,
+            "anchor_fit_timestamp": (
+                tele.datetime_at(0) + timedelta(seconds=start + gi * pause_sec)
+            ).isoformat(),
+        })
+    return groups
+
+def legacy_map_video_to_fit(video_sec, groups):
+    for g in groups:
+        if g["video_start_sec"] <= video_sec < g["video_end_sec"]:
+            anchor_fit = datetime.fromisoformat(g["anchor_fit_timestamp"])
+            return anchor_fit + timedelta(seconds=video_sec - g["anchor_video_sec"])
+    g = groups[-1]
+    anchor_fit = datetime.fromisoformat(g["anchor_fit_timestamp"])
+    return anchor_fit + timedelta(seconds=video_sec - g["anchor_video_sec"])
+
+def legacy_interpolate_fit(points, fit_ts):
+    """Per-frame binary search + timedelta lerp on dict rows (pre-timeline)."""
+    lo, hi = 0, len(points) - 1
+    if fit_ts <= points[0]["timestamp"]:
+        return points[0]
+    if fit_ts >= points[-1]["timestamp"]:
+        return points[-1]
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if points[mid]["timestamp"] < fit_ts:
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    p0, p1 = points[hi], points[lo]
+    t0, t1 = p0["timestamp"], p1["timestamp"]
+    if t1 == t0:
+        return p0
+
+    def lerp(a, b):
+        if a is None or b is None:
+            return None
+        return a + (b - a) * ((fit_ts - t0).total_seconds() / (t1 - t0).total_seconds())
+
+    return {key: lerp(p0[key], p1[key]) for key in p0 if key != "timestamp"}
+
+def synthetic_telemetry(hours, fit_path=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        if fit_path is None:
+            fit_path = write_synthetic_fit(os.path.join(tmp, "ride.fit"), hours + 0.5)
+        return postprocess(decode_fit(fit_path))
+
+def bench_timeline(hours=3.0, fps=30, fit_path=None):
+    tele = synthetic_telemetry(hours, fit_path)
+
+    duration = hours * 3600
+    groups = make_synthetic_groups(tele, duration)
+    frames = int(duration * fps)
+
+    start = time.perf_counter()
+    sync_map = SyncMap.from_groups(groups)
+    timeline = build_frame_timeline(tele, sync_map, duration, fps)
+    new_sec = time.perf_counter() - start
+
+    # The legacy path is timed on a sample of frames and extrapolated
+    points = [tele.row(i) for i in range(len(tele))]
+    sample = range(0, frames, max(1, frames // 20000))
+    start = time.perf_counter()
+    legacy = [legacy_interpolate_fit(points, legacy_map_video_to_fit(f / fps, groups)) for f in sample]
+    legacy_sec = (time.perf_counter() - start) * frames / len(sample)
+
+    # Video→FIT mapping alone: per-frame group scan + ISO parse vs compiled map
+    start = time.perf_counter()
+    for f in sample:
+        legacy_map_video_to_fit(f / fps, groups)
+    legacy_map_sec = (time.perf_counter() - start) * frames / len(sample)
+    start = time.perf_counter()
+    sync_map.lookup(timeline.video_sec)
+    map_sec = time.perf_counter() - start
+
+    worst = 0.0
+    for f, row in zip(sample, legacy):
+        for name in ("speed", "hr", "distance", "lat"):
+            if row[name] is not None:
+                worst = max(worst, abs(row[name] - timeline[name][f]))
+
+    print("\n=== FRAME TIMELINE ===")
+    print(f"{hours:g} h at {fps} fps = {frames} frames, {len(groups)} groups")
+    print(f"legacy per-frame interpolate_fit  {legacy_sec:8.2f} s (extrapolated from {len(sample)} frames)")
+    print(f"vectorised build_frame_timeline   {new_sec:8.3f} s  ({legacy_sec / new_sec:.0f}x)")
+    print(f"legacy map_video_to_fit           {legacy_map_sec:8.2f} s")
+    print(f"compiled SyncMap.lookup           {map_sec:8.3f} s  ({legacy_map_sec / map_sec:.0f}x)")
+    print(f"max abs difference vs legacy: {worst:.2e}")
+
+
+
+# ------------------------------------------------------------
+# ASS HUD BENCHMARK
+# ------------------------------------------------------------
+
+def legacy_generate_ass(timeline, ass_path):
+    """Seven Dialogue lines per frame, as generate_ass() wrote them before change-driven events."""
+    fps = timeline.fps
+    columns = [(forward_fill(timeline[f["column"]]) * f["scale"]).tolist() for f in HUD_FIELDS]
+    lines = [HUD_HEADER]
+    for frame in range(len(timeline)):
+        t0, t1 = ass_time(frame / fps), ass_time((frame + 1) / fps)
+        for field, values in zip(HUD_FIELDS, columns):
+            v = values[frame]
+            fmt = field["fmt"]
+            text = fmt(v) if callable(fmt) else ("N/A" if v != v else fmt.format(v))
+            x, y = field["pos"]
+            lines.append(f"Dialogue: 0,{t0},{t1},HUD,,0,0,0,,{{\\pos({x},{y})}}{field['icon']}  {text}\n")
+    with open(ass_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("".join(lines))
+    return len(lines) - 1
+
+def encode_fps(ass_path, seconds, fps):
+    """Burn the HUD into a blank 4K clip with ffmpeg's subtitles filter (libass) and return frames/sec."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-y",
+        "-f", "lavfi", "-i", f"color=c=gray:s=3840x2160:r={fps}",
+        "-t", str(seconds),
+        "-vf", f"subtitles={ass_path.name}",
+        "-f", "null", "-",
+    ]
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=ass_path.parent, check=True, capture_output=True)
+    return seconds * fps / (time.perf_counter() - start)
+
+def bench_hud(hours=3.0, fps=30, fit_path=None, encode_seconds=20):
+    tele = synthetic_telemetry(hours, fit_path)
+    duration = hours * 3600
+    timeline = build_frame_timeline(tele, SyncMap.from_groups(make_synthetic_groups(tele, duration)), duration, fps)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, writer in (("per-frame (legacy)", legacy_generate_ass), ("change-driven", generate_ass)):
+            ass_path = Path(tmp) / f"{writer.__name__}.ass"
+            start = time.perf_counter()
+            events = writer(timeline, ass_path)
+            sec = time.perf_counter() - start
+            size_mb = ass_path.stat().st_size / 1e6
+            enc = None
+            if encode_seconds and shutil.which("ffmpeg"):
+                enc = encode_fps(ass_path, encode_seconds, fps)
+            rows.append((name, events, size_mb, sec, enc))
+            ass_path.unlink()
+
+    print("\n=== ASS HUD ===")
+    print(f"{hours:g} h at {fps} fps = {len(timeline)} frames")
+    print("rates: " + ", ".join(f"{f['column']}={f['rate'] or 'every frame'}" for f in HUD_FIELDS))
+    print(f"{'writer':<20} {'events':>10} {'MB':>8} {'write s':>8} {'encode fps':>11}")
+    for name, events, size_mb, sec, enc in rows:
+        enc_txt = "-" if enc is None else f"{enc:.1f}"
+        print(f"{name:<20} {events:10d} {size_mb:8.1f} {sec:8.2f} {enc_txt:>11}")
+    if encode_seconds and not shutil.which("ffmpeg"):
+        print("ffmpeg not on PATH: encode fps skipped")
+
+def check_hud_memory(hours=6.0, fps=30, ceiling_mb=16.0, fit_path=None):
+    """
+    Write a full-length HUD with tracemalloc running and fail if the
+    writer's peak allocation exceeds ceiling_mb. The frame timeline is built
+    first and not counted; a streaming writer's peak is independent of
+    ride length, a join-based one grows with it.
+    """
+    tele = synthetic_telemetry(hours, fit_path)
+    duration = hours * 3600
+    timeline = build_frame_timeline(tele, SyncMap.from_groups(make_synthetic_groups(tele, duration)), duration, fps)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ass_path = Path(tmp) / "hud_overlay.ass"
+        tracemalloc.start()
+        start = time.perf_counter()
+        events = generate_ass(timeline, ass_path)
+        sec = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size_mb = ass_path.stat().st_size / 1e6
+
+    peak_mb = peak / 1e6
+    ok = peak_mb <= ceiling_mb
+    print("\n=== ASS HUD MEMORY ===")
+    print(f"{hours:g} h at {fps} fps = {len(timeline)} frames -> {events} events, {size_mb:.1f} MB in {sec:.2f} s")
+    print(f"writer peak {peak_mb:.1f} MB, ceiling {ceiling_mb:g} MB: {'OK' if ok else 'FAIL'}")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the Overlay telemetry pipeline")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("parse", help="legacy vs filtered FIT decode vs .npz cache")
+    p.add_argument("--fit", help="FIT file to parse (default: synthetic ride)")
+    p.add_argument("--hours", type=float, default=6.0, help="synthetic ride length")
+    p.add_argument("--repeat", type=int, default=3)
+
+    p = sub.add_parser("timeline", help="per-frame interpolate_fit vs vectorised frame timeline")
+    p.add_argument("--fit", help="FIT file (default: synthetic ride)")
+    p.add_argument("--hours", type=float, default=3.0, help="video length")
+    p.add_argument("--fps", type=int, default=30)
+
+    p = sub.add_parser("hud", help="per-frame vs change-driven ASS HUD: events, size, write time, encode fps")
+    p.add_argument("--fit", help="FIT file (default: synthetic ride)")
+    p.add_argument("--hours", type=float, default=3.0, help="video length")
+    p.add_argument("--fps", type=int, default=30)
+    p.add_argument("--encode-seconds", type=float, default=20,
+                   help="seconds of 4K video to burn the HUD into per writer (0: skip ffmpeg)")
+
+    p = sub.add_parser("hud-memory", help="fail if writing a long HUD allocates more than a fixed ceiling")
+    p.add_argument("--fit", help="FIT file (default: synthetic ride)")
+    p.add_argument("--hours", type=float, default=6.0, help="video length")
+    p.add_argument("--fps", type=int, default=30)
+    p.add_argument("--ceiling-mb", type=float, default=16.0)
+
+    args = parser.parse_args()
+    if args.cmd == "parse":
+        bench_parse(args.fit, args.hours, args.repeat)
+    elif args.cmd == "timeline":
+        bench_timeline(args.hours, args.fps, args.fit)
+    elif args.cmd == "hud":
+        bench_hud(args.hours, args.fps, args.fit, args.encode_seconds)
+    elif args.cmd == "hud-memory":
+        check_hud_memory(args.hours, args.fps, args.ceiling_mb, args.fit)
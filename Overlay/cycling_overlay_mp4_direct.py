@@ -1,11 +1,10 @@
 import subprocess
 from pathlib import Path
-from datetime import datetime, timedelta
 import json
 import os
 import signal
 import sys
-import fitdecode
+import numpy as np
 import secrets
 import requests
 from PIL import Image, ImageDraw
@@ -13,6 +12,9 @@ from io import BytesIO
 import math
 import sqlite3
 import threading
+from telemetry import discover_fit_files, load_fits, postprocess
+from timeline import SYNC_MAP_FILE, build_frame_timeline, load_or_compile_sync_map, video_time_range
+from hud import generate_ass
 
 # ------------------------------------------------------------
 # CONFIG
@@ -27,23 +29,6 @@ TODAY_DIR = Path(r"D:\GoPro\Today")
 OVERLAY_DIR = Path(r"D:\Users\dylix\source\repos\GoPro\Overlay")
 ASS_FILE = "hud_overlay.ass"
 
-POS_SPEED   = ( 350, 2030 )
-POS_HR      = ( 1263, 2030 )
-POS_POWER   = ( 2176, 2030 )
-POS_CAD     = ( 3089, 2030 )
-
-POS_DIST    = ( 350, 1910 )
-POS_ELEV    = ( 3089, 1910 )
-POS_MOVTIME = ( 1720, 1910 )
-
-ICON_SPEED = "💨"
-ICON_HR    = "♥"
-ICON_POWER = "⚡"
-ICON_CAD   = "⟳"
-ICON_DIST  = "📏️"
-ICON_ELEV  = "🏔️"
-ICON_TIME  = "⏱"
-
 last_center_tile = None
 last_rendered_map = None
 map_center_tile = None
@@ -69,11 +54,14 @@ def find_base_video() -> Path:
         raise FileNotFoundError("No base MP4 found in TODAY_DIR")
     return sorted(mp4s)[-1]
 
-def find_fit_file() -> Path:
-    for pattern in ("*.fit", "*.FIT"):
-        for f in TODAY_DIR.glob(pattern):
-            return f
-    raise SystemExit("No FIT file found in TODAY_DIR")
+def find_fit_files(json_path: Path) -> list:
+    """Every FIT in TODAY_DIR recorded during the video (several if the ride was split)."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    fits = discover_fit_files(TODAY_DIR, video_time_range(meta))
+    if not fits:
+        raise SystemExit("No FIT file found in TODAY_DIR")
+    return fits
 
 def find_json_file() -> Path:
     for f in TODAY_DIR.glob("*.json"):
@@ -118,301 +106,15 @@ def build_group_map(meta, sync_markers):
         g["video_end_sec"] = t + g["duration"]
         t += g["duration"]
 
+    # First marker of each group is its anchor (same rule as the sync tool)
     for m in sync_markers:
-        gi = m["group"]
-        groups[gi]["anchor_video_sec"] = m["video_sec"]
-        groups[gi]["anchor_fit_timestamp"] = m["fit_timestamp"]
+        g = groups[m["group"]]
+        if "anchor_fit_timestamp" not in g:
+            g["anchor_video_sec"] = m["video_sec"]
+            g["anchor_fit_timestamp"] = m["fit_timestamp"]
 
     return groups
 
-def map_video_to_fit(video_sec, groups):
-    for g in groups:
-        if g["video_start_sec"] <= video_sec < g["video_end_sec"]:
-            anchor_video = g["anchor_video_sec"]
-            anchor_fit = datetime.fromisoformat(g["anchor_fit_timestamp"])
-            delta = video_sec - anchor_video
-            return anchor_fit + timedelta(seconds=delta)
-
-    g = groups[-1]
-    anchor_video = g["anchor_video_sec"]
-    anchor_fit = datetime.fromisoformat(g["anchor_fit_timestamp"])
-    delta = video_sec - anchor_video
-    return anchor_fit + timedelta(seconds=delta)
-
-# ------------------------------------------------------------
-# FIT LOADING
-# ------------------------------------------------------------
-
-def load_fit(path: Path):
-    pts = []
-    with fitdecode.FitReader(path) as fit:
-        for frame in fit:
-            if not isinstance(frame, fitdecode.records.FitDataMessage):
-                continue
-            row = {f.name: f.value for f in frame.fields}
-
-            ts = row.get("timestamp")
-            if ts is None:
-                continue
-
-            if ts.tzinfo is not None:
-                ts = ts.astimezone().replace(tzinfo=None)
-
-            lat_sc = row.get("position_lat")
-            lon_sc = row.get("position_long")
-
-            if lat_sc is not None and lon_sc is not None:
-                lat = lat_sc * (180.0 / 2**31)
-                lon = lon_sc * (180.0 / 2**31)
-            else:
-                lat = None
-                lon = None
-
-            speed = row.get("enhanced_speed") or row.get("speed")
-            altitude = row.get("enhanced_altitude") or row.get("altitude")
-
-            pts.append({
-                "timestamp": ts,
-                "lat": lat,
-                "lon": lon,
-                "speed": speed,
-                "hr": row.get("heart_rate"),
-                "cadence": row.get("cadence"),
-                "power": row.get("power"),
-                "altitude": altitude,
-                "distance": row.get("distance"),
-            })
-
-    pts.sort(key=lambda p: p["timestamp"])
-    return pts
-
-# ------------------------------------------------------------
-# FIT INTERPOLATION
-# ------------------------------------------------------------
-
-def interpolate_fit(points, fit_ts):
-    lo, hi = 0, len(points) - 1
-
-    if fit_ts <= points[0]["timestamp"]:
-        return points[0]
-    if fit_ts >= points[-1]["timestamp"]:
-        return points[-1]
-
-    while lo <= hi:
-        mid = (lo + hi) // 2
-        if points[mid]["timestamp"] < fit_ts:
-            lo = mid + 1
-        else:
-            hi = mid - 1
-
-    p0 = points[hi]
-    p1 = points[lo]
-
-    t0 = p0["timestamp"]
-    t1 = p1["timestamp"]
-
-    if t1 == t0:
-        return p0
-
-    def lerp(a, b):
-        if a is None or b is None:
-            return None
-        return a + (b - a) * (
-            (fit_ts - t0).total_seconds() /
-            (t1 - t0).total_seconds()
-        )
-
-    lat = lerp(p0.get("lat"), p1.get("lat"))
-    lon = lerp(p0.get("lon"), p1.get("lon"))
-
-    mt0 = p0.get("moving_time")
-    mt1 = p1.get("moving_time")
-    if mt0 is None or mt1 is None:
-        moving_time = None
-    else:
-        moving_time = lerp(mt0, mt1)
-
-    return {
-        "timestamp": fit_ts,
-        "lat": lat,
-        "lon": lon,
-        "speed":   lerp(p0["speed"],   p1["speed"]),
-        "hr":      lerp(p0["hr"],      p1["hr"]),
-        "cadence": lerp(p0["cadence"], p1["cadence"]),
-        "power":   lerp(p0["power"],   p1["power"]),
-        "altitude":lerp(p0["altitude"],p1["altitude"]),
-        "distance":lerp(p0["distance"],p1["distance"]),
-        "moving_time": moving_time,
-    }
-
-# ------------------------------------------------------------
-# MOVING TIME + NORMALIZATION
-# ------------------------------------------------------------
-
-def postprocess_points(points):
-    t0 = points[0]["timestamp"]
-    for p in points:
-        p["time"] = (p["timestamp"] - t0).total_seconds()
-
-    first_dist = points[0]["distance"] or 0.0
-    for p in points:
-        if p["distance"] is not None:
-            p["distance"] = max(0.0, p["distance"] - first_dist)
-
-    moving_time = 0.0
-    last = points[0]
-    points[0]["moving_time"] = 0.0
-
-    for p in points[1:]:
-        dt = (p["timestamp"] - last["timestamp"]).total_seconds()
-        spd = p["speed"]
-        if spd is not None and spd > 0.5:
-            moving_time += dt
-        p["moving_time"] = moving_time
-        last = p
-
-# ------------------------------------------------------------
-# ASS SUBTITLE GENERATION
-# ------------------------------------------------------------
-
-def ass_time(t):
-    td = timedelta(seconds=float(t))
-    total_ms = int(td.total_seconds() * 1000)
-    h = total_ms // 3600000
-    m = (total_ms // 60000) % 60
-    s = (total_ms // 1000) % 60
-    cs = (total_ms % 1000) // 10
-    return f"{h:d}:{m:02d}:{s:02d}.{cs:02d}"
-
-def generate_ass(points, duration, ass_path: Path, groups):
-    max_t = duration
-
-    header = "[Script Info]\n" + r"""ScriptType: v4.00+
-PlayResX: 3840
-PlayResY: 2160
-ScaledBorderAndShadow: yes
-
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: HUD,Roboto Medium,80,&H00FFFFFF,&H000000FF,&H00000000,&H64000000,-1,0,0,0,100,100,0,0,1,4,0,7,40,40,40,1
-Style: HUDBG,Roboto Medium,60,&H00000000,&H00000000,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,0,0,7,0,0,0,1
-Style: HUDBOX,Roboto Medium,60,&H00000000,&H00000000,&H00000000,&H60000000,0,0,0,0,100,100,0,0,1,0,0,7,0,0,0,1
-
-[Events]
-Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-
-; ============================================================
-; BOTTOM BACKGROUND BAR
-; ============================================================
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBG,,0,0,0,,{\p1\c&H000000&\alpha&H80&}m 0 1900 l 3840 1900 l 3840 2160 l 0 2160 l 0 1900
-
-; ============================================================
-; TOP ROW BOXES
-; ============================================================
-
-; DISTANCE box
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
-m 280 240 l 820 240 b 860 240 860 240 860 280 l 860 460 b 860 500 860 500 820 500 l 280 500 b 240 500 240 500 240 460 l 240 280 b 240 240 240 240 280 240
-
-; ELEVATION box
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
-m 3020 240 l 3560 240 b 3600 240 3600 240 3600 280 l 3600 460 b 3600 500 3600 500 3560 500 l 3020 500 b 2980 500 2980 500 2980 460 l 2980 280 b 2980 240 2980 240 3020 240
-
-; MOVING TIME box
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
-m 280 540 l 820 540 b 860 540 860 540 860 580 l 860 760 b 860 800 860 800 820 800 l 280 800 b 240 800 240 800 240 760 l 240 580 b 240 540 240 540 280 540
-
-; ============================================================
-; BOTTOM ROW BOXES
-; ============================================================
-
-; SPEED box
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
-m 280 1900 l 820 1900 b 860 1900 860 1900 860 1940 l 860 2140 b 860 2180 860 2180 820 2180 l 280 2180 b 240 2180 240 2180 240 2140 l 240 1940 b 240 1900 240 1900 280 1900
-
-; HR box
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
-m 1193 1900 l 1733 1900 b 1773 1900 1773 1900 1773 1940 l 1773 2140 b 1773 2180 1773 2180 1733 2180 l 1193 2180 b 1153 2180 1153 2180 1153 2140 l 1153 1940 b 1153 1900 1153 1900 1193 1900
-
-; POWER box
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
-m 2106 1900 l 2646 1900 b 2686 1900 2686 1900 2686 1940 l 2686 2140 b 2686 2180 2686 2180 2646 2180 l 2106 2180 b 2066 2180 2066 2180 2066 2140 l 2066 1940 b 2066 1900 2066 1900 2106 1900
-
-; CADENCE box
-Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
-m 3019 1900 l 3559 1900 b 3599 1900 3599 1900 3599 1940 l 3599 2140 b 3599 2180 3599 2180 3559 2180 l 3019 2180 b 2979 2180 2979 2180 2979 2140 l 2979 1940 b 2979 1900 2979 1900 3019 1900
-"""
-
-    lines = [header]
-
-    smoother = TelemetrySmoother(max_history=3)
-    def tele_at(t):
-        fit_ts = map_video_to_fit(t, groups)
-        return interpolate_fit(points, fit_ts)
-
-    for frame in range(int(max_t * FPS)):
-        t0 = frame / FPS
-        t1 = (frame + 1) / FPS
-
-        tele = tele_at(t0)
-
-        raw_speed_mps = tele["speed"]
-        raw_hr        = tele["hr"]
-        raw_cad       = tele["cadence"]
-        raw_power     = tele["power"]
-        raw_dist_m    = tele["distance"]
-        raw_elev_m    = tele["altitude"]
-        raw_mtime     = tele["moving_time"]
-
-        speed_mps   = smoother.smooth("speed",       raw_speed_mps)
-        hr          = smoother.smooth("hr",          raw_hr)
-        cad         = smoother.smooth("cadence",     raw_cad)
-        power       = smoother.smooth("power",       raw_power)
-        dist_m      = smoother.smooth("distance",    raw_dist_m)
-        elev_m      = smoother.smooth("altitude",    raw_elev_m)
-        moving_time = smoother.smooth("moving_time", raw_mtime)
-
-        speed_mph   = None if speed_mps is None else speed_mps * 2.23694
-        dist_miles  = None if dist_m   is None else dist_m * 0.000621371
-        elev_ft     = None if elev_m   is None else elev_m * 3.28084
-
-        dist_miles = None if dist_m is None else dist_m * 0.000621371
-        elev_ft = None if elev_m is None else elev_m * 3.28084
-
-        def fmt(val, fmt_str, default="N/A"):
-            return default if val is None else fmt_str.format(val)
-
-        txt_speed   = fmt(speed_mph, "{:4.1f} mph")
-        txt_hr      = fmt(hr,        "{:3.0f} bpm")
-        txt_power   = fmt(power,     "{:4.0f} W")
-        txt_cad     = fmt(cad,       "{:3.0f} rpm")
-        txt_dist    = fmt(dist_miles,"{:5.2f} mi")
-        txt_elev    = fmt(elev_ft,   "{:5.0f} ft")
-        txt_mtime   = "Elapsed: " + ("N/A" if moving_time is None else str(timedelta(seconds=int(moving_time))))
-
-        def dlg(text, pos, icon):
-            x, y = pos
-            return (
-                f"Dialogue: 0,{ass_time(t0)},{ass_time(t1)},HUD,,0,0,0,,"
-                f"{{\\pos({x},{y})}}{icon}  {text}\n"
-            )
-
-        lines.append(dlg(txt_speed,   POS_SPEED,   ICON_SPEED))
-        lines.append(dlg(txt_hr,      POS_HR,      ICON_HR))
-        lines.append(dlg(txt_power,   POS_POWER,   ICON_POWER))
-        lines.append(dlg(txt_cad,     POS_CAD,     ICON_CAD))
-        lines.append(dlg(txt_dist,    POS_DIST,    ICON_DIST))
-        lines.append(dlg(txt_elev,    POS_ELEV,    ICON_ELEV))
-        lines.append(dlg(txt_mtime,   POS_MOVTIME, ICON_TIME))
-
-    ass_text = "".join(lines)
-
-    while ass_text and ass_text[0] in ("\ufeff", "\n", "\r", "\t", " "):
-        ass_text = ass_text[1:]
-
-    with open(ass_path, "w", encoding="utf-8", newline="\n") as f:
-        f.write(ass_text)
-
 # ------------------------------------------------------------
 # MAP / MBTILES
 # ------------------------------------------------------------
@@ -483,15 +185,13 @@ def render_map(lat, lon, route_points, zoom=15, size=MAP_SIZE, tile_grid=MAP_TIL
     # --- breadcrumb: last N valid GPS points ---
     MAX_POINTS = 150  # tune this for trail length
 
-    recent = []
-    for p in route_points:
-        if p.get("lat") is not None and p.get("lon") is not None:
-            recent.append(p)
-        if len(recent) >= MAX_POINTS:
-            break
+    recent = np.flatnonzero(route_points.gps_mask())[:MAX_POINTS]
 
     # Project raw trail points
-    trail_raw = [project_raw(p["lat"], p["lon"]) for p in recent]
+    trail_raw = [
+        project_raw(p_lat, p_lon)
+        for p_lat, p_lon in zip(route_points["lat"][recent], route_points["lon"][recent])
+    ]
 
     # Rider position in padded space
     px, py = project_raw(lat, lon)
@@ -562,23 +262,20 @@ def get_video_duration(path: Path) -> float:
 # MAP STREAMING
 # ------------------------------------------------------------
 
-def stream_maps(points, duration, groups, process):
+def stream_maps(timeline, points, duration, process):
     last_map_second = None
     last_map = None
 
-    def tele_at(t):
-        fit_ts = map_video_to_fit(t, groups)
-        return interpolate_fit(points, fit_ts)
-
-    total_frames = int(duration * FPS)
+    lats = timeline["lat"].tolist()
+    lons = timeline["lon"].tolist()
+    total_frames = min(len(timeline), int(duration * FPS))
 
     for frame in range(total_frames):
         t0 = frame / FPS
-        tele = tele_at(t0)
-        lat = tele["lat"]
-        lon = tele["lon"]
+        lat = lats[frame]
+        lon = lons[frame]
 
-        if lat is None or lon is None:
+        if lat != lat or lon != lon:   # NaN: no GPS for this frame
             map_img = last_map ##Image.new("RGBA", (MAP_SIZE, MAP_SIZE), (0, 0, 0))
         else:
             current_sec = int(t0)
@@ -596,14 +293,17 @@ def stream_maps(points, duration, groups, process):
 # MAIN PIPELINE
 # ------------------------------------------------------------
 
-def main(video_path: Path, fit_path: Path, json_path: Path, output_mp4: Path):
+def main(video_path: Path, fit_paths: list, json_path: Path, output_mp4: Path):
     print("Loading FIT telemetry…")
-    raw_points = load_fit(fit_path)
-    if not raw_points:
+    raw_points = load_fits(fit_paths)
+    if not len(raw_points):
         raise SystemExit("No telemetry points found in FIT file.")
+    if len(fit_paths) > 1:
+        print(f"Merged {len(fit_paths)} FIT activities")
     mid = len(raw_points) // 2
-    for p in raw_points[mid:mid+10]:
-        print(p)
+    for i in range(mid, min(mid + 10, len(raw_points))):
+        print(raw_points.row(i))
+    print(f"{len(raw_points)} samples, {raw_points.nbytes / 1024:.0f} KiB columnar")
 
 
     print("Loading chapter metadata…")
@@ -632,15 +332,25 @@ def main(video_path: Path, fit_path: Path, json_path: Path, output_mp4: Path):
 
     print("Building GoPro group map…")
     groups = build_group_map(chapter_meta, sync_markers)
+    sync_map = load_or_compile_sync_map(OVERLAY_DIR / SYNC_MAP_FILE, video_path.name, groups)
+    missing = sync_map.unanchored()
+    if len(missing) == len(sync_map):
+        raise SystemExit("No sync markers for this video — run the sync tool first")
+    if missing:
+        print(f"WARNING: groups {missing} have no sync marker; using the nearest group's offset")
+    sync_map = sync_map.filled()
 
     print("Normalizing FIT data…")
-    postprocess_points(raw_points)
+    postprocess(raw_points)
 
     duration = get_video_duration(video_path)
 
+    print("Building frame timeline…")
+    timeline = build_frame_timeline(raw_points, sync_map, duration, FPS)
+
     print("Generating ASS HUD overlay…")
     ass_path = (OVERLAY_DIR / "hud_overlay.ass").resolve()
-    generate_ass(raw_points, duration, ass_path, groups)
+    generate_ass(timeline, ass_path)
     if PREVIEW_SECONDS is not None:
         print(f"PREVIEW MODE: encoding first {PREVIEW_SECONDS} seconds")
         t_limit = PREVIEW_SECONDS
@@ -721,7 +431,7 @@ def main(video_path: Path, fit_path: Path, json_path: Path, output_mp4: Path):
     PID_FILE.write_text(json.dumps({"pid": process.pid}))
 
     def stream_thread():
-        stream_maps(raw_points, t_limit, groups, process)
+        stream_maps(timeline, raw_points, t_limit, process)
 
     t = threading.Thread(target=stream_thread)
     t.start()
@@ -736,32 +446,6 @@ def main(video_path: Path, fit_path: Path, json_path: Path, output_mp4: Path):
     print("Done. Final MP4 written to", output_mp4)
 
 
-from collections import deque
-
-class TelemetrySmoother:
-    def __init__(self, max_history=3):
-        self.history = {}  # field -> deque of last non-None values
-        self.max_history = max_history
-
-    def smooth(self, field, value):
-        if field not in self.history:
-            self.history[field] = deque(maxlen=self.max_history)
-
-        buf = self.history[field]
-
-        # If we have a real value, store it and use it
-        if value is not None:
-            buf.append(value)
-            return value
-
-        # If value is None but we have history, reuse last good value
-        if buf:
-            return buf[-1]
-
-        # No history, still None
-        return None
-
-
 # ------------------------------------------------------------
 # ENTRY POINT
 # ------------------------------------------------------------
@@ -776,14 +460,14 @@ if __name__ == "__main__":
     # JSON always matches the MP4 name
     json_path = TODAY_DIR / f"{markers['video_file']}.meta.json"
 
-    # FIT: sync_fit.py always uses the first FIT file in the folder
-    fit_path = find_fit_file()
+    # FIT: every activity overlapping the video, same as sync_fit.py
+    fit_paths = find_fit_files(json_path)
 
     output_mp4 = TODAY_DIR / generate_hashed_overlay_name(base_video).name
 
     print(f"Detected video: {base_video}")
-    print(f"Detected FIT:   {fit_path}")
+    print(f"Detected FIT:   {', '.join(str(p) for p in fit_paths)}")
     print(f"Detected JSON:  {json_path}")
     print(f"Output MP4:     {output_mp4}")
 
-    main(base_video, fit_path, json_path, output_mp4)
+    main(base_video, fit_paths, json_path, output_mp4)
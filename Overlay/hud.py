@@ -0,0 +1,174 @@
+from datetime import timedelta
+from pathlib import Path
+import numpy as np
+
+from timeline import forward_fill
+
+# ------------------------------------------------------------
+# HUD LAYOUT
+# ------------------------------------------------------------
+
+POS_SPEED   = ( 350, 2030 )
+POS_HR      = ( 1263, 2030 )
+POS_POWER   = ( 2176, 2030 )
+POS_CAD     = ( 3089, 2030 )
+
+POS_DIST    = ( 350, 1910 )
+POS_ELEV    = ( 3089, 1910 )
+POS_MOVTIME = ( 1720, 1910 )
+
+ICON_SPEED = "💨"
+ICON_HR    = "♥"
+ICON_POWER = "⚡"
+ICON_CAD   = "⟳"
+ICON_DIST  = "📏️"
+ICON_ELEV  = "🏔️"
+ICON_TIME  = "⏱"
+
+def format_elapsed(seconds):
+    return "Elapsed: " + ("N/A" if seconds != seconds else str(timedelta(seconds=int(seconds))))
+
+# One entry per HUD text field. "rate" is how many times per second the
+# field may change (None: every frame); a field only gets a new Dialogue
+# event when its formatted text actually changes.
+HUD_FIELDS = [
+    {"column": "speed",       "scale": 2.23694,     "fmt": "{:4.1f} mph",  "pos": POS_SPEED,   "icon": ICON_SPEED, "rate": 10},
+    {"column": "hr",          "scale": 1.0,         "fmt": "{:3.0f} bpm",  "pos": POS_HR,      "icon": ICON_HR,    "rate": 1},
+    {"column": "power",       "scale": 1.0,         "fmt": "{:4.0f} W",    "pos": POS_POWER,   "icon": ICON_POWER, "rate": 2},
+    {"column": "cadence",     "scale": 1.0,         "fmt": "{:3.0f} rpm",  "pos": POS_CAD,     "icon": ICON_CAD,   "rate": 2},
+    {"column": "distance",    "scale": 0.000621371, "fmt": "{:5.2f} mi",   "pos": POS_DIST,    "icon": ICON_DIST,  "rate": 1},
+    {"column": "altitude",    "scale": 3.28084,     "fmt": "{:5.0f} ft",   "pos": POS_ELEV,    "icon": ICON_ELEV,  "rate": 1},
+    {"column": "moving_time", "scale": 1.0,         "fmt": format_elapsed, "pos": POS_MOVTIME, "icon": ICON_TIME,  "rate": None},
+]
+
+# ------------------------------------------------------------
+# ASS HUD
+# ------------------------------------------------------------
+
+def ass_time(t):
+    td = timedelta(seconds=float(t))
+    total_ms = int(td.total_seconds() * 1000)
+    h = total_ms // 3600000
+    m = (total_ms // 60000) % 60
+    s = (total_ms // 1000) % 60
+    cs = (total_ms % 1000) // 10
+    return f"{h:d}:{m:02d}:{s:02d}.{cs:02d}"
+
+HUD_HEADER = "[Script Info]\n" + r"""ScriptType: v4.00+
+PlayResX: 3840
+PlayResY: 2160
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: HUD,Roboto Medium,80,&H00FFFFFF,&H000000FF,&H00000000,&H64000000,-1,0,0,0,100,100,0,0,1,4,0,7,40,40,40,1
+Style: HUDBG,Roboto Medium,60,&H00000000,&H00000000,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,0,0,7,0,0,0,1
+Style: HUDBOX,Roboto Medium,60,&H00000000,&H00000000,&H00000000,&H60000000,0,0,0,0,100,100,0,0,1,0,0,7,0,0,0,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+
+; ============================================================
+; BOTTOM BACKGROUND BAR
+; ============================================================
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBG,,0,0,0,,{\p1\c&H000000&\alpha&H80&}m 0 1900 l 3840 1900 l 3840 2160 l 0 2160 l 0 1900
+
+; ============================================================
+; TOP ROW BOXES
+; ============================================================
+
+; DISTANCE box
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
+m 280 240 l 820 240 b 860 240 860 240 860 280 l 860 460 b 860 500 860 500 820 500 l 280 500 b 240 500 240 500 240 460 l 240 280 b 240 240 240 240 280 240
+
+; ELEVATION box
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
+m 3020 240 l 3560 240 b 3600 240 3600 240 3600 280 l 3600 460 b 3600 500 3600 500 3560 500 l 3020 500 b 2980 500 2980 500 2980 460 l 2980 280 b 2980 240 2980 240 3020 240
+
+; MOVING TIME box
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
+m 280 540 l 820 540 b 860 540 860 540 860 580 l 860 760 b 860 800 860 800 820 800 l 280 800 b 240 800 240 800 240 760 l 240 580 b 240 540 240 540 280 540
+
+; ============================================================
+; BOTTOM ROW BOXES
+; ============================================================
+
+; SPEED box
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
+m 280 1900 l 820 1900 b 860 1900 860 1900 860 1940 l 860 2140 b 860 2180 860 2180 820 2180 l 280 2180 b 240 2180 240 2180 240 2140 l 240 1940 b 240 1900 240 1900 280 1900
+
+; HR box
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
+m 1193 1900 l 1733 1900 b 1773 1900 1773 1900 1773 1940 l 1773 2140 b 1773 2180 1773 2180 1733 2180 l 1193 2180 b 1153 2180 1153 2180 1153 2140 l 1153 1940 b 1153 1900 1153 1900 1193 1900
+
+; POWER box
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
+m 2106 1900 l 2646 1900 b 2686 1900 2686 1900 2686 1940 l 2686 2140 b 2686 2180 2686 2180 2646 2180 l 2106 2180 b 2066 2180 2066 2180 2066 2140 l 2066 1940 b 2066 1900 2066 1900 2106 1900
+
+; CADENCE box
+Dialogue: 0,0:00:00.00,9:59:59.00,HUDBOX,,0,0,0,,{\p1\c&H000000&\alpha&H60&}
+m 3019 1900 l 3559 1900 b 3599 1900 3599 1900 3599 1940 l 3599 2140 b 3599 2180 3599 2180 3559 2180 l 3019 2180 b 2979 2180 2979 2180 2979 2140 l 2979 1940 b 2979 1900 2979 1900 3019 1900
+"""
+
+# Frames are converted and formatted this many at a time, so the writer's
+# memory does not grow with ride length
+HUD_BLOCK = 1 << 16
+
+def field_samples(first, last, fps, rate):
+    """Frames in [first, last) that start an update slot for a field updated rate times per second."""
+    frames = np.arange(first, last)
+    if rate is None or rate >= fps:
+        return frames
+    step = rate / fps
+    return frames[np.floor(frames * step) != np.floor((frames - 1) * step)]
+
+def field_events(timeline, field):
+    """
+    (start_frame, end_frame, text) for one HUD field: the value is sampled
+    at the field's rate and consecutive samples with the same text are
+    merged into a single event.
+    """
+    n = len(timeline)
+    col = timeline[field["column"]]
+    fmt = field["fmt"]
+
+    carry = np.nan
+    run_start, run_text = None, None
+    for first in range(0, n, HUD_BLOCK):
+        last = min(first + HUD_BLOCK, n)
+        # Hold the last good value across telemetry gaps (and block edges), then convert units
+        filled = forward_fill(np.concatenate(([carry], col[first:last])))[1:]
+        carry = filled[-1]
+        starts = field_samples(first, last, timeline.fps, field["rate"])
+        values = (filled[starts - first] * field["scale"]).tolist()
+
+        for frame, v in zip(starts.tolist(), values):
+            if callable(fmt):
+                text = fmt(v)
+            else:
+                text = "N/A" if v != v else fmt.format(v)   # NaN → N/A
+            if text != run_text:
+                if run_text is not None:
+                    yield run_start, frame, run_text
+                run_start, run_text = frame, text
+    if run_text is not None:
+        yield run_start, n, run_text
+
+def generate_ass(timeline, ass_path: Path):
+    """Stream the HUD for a FrameTimeline to ass_path; returns the number of Dialogue events."""
+    fps = timeline.fps
+    events = 0
+
+    with open(ass_path, "w", encoding="utf-8", newline="\n", buffering=1 << 20) as f:
+        f.write(HUD_HEADER.lstrip("\ufeff\n\r\t "))
+        for field in HUD_FIELDS:
+            x, y = field["pos"]
+            prefix = f"{{\\pos({x},{y})}}{field['icon']}  "
+            for f0, f1, text in field_events(timeline, field):
+                f.write(
+                    f"Dialogue: 0,{ass_time(f0 / fps)},{ass_time(f1 / fps)},HUD,,0,0,0,,"
+                    f"{prefix}{text}\n"
+                )
+                events += 1
+
+    return events
@@ -3,14 +3,15 @@ import os
 from pathlib import Path
 import json
 import cv2
+import numpy as np
 import time
-import fitdecode
 import folium
 import glob
 import re
-from datetime import datetime, timedelta
 from PyQt5 import QtWidgets, QtGui, QtCore, QtWebEngineWidgets, QtWebChannel
 from PyQt5.QtCore import QMetaObject, Qt
+from telemetry import discover_fit_files, load_fits
+from timeline import SYNC_MAP_FILE, SyncMap, video_time_range
 import ctypes
 import ctypes.wintypes as wintypes
 ctypes.windll.kernel32.SetConsoleCtrlHandler(None, True)
@@ -110,7 +111,7 @@ class SyncTool(QtWidgets.QWidget):
     eta_last_update = None
     eta_seconds_remaining = None
 
-    def __init__(self, video_path, fit_path, parent=None):
+    def __init__(self, video_path, fit_paths, parent=None):
         super().__init__(parent)
         self.video_file = Path(video_path).name
 
@@ -148,13 +149,14 @@ class SyncTool(QtWidgets.QWidget):
         # ---------------------------------------------------------
         # LOAD FIT + METADATA
         # ---------------------------------------------------------
-        self.fit_points = self.load_fit(fit_path)
-        if not self.fit_points:
+        self.fit_points = self.load_fit(fit_paths)
+        if not len(self.fit_points):
             raise SystemExit("No GPS points found in FIT")
 
         with open(META_PATH, "r", encoding="utf-8") as f:
             meta = json.load(f)
 
+        self.meta = meta
         self.chapters = meta["chapters"]
         self.total_video_duration = meta["video"]["total_duration_sec"]
 
@@ -179,6 +181,9 @@ class SyncTool(QtWidgets.QWidget):
             self.group_boundaries.append((start, end))
             t = end
 
+        # Compiled video→FIT map (no anchors yet; rebuilt whenever markers change)
+        self.sync_map = SyncMap.from_groups(self.anchored_groups())
+
         self.sync_markers = []
         self.paused = False
 
@@ -494,15 +499,15 @@ class SyncTool(QtWidgets.QWidget):
         self.map_ready = True
 
         # Draw full polyline
-        coords = [[float(p[1]), float(p[2])] for p in self.fit_points]
+        coords = np.column_stack((self.fit_points["lat"], self.fit_points["lon"])).tolist()
         self.map_view.page().runJavaScript(f"setPolyline({coords});")
 
         # Determine the correct starting FIT index
         fit_idx = getattr(self, "current_fit_index", 0)
 
         # Move marker to the correct starting point
-        lat = float(self.fit_points[fit_idx][1])
-        lon = float(self.fit_points[fit_idx][2])
+        lat = float(self.fit_points["lat"][fit_idx])
+        lon = float(self.fit_points["lon"][fit_idx])
         self.map_view.page().runJavaScript(f"moveMarker({lat}, {lon});")
 
         # Optional: ensure map centers on the marker
@@ -678,9 +683,20 @@ class SyncTool(QtWidgets.QWidget):
         for m in self.sync_markers:
             g = int(m["group"])
             if g not in self.group_anchors:
-                av = float(m["video_sec"])
-                ats = datetime.fromisoformat(m["fit_timestamp"])
-                self.group_anchors[g] = (av, ats)
+                self.group_anchors[g] = m
+        self.sync_map = SyncMap.from_groups(self.anchored_groups())
+
+    def anchored_groups(self):
+        """Group boundaries plus each group's anchor marker, in group_mapping.json form."""
+        groups = []
+        for gi, (start, end) in enumerate(self.group_boundaries):
+            g = {"video_start_sec": start, "video_end_sec": end}
+            m = self.group_anchors.get(gi)
+            if m is not None:
+                g["anchor_video_sec"] = float(m["video_sec"])
+                g["anchor_fit_timestamp"] = m["fit_timestamp"]
+            groups.append(g)
+        return groups
 
     def jump_to_marker(self, row):
         if row < 0 or row >= len(self.sync_markers):
@@ -794,35 +810,10 @@ class SyncTool(QtWidgets.QWidget):
             self.toggle_play()
 
     # ---------------------------------------------------------
-    # FIT LOADING (Garmin semicircle conversion)
+    # FIT LOADING (shared columnar loader, GPS samples only)
     # ---------------------------------------------------------
-    def load_fit(self, path):
-        pts = []
-        SEMICIRCLE = 180.0 / (1 << 31)
-
-        with fitdecode.FitReader(path) as fit:
-            for frame in fit:
-                if not isinstance(frame, fitdecode.records.FitDataMessage):
-                    continue
-
-                row = {f.name: f.value for f in frame.fields}
-                ts = row.get("timestamp")
-                lat_raw = row.get("position_lat")
-                lon_raw = row.get("position_long")
-
-                if ts is None or lat_raw is None or lon_raw is None:
-                    continue
-
-                if ts.tzinfo is not None:
-                    ts = ts.astimezone().replace(tzinfo=None)
-
-                lat = lat_raw * SEMICIRCLE
-                lon = lon_raw * SEMICIRCLE
-
-                pts.append((ts, lat, lon))
-
-        pts.sort(key=lambda p: p[0])
-        return pts
+    def load_fit(self, paths):
+        return load_fits(paths).gps_only()
 
        # MAP - STATIC HTML
 
@@ -831,8 +822,8 @@ class SyncTool(QtWidgets.QWidget):
             return  # map not ready yet
 
         marker_index = max(0, min(marker_index, len(self.fit_points) - 1))
-        lat = float(self.fit_points[marker_index][1])
-        lon = float(self.fit_points[marker_index][2])
+        lat = float(self.fit_points["lat"][marker_index])
+        lon = float(self.fit_points["lon"][marker_index])
 
         self.map_view.page().runJavaScript(f"moveMarker({lat}, {lon});")
 
@@ -992,27 +983,16 @@ class SyncTool(QtWidgets.QWidget):
     # SIMPLE VIDEO→FIT MAPPING (to be refined with markers)
     # ---------------------------------------------------------
     def video_time_to_fit_index(self, video_sec: float) -> int:
-        # If we have per-group anchors, use zero-drift chapter mapping
-        if self.group_anchors:
-            g = self.get_current_group(video_sec)
-            if g in self.group_anchors:
-                anchor_video_sec, anchor_fit_ts = self.group_anchors[g]
-                delta_sec = video_sec - anchor_video_sec
-                target_ts = anchor_fit_ts + timedelta(seconds=delta_sec)
-                # Find nearest FIT point to target_ts
-                best_idx = 0
-                best_err = float("inf")
-                for i, (ts, _, _) in enumerate(self.fit_points):
-                    err = abs((ts - target_ts).total_seconds())
-                    if err < best_err:
-                        best_err = err
-                        best_idx = i
-                return best_idx
+        # If this group has an anchor, use the compiled zero-drift chapter mapping
+        target_ts = self.sync_map.lookup(video_sec)
+        if not np.isnan(target_ts):
+            # Nearest FIT point to target_ts (binary search on sorted timestamps)
+            return self.fit_points.nearest_index(target_ts)
 
         # Fallback: global linear mapping
-        t0 = self.fit_points[0][0]
-        t1 = self.fit_points[-1][0]
-        fit_duration = (t1 - t0).total_seconds()
+        t0 = self.fit_points.timestamps[0]
+        t1 = self.fit_points.timestamps[-1]
+        fit_duration = t1 - t0
         if fit_duration <= 0:
             return 0
         frac = max(0.0, min(1.0, video_sec / fit_duration))
@@ -1023,10 +1003,7 @@ class SyncTool(QtWidgets.QWidget):
     # GROUP HELPERS
     # ---------------------------------------------------------
     def get_current_group(self, video_sec: float) -> int:
-        for i, (start, end) in enumerate(self.group_boundaries):
-            if start <= video_sec < end:
-                return i
-        return len(self.group_boundaries) - 1
+        return self.sync_map.group_of(video_sec)
 
     # ---------------------------------------------------------
     # SYNC MARKERS (group-aware)
@@ -1035,7 +1012,7 @@ class SyncTool(QtWidgets.QWidget):
         frame_idx = self.slider.value()
         video_sec = frame_idx / self.fps
         fit_idx = self.fit_slider.value()
-        fit_ts = self.fit_points[fit_idx][0]
+        fit_ts = self.fit_points.datetime_at(fit_idx)
         group = self.get_current_group(video_sec)
         marker = {
             "group": int(group),
@@ -1067,6 +1044,11 @@ class SyncTool(QtWidgets.QWidget):
         with out_path.open("w", encoding="utf-8") as f:
             json.dump(payload, f, indent=2)
 
+        # Anchored group mapping + compiled video→FIT map for the encoder
+        with open("group_mapping.json", "w", encoding="utf-8") as f:
+            json.dump(build_group_mapping(self.meta, self.sync_markers), f, indent=2)
+        self.sync_map.save(Path(SYNC_MAP_FILE), self.video_file)
+
         self.slider.set_markers(
             [m["video_sec"] for m in self.sync_markers],
             self.total_video_duration,
@@ -1191,15 +1173,15 @@ def auto_detect_files():
             print(f"Expected something containing: {base}")
             sys.exit(1)
 
-    # 3. Detect FIT file
-    fits = [str(p) for p in sorted(TODAY_DIR.glob("*.fit"))]
-    if not fits:
+    # 3. Detect FIT files recorded during the video (a split ride has several)
+    with open(META_PATH, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    FIT_PATHS = discover_fit_files(TODAY_DIR, video_time_range(meta))
+    if not FIT_PATHS:
         print("ERROR: No FIT file found.")
         sys.exit(1)
 
-    FIT_PATH = fits[0]
-
-    return VIDEO_PATH, META_PATH, FIT_PATH
+    return VIDEO_PATH, META_PATH, FIT_PATHS
 
 def extract_group_key(filename: str) -> str:
     # filename like "2026-06-16-06-02-29-GX011102.MP4"
@@ -1271,10 +1253,10 @@ if __name__ == "__main__":
     TODAY_DIR = Path(r"D:\GoPro\Today")
     OVERLAY_DIR = Path(r"D:\Users\dylix\source\repos\GoPro\Overlay")
     PID_FILE = Path(__file__).resolve().parent / "ffmpeg_pid.json"
-    VIDEO_PATH, META_PATH, FIT_PATH = auto_detect_files()
+    VIDEO_PATH, META_PATH, FIT_PATHS = auto_detect_files()
     print("Using video:", VIDEO_PATH)
     print("Using meta:", META_PATH)
-    print("Using FIT:", FIT_PATH)
+    print("Using FIT:", ", ".join(str(p) for p in FIT_PATHS))
 
     # ---------------------------------------------------------
     # 2. LOAD META AND BUILD GROUP MAPPING
@@ -1309,7 +1291,7 @@ if __name__ == "__main__":
     # 3. LAUNCH GUI
     # ---------------------------------------------------------
     app = QtWidgets.QApplication(sys.argv)
-    w = SyncTool(VIDEO_PATH, FIT_PATH)
+    w = SyncTool(VIDEO_PATH, FIT_PATHS)
 
     # First: resize to something that fits 1080p
     screen = QtWidgets.QApplication.primaryScreen().availableGeometry()
@@ -0,0 +1,377 @@
+from array import array
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import heapq
+import os
+import numpy as np
+import fitdecode
+
+# ------------------------------------------------------------
+# COLUMNAR TELEMETRY
+# ------------------------------------------------------------
+# One float64 array per field, NaN where the FIT had no value.
+# Timestamps are epoch seconds (float64); datetime_at() turns one back
+# into the naive local datetime the sync markers are written with.
+
+FIELDS = ("lat", "lon", "speed", "hr", "cadence", "power", "altitude", "distance")
+
+SEMICIRCLE = 180.0 / (1 << 31)
+
+# Bump whenever decoding/normalisation changes so stale .npz caches are ignored
+LOADER_VERSION = 2
+
+class Telemetry:
+    def __init__(self, timestamps, columns=None):
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        n = len(self.timestamps)
+        self.columns = {}
+        for name in FIELDS:
+            col = (columns or {}).get(name)
+            self.columns[name] = (
+                np.full(n, np.nan) if col is None else np.asarray(col, dtype=np.float64)
+            )
+        # Derived columns (e.g. moving_time) are kept alongside the FIT fields
+        for name, col in (columns or {}).items():
+            if name not in self.columns:
+                self.columns[name] = np.asarray(col, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.columns[name] = np.asarray(values, dtype=np.float64)
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + sum(c.nbytes for c in self.columns.values())
+
+    def take(self, index):
+        """New Telemetry with the rows selected by a mask or index array."""
+        return Telemetry(
+            self.timestamps[index],
+            {name: col[index] for name, col in self.columns.items()}
+        )
+
+    def sorted(self):
+        order = np.argsort(self.timestamps, kind="stable")
+        return self.take(order)
+
+    def gps_mask(self):
+        return ~(np.isnan(self.columns["lat"]) | np.isnan(self.columns["lon"]))
+
+    def gps_only(self):
+        return self.take(self.gps_mask())
+
+    def datetime_at(self, i):
+        return datetime.fromtimestamp(float(self.timestamps[i]))
+
+    def row(self, i):
+        """One sample as a dict (None for missing values), for printing/debugging."""
+        out = {"timestamp": self.datetime_at(i)}
+        for name, col in self.columns.items():
+            v = col[i]
+            out[name] = None if np.isnan(v) else float(v)
+        return out
+
+    def nearest_index(self, epoch):
+        """Index of the sample closest in time to epoch (earlier one on a tie)."""
+        ts = self.timestamps
+        i = int(np.searchsorted(ts, epoch))
+        if i <= 0:
+            return 0
+        if i >= len(ts):
+            return len(ts) - 1
+        return i - 1 if (epoch - ts[i - 1]) <= (ts[i] - epoch) else i
+
+def to_epoch(value):
+    """datetime (aware, or naive local) or ISO string → epoch seconds."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+# ------------------------------------------------------------
+# FIT LOADING
+# ------------------------------------------------------------
+
+# Only `record` messages are materialised, and only the fields below. The
+# reader runs without a data processor, so values arrive as plain numbers
+# (timestamps in FIT epoch seconds, positions in semicircles) and are
+# converted for the whole ride at once in records_to_telemetry().
+
+FIT_UTC_REFERENCE = 631065600   # FIT epoch (1989-12-31 00:00 UTC) as Unix seconds
+FIT_DATETIME_MIN = 0x10000000   # smaller date_time values are device-relative, not wall clock
+MESG_NUM_RECORD = 20
+
+RECORD_COLUMNS = (
+    "timestamp", "position_lat", "position_long", "speed", "enhanced_speed",
+    "heart_rate", "cadence", "power", "altitude", "enhanced_altitude", "distance",
+)
+RECORD_SLOTS = {name: i for i, name in enumerate(RECORD_COLUMNS)}
+
+# check_crc values: "disabled" skips CRC computation entirely (fastest),
+# "readonly" computes but never compares, "warn" is fitdecode's default.
+FIT_CHECK_CRC = "warn"
+CRC_MODES = {
+    "disabled": fitdecode.CrcCheck.DISABLED,
+    "readonly": fitdecode.CrcCheck.READONLY,
+    "warn": fitdecode.CrcCheck.WARN,
+    "raise": fitdecode.CrcCheck.RAISE,
+}
+
+def iter_fit_records(path: Path, check_crc=None, error_handling="warn"):
+    """Yield one tuple per `record` message, values in RECORD_COLUMNS order (None if absent)."""
+    nan = float("nan")
+    reader = fitdecode.FitReader(
+        path,
+        processor=None,
+        check_crc=CRC_MODES[check_crc or FIT_CHECK_CRC],
+        error_handling=fitdecode.ErrorHandling[error_handling.upper()],
+    )
+    with reader as fit:
+        for frame in fit:
+            if frame.frame_type != fitdecode.FIT_FRAME_DATA or frame.global_mesg_num != MESG_NUM_RECORD:
+                continue
+            row = [nan] * len(RECORD_COLUMNS)
+            for field in frame.fields:
+                slot = RECORD_SLOTS.get(field.name)
+                if slot is not None and field.value is not None:
+                    row[slot] = field.value
+            yield row
+
+def prefer(primary, fallback):
+    """primary where it has a non-zero value, else fallback (matches `a or b`)."""
+    return np.where(np.isnan(primary) | (primary == 0), fallback, primary)
+
+def records_to_telemetry(raw) -> Telemetry:
+    """Bulk unit/epoch conversion of RECORD_COLUMNS arrays into sorted Telemetry."""
+    ts = raw["timestamp"]
+    keep = ts >= FIT_DATETIME_MIN          # also drops NaN (record without timestamp)
+    raw = {name: col[keep] for name, col in raw.items()}
+
+    return Telemetry(
+        raw["timestamp"] + FIT_UTC_REFERENCE,
+        {
+            "lat": raw["position_lat"] * SEMICIRCLE,
+            "lon": raw["position_long"] * SEMICIRCLE,
+            "speed": prefer(raw["enhanced_speed"], raw["speed"]),
+            "hr": raw["heart_rate"],
+            "cadence": raw["cadence"],
+            "power": raw["power"],
+            "altitude": prefer(raw["enhanced_altitude"], raw["altitude"]),
+            "distance": raw["distance"],
+            **({"segment": raw["segment"]} if "segment" in raw else {}),
+        }
+    ).sorted()
+
+def decode_fit(path: Path, check_crc=None, error_handling="warn") -> Telemetry:
+    """Single filtered fitdecode pass; load_fit() is the cached entry point."""
+    cols = [array("d") for _ in RECORD_COLUMNS]
+    for row in iter_fit_records(path, check_crc, error_handling):
+        for col, v in zip(cols, row):
+            col.append(v)
+    raw = {name: np.frombuffer(col, dtype=np.float64) for name, col in zip(RECORD_COLUMNS, cols)}
+    return records_to_telemetry(raw)
+
+# ------------------------------------------------------------
+# MULTIPLE ACTIVITIES
+# ------------------------------------------------------------
+# A ride saved as several activities (head-unit restart, coffee stop) is
+# loaded as one timeline: the record streams of every FIT overlapping the
+# video are k-way merged by timestamp straight into the column buffers, so
+# no per-file lists or arrays are built first. A "segment" column keeps the
+# activity each sample came from, and an all-NaN gap row between activities
+# stops the frame timeline interpolating across the break.
+
+FIT_OVERLAP_MARGIN_SEC = 1800   # camera vs head-unit clock slack when matching FITs to a video
+FIT_GAP_MIN_SEC = 5             # shorter hand-overs between activities are not a break
+
+def fit_time_range(path: Path):
+    """(first, last) record epoch of a FIT, None if it has none. Goes through load_fit() so later runs hit the cache."""
+    tele = load_fit(path)
+    if not len(tele):
+        return None
+    return float(tele.timestamps[0]), float(tele.timestamps[-1])
+
+def discover_fit_files(folder: Path, video_range=None, margin=FIT_OVERLAP_MARGIN_SEC):
+    """
+    FITs in folder whose records overlap video_range ((start, end) epoch
+    seconds, widened by margin), oldest first. Without a range, or if none
+    overlap (camera clock not set?), every FIT with records is returned.
+    """
+    paths = sorted({p for pattern in ("*.fit", "*.FIT") for p in Path(folder).glob(pattern)})
+    ranges = {p: fit_time_range(p) for p in paths}
+    found = sorted((r, p) for p, r in ranges.items() if r is not None)
+
+    if video_range is not None:
+        start, end = video_range
+        overlapping = [(r, p) for r, p in found if r[0] <= end + margin and r[1] >= start - margin]
+        if overlapping:
+            return [p for _, p in overlapping]
+        print("WARNING: no FIT overlaps the video's recording time; using every FIT in the folder")
+    return [p for _, p in found]
+
+def stamped_records(path: Path, segment, check_crc=None, error_handling="warn"):
+    """iter_fit_records() as (fit_timestamp, segment, seq, row), skipping rows that can't be ordered."""
+    for seq, row in enumerate(iter_fit_records(path, check_crc, error_handling)):
+        if row[0] >= FIT_DATETIME_MIN:
+            yield row[0], segment, seq, row
+
+def decode_fits(paths, check_crc=None, error_handling="warn") -> Telemetry:
+    """Several FITs as one Telemetry: a streaming heapq.merge of their records by timestamp."""
+    streams = [stamped_records(p, i, check_crc, error_handling) for i, p in enumerate(paths)]
+    cols = [array("d") for _ in RECORD_COLUMNS]
+    segments = array("d")
+    # (timestamp, segment, seq) is unique per row even when a FIT repeats a
+    # timestamp, so rows themselves are never compared and file order is kept
+    for _, segment, _, row in heapq.merge(*streams):
+        for col, v in zip(cols, row):
+            col.append(v)
+        segments.append(segment)
+    raw = {name: np.frombuffer(col, dtype=np.float64) for name, col in zip(RECORD_COLUMNS, cols)}
+    raw["segment"] = np.frombuffer(segments, dtype=np.float64)
+    return join_activities(records_to_telemetry(raw))
+
+def join_activities(tele: Telemetry) -> Telemetry:
+    """
+    One source per moment: where activities overlap in time (a second
+    device), the one that started first is kept and the other's rows in
+    that span are dropped. Distance then carries on from one activity to
+    the next, and an all-NaN row is inserted midway through each break.
+    """
+    seg = tele["segment"]
+    ts = tele.timestamps
+
+    # Segments in order of their first sample
+    values, first = np.unique(seg, return_index=True)
+    order = values[np.argsort(first)]
+
+    keep = np.ones(len(ts), dtype=bool)
+    covered = []        # (first, last) epoch of the rows already kept per activity
+    for s in order:
+        rows = seg == s
+        for start, end in covered:
+            rows &= ~((ts >= start) & (ts <= end))
+        keep &= rows | (seg != s)
+        if rows.any():
+            covered.append((ts[rows][0], ts[rows][-1]))
+    if not keep.all():
+        tele = tele.take(keep)
+        seg = tele["segment"]
+        ts = tele.timestamps
+
+    dist = tele["distance"]
+    offset = 0.0
+    for s in order:
+        rows = seg == s
+        d = dist[rows]
+        valid = d[~np.isnan(d)]
+        if not len(valid):
+            continue
+        dist[rows] = d - valid[0] + offset
+        offset = np.nanmax(dist[rows])
+
+    breaks = np.flatnonzero((seg[1:] != seg[:-1]) & (np.diff(ts) > FIT_GAP_MIN_SEC)) + 1
+    if not len(breaks):
+        return tele
+    gap_ts = (ts[breaks - 1] + ts[breaks]) / 2
+    return Telemetry(
+        np.insert(ts, breaks, gap_ts),
+        {name: np.insert(col, breaks, np.nan) for name, col in tele.columns.items()}
+    )
+
+# ------------------------------------------------------------
+# MOVING TIME + NORMALIZATION
+# ------------------------------------------------------------
+
+def postprocess(tele: Telemetry):
+    """Zero-based distance and cumulative moving time (speed > 0.5 m/s)."""
+    if not len(tele):
+        return tele
+
+    dist = tele["distance"]
+    first_dist = 0.0 if np.isnan(dist[0]) else dist[0]
+    tele["distance"] = np.maximum(0.0, dist - first_dist)   # NaN stays NaN
+
+    dt = np.diff(tele.timestamps)
+    moving = tele["speed"][1:] > 0.5                          # NaN compares False
+    if "segment" in tele.columns:
+        moving &= ~np.isnan(tele["segment"][:-1])             # not across a gap row between activities
+    tele["moving_time"] = np.concatenate(([0.0], np.cumsum(np.where(moving, dt, 0.0))))
+    return tele
+
+# ------------------------------------------------------------
+# PARSE CACHE (.npz sidecar)
+# ------------------------------------------------------------
+# The decoded columns are saved next to the FIT as <name>.fit.telemetry.npz,
+# keyed by the FIT's SHA-256 and LOADER_VERSION. The sync GUI and every
+# encoder run (previews included) then load in milliseconds; editing or
+# replacing the FIT changes the hash and forces a re-parse.
+
+def fit_cache_path(path: Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".telemetry.npz")
+
+def file_sha256(path: Path, block_size=1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def save_fit_cache(tele: Telemetry, cache_path: Path, fit_hash: str):
+    tmp = cache_path.with_name(cache_path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            fit_sha256=np.array(fit_hash),
+            loader_version=np.array(LOADER_VERSION),
+            timestamps=tele.timestamps,
+            **{f"col_{name}": col for name, col in tele.columns.items()}
+        )
+    os.replace(tmp, cache_path)
+
+def read_fit_cache(cache_path: Path, fit_hash: str):
+    """Cached Telemetry, or None if missing, unreadable or for another FIT/loader."""
+    try:
+        with np.load(cache_path, allow_pickle=False) as data:
+            if str(data["fit_sha256"]) != fit_hash or int(data["loader_version"]) != LOADER_VERSION:
+                return None
+            columns = {
+                key[len("col_"):]: data[key] for key in data.files if key.startswith("col_")
+            }
+            return Telemetry(data["timestamps"], columns)
+    except (OSError, KeyError, ValueError):
+        return None
+
+def load_fit(path: Path, use_cache=True, check_crc=None) -> Telemetry:
+    if not use_cache:
+        return decode_fit(path, check_crc)
+    return load_cached(fit_cache_path(path), file_sha256(path), lambda: decode_fit(path, check_crc))
+
+def load_fits(paths, use_cache=True, check_crc=None) -> Telemetry:
+    """load_fit() for one or more FITs; a merge is cached next to the first as <name>.merged.telemetry.npz."""
+    paths = sorted(Path(p) for p in paths)
+    if len(paths) == 1:
+        return load_fit(paths[0], use_cache, check_crc)
+    if not use_cache:
+        return decode_fits(paths, check_crc)
+
+    cache_path = paths[0].with_name(paths[0].name + ".merged.telemetry.npz")
+    fit_hash = hashlib.sha256(" ".join(file_sha256(p) for p in paths).encode("ascii")).hexdigest()
+    return load_cached(cache_path, fit_hash, lambda: decode_fits(paths, check_crc))
+
+def load_cached(cache_path: Path, fit_hash: str, decode) -> Telemetry:
+    tele = read_fit_cache(cache_path, fit_hash)
+    if tele is not None:
+        return tele
+
+    tele = decode()
+    try:
+        save_fit_cache(tele, cache_path, fit_hash)
+    except OSError as e:
+        print(f"WARNING: could not write FIT cache {cache_path.name}: {e}")
+    return tele
@@ -0,0 +1,182 @@
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import os
+import numpy as np
+
+from telemetry import Telemetry, to_epoch
+
+# ------------------------------------------------------------
+# VIDEO → FIT TIME (compiled sync map)
+# ------------------------------------------------------------
+# GoPro groups are contiguous in the video, so their sorted start times are
+# the breakpoints of a piecewise-linear map: inside group i,
+#     fit_epoch = video_sec + offsets[i]
+# with offsets[i] = anchor FIT epoch - anchor video second. Compiled once
+# from the sync markers and saved as sync_map.json next to
+# sync_markers.json / group_mapping.json; lookups are a searchsorted plus
+# an add, with no timestamp strings parsed per frame.
+
+SYNC_MAP_FILE = "sync_map.json"
+SYNC_MAP_VERSION = 1
+
+class SyncMap:
+    def __init__(self, starts, ends, offsets, source_key=""):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.float64)   # NaN: group has no anchor
+        self.source_key = source_key
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_groups(cls, groups):
+        """
+        groups: dicts with video_start_sec / video_end_sec and, once synced,
+        anchor_video_sec / anchor_fit_timestamp (as in group_mapping.json).
+        """
+        groups = sorted(groups, key=lambda g: g["video_start_sec"])
+        offsets = [
+            to_epoch(g["anchor_fit_timestamp"]) - g["anchor_video_sec"]
+            if g.get("anchor_fit_timestamp") is not None else np.nan
+            for g in groups
+        ]
+        return cls(
+            [g["video_start_sec"] for g in groups],
+            [g["video_end_sec"] for g in groups],
+            offsets,
+            sync_source_key(groups),
+        )
+
+    def group_of(self, video_sec):
+        """Group index for video_sec (scalar or array); past the end → last group."""
+        idx = np.searchsorted(self.starts, video_sec, side="right") - 1
+        idx = np.clip(idx, 0, len(self.starts) - 1)
+        return int(idx) if np.ndim(idx) == 0 else idx
+
+    def lookup(self, video_sec):
+        """FIT epoch seconds for video_sec (scalar or array); NaN in unanchored groups."""
+        fit_ts = video_sec + self.offsets[self.group_of(video_sec)]
+        return float(fit_ts) if np.ndim(fit_ts) == 0 else fit_ts
+
+    def unanchored(self):
+        return [int(i) for i in np.flatnonzero(np.isnan(self.offsets))]
+
+    def filled(self):
+        """Copy where unanchored groups borrow the nearest earlier (else later) anchor."""
+        offsets = forward_fill(self.offsets)
+        offsets = forward_fill(offsets[::-1])[::-1]
+        return SyncMap(self.starts, self.ends, offsets, self.source_key)
+
+    def save(self, path, video_file):
+        payload = {
+            "version": SYNC_MAP_VERSION,
+            "video_file": video_file,
+            "source_key": self.source_key,
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+            "offsets": [None if np.isnan(o) else float(o) for o in self.offsets],
+        }
+        tmp = Path(str(path) + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, video_file, source_key):
+        """Saved map if it was compiled for this video from the same groups/markers, else None."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (data.get("version") != SYNC_MAP_VERSION or data.get("video_file") != video_file
+                or data.get("source_key") != source_key):
+            return None
+        offsets = [np.nan if o is None else o for o in data["offsets"]]
+        return cls(data["starts"], data["ends"], offsets, source_key)
+
+def sync_source_key(groups):
+    """Hash of the boundaries and anchors a map is compiled from, to detect stale files."""
+    source = [
+        [g["video_start_sec"], g["video_end_sec"], g.get("anchor_video_sec"), g.get("anchor_fit_timestamp")]
+        for g in groups
+    ]
+    return hashlib.sha1(json.dumps(source).encode("utf-8")).hexdigest()
+
+def load_or_compile_sync_map(path, video_file, groups):
+    source_key = sync_source_key(sorted(groups, key=lambda g: g["video_start_sec"]))
+    sync_map = SyncMap.load(path, video_file, source_key)
+    if sync_map is None:
+        sync_map = SyncMap.from_groups(groups)
+        sync_map.save(path, video_file)
+    return sync_map
+
+def chapter_start(filename):
+    """Recording start (epoch) of a chapter named like 2026-06-16-06-02-29-GX011102.MP4, or None."""
+    try:
+        return datetime.strptime(filename[:19], "%Y-%m-%d-%H-%M-%S").timestamp()
+    except ValueError:
+        return None
+
+def video_time_range(meta):
+    """(start, end) epoch of the footage in a .meta.json, or None if a chapter name has no time."""
+    spans = []
+    for ch in meta["chapters"]:
+        start = chapter_start(ch["file"])
+        if start is None:
+            return None
+        spans.append((start, start + ch["duration_sec"]))
+    if not spans:
+        return None
+    return min(s for s, _ in spans), max(e for _, e in spans)
+
+# ------------------------------------------------------------
+# PER-FRAME TABLE
+# ------------------------------------------------------------
+
+class FrameTimeline:
+    """
+    Columnar per-frame telemetry: video_sec, fit_ts and one array per
+    telemetry field, all indexed by output frame. Built once per render and
+    read by both the HUD (generate_ass) and the map stream (stream_maps).
+    """
+
+    def __init__(self, video_sec, fit_ts, columns, fps):
+        self.video_sec = video_sec
+        self.fit_ts = fit_ts
+        self.columns = columns
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.video_sec)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+def build_frame_timeline(tele: Telemetry, sync_map: SyncMap, duration, fps) -> FrameTimeline:
+    """All frame timestamps at once, mapped through the sync map, then np.interp per field."""
+    video_sec = np.arange(int(duration * fps)) / fps
+    fit_ts = sync_map.lookup(video_sec)
+
+    # np.interp clamps to the first/last sample outside the ride, like interpolate_fit();
+    # a NaN on either side of a frame yields NaN
+    columns = {
+        name: np.interp(fit_ts, tele.timestamps, col)
+        for name, col in tele.columns.items()
+    }
+    return FrameTimeline(video_sec, fit_ts, columns, fps)
+
+def forward_fill(values):
+    """Replace NaN with the last non-NaN value before it (leading NaN stay NaN)."""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    idx = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    filled = values[idx]
+    if len(values) and not valid[0]:
+        first = np.argmax(valid) if valid.any() else len(values)
+        filled[:first] = np.nan
+    return filled
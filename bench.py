@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import os
+import re
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+# import the real pipeline functions
+import requests
+
+import combined
+from fake_youtube import FakeCatalogue, FakeYouTubeServer, FakeYtDlp, make_synthetic_mp3
+from combined import (
+    FFMPEG_PATH,
+    ResumableUploader,
+    assemble_music_stream,
+    build_mix_args,
+    get_total_audio_duration,
+    list_music_tracks,
+    probe_audio_format,
+)
+
+
+def bench_music_assembly(mp3_folder):
+    """
+    Compare the old concat path (merge to one MP3, then decode it in the mix)
+    against the streaming crossfade assembler. Both end in decoded PCM so the
+    numbers are comparable.
+    """
+    tracks = list_music_tracks(mp3_folder)
+    audio_sec = get_total_audio_duration(tracks)
+
+    # --- concat path: merge MP3s (stream copy) + decode the result ---
+    with tempfile.TemporaryDirectory() as tmp:
+        filelist = os.path.join(tmp, "filelist.txt")
+        merged = os.path.join(tmp, "combined_playlist.mp3")
+        with open(filelist, "w", encoding="utf-8") as f:
+            for t in tracks:
+                safe = t.replace("\\", "/").replace("'", "'\\''")
+                f.write(f"file '{safe}'\n")
+
+        start = time.perf_counter()
+        subprocess.run(
+            [FFMPEG_PATH, "-v", "error", "-f", "concat", "-safe", "0", "-i", filelist, "-c", "copy", merged],
+            check=True
+        )
+        subprocess.run(
+            [FFMPEG_PATH, "-v", "error", "-i", merged, "-f", "f32le", "-ac", "2", "-ar", "44100", "-y", os.devnull],
+            check=True
+        )
+        concat_sec = time.perf_counter() - start
+
+    # --- streaming path ---
+    tracemalloc.start()
+    start = time.perf_counter()
+    frames = 0
+    for block in assemble_music_stream(tracks):
+        frames += len(block)
+    stream_sec = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    out_sec = frames / combined.MUSIC_SAMPLE_RATE
+    print("\n=== MUSIC ASSEMBLY ===")
+    print(f"Tracks: {len(tracks)}  Audio: {audio_sec/60:.1f} min")
+    print(f"concat + decode : {concat_sec:7.2f}s  ({audio_sec / concat_sec:6.1f}x realtime)")
+    print(f"stream assembler: {stream_sec:7.2f}s  ({out_sec / stream_sec:6.1f}x realtime)  "
+          f"peak Python memory {peak/1024/1024:.1f} MB  output {out_sec/60:.1f} min")
+
+
+def bench_music_phase(targets_min, latency_sec=0.0, error_rate=0.0, duration_scale=1.0):
+    """
+    Time playlist ranking, track selection and merge end to end against the
+    offline YouTube stand-in (no network, deterministic catalogue).
+    """
+    catalogue = FakeCatalogue()
+    with FakeYouTubeServer(catalogue, latency_sec=latency_sec, error_rate=error_rate) as srv, \
+            tempfile.TemporaryDirectory() as tmp:
+        combined.YOUTUBE_API_BASE = srv.base_url
+        combined.set_ytdlp_backend(FakeYtDlp(catalogue, FFMPEG_PATH, duration_scale))
+        cache = {}
+
+        start = time.perf_counter()
+        playlists = combined.search_youtube_playlists(combined.SEARCH_TERM)
+        search_sec = time.perf_counter() - start
+
+        rows = []
+        for target in targets_min:
+            target_sec = target * 60
+
+            start = time.perf_counter()
+            ranked = combined.rank_playlists(playlists, target_sec, cache)
+            rank_sec = time.perf_counter() - start
+            if not ranked:
+                print(f"⚠️ No playlist covers {target} min in the fake catalogue.")
+                continue
+            selected = ranked[0]
+
+            folder = os.path.join(tmp, f"{selected['id']}-{target}")
+            start = time.perf_counter()
+            combined.get_limited_playlist_entries(
+                combined.API_KEY, selected["url"], target_sec, folder, cache, buffer_sec=300
+            )
+            select_sec = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in assemble_music_stream(list_music_tracks(folder), duration_sec=target_sec):
+                pass
+            merge_sec = time.perf_counter() - start
+
+            rows.append((target, rank_sec, select_sec, merge_sec))
+
+        combined.set_ytdlp_backend(None)
+
+    print("\n=== MUSIC PHASE (offline) ===")
+    print(f"search: {search_sec:.3f}s   API calls: {srv.calls}")
+    combined.get_api_client().print_report()
+    print(f"{'target':>8} {'rank':>8} {'select':>8} {'merge':>8} {'total':>8}")
+    for target, rank_sec, select_sec, merge_sec in rows:
+        total = rank_sec + select_sec + merge_sec
+        print(f"{target:>6}m {rank_sec:8.3f} {select_sec:8.2f} {merge_sec:8.2f} {total:8.2f}")
+
+
+def legacy_mix_args(duration, has_audio):
+    """The fixed atrim + amix graph used before build_mix_args()."""
+    if has_audio:
+        filter_complex = (
+            f"[0:a]atrim=duration={duration}[a0];"
+            f"[1:a]atrim=duration={duration}[a1];"
+            f"[a0][a1]amix=inputs=2:duration=shortest:dropout_transition=2[aout]"
+        )
+    else:
+        filter_complex = (
+            f"anullsrc=channel_layout=stereo:sample_rate=44100[a0];"
+            f"[1:a]atrim=duration={duration}[a1];"
+            f"[a0][a1]amix=inputs=2:duration=shortest:dropout_transition=2[aout]"
+        )
+    return [
+        "-filter_complex", filter_complex,
+        "-map", "0:v",
+        "-map", "[aout]",
+        "-metadata:s:v", "rotate=180",
+        "-c:v", "copy",
+        "-c:a", "aac",
+    ]
+
+
+def ffmpeg_cpu(args):
+    """Run ffmpeg with -benchmark and return (user+sys CPU seconds, wall seconds)."""
+    proc = subprocess.run(
+        [FFMPEG_PATH, "-hide_banner", "-benchmark", "-y", *args],
+        capture_output=True, text=True, check=True
+    )
+    m = re.search(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s", proc.stderr)
+    if not m:
+        raise RuntimeError("ffmpeg -benchmark output not found")
+    return float(m.group(1)) + float(m.group(2)), float(m.group(3))
+
+
+def make_synthetic_clip(path, duration_sec, with_audio):
+    """Small H.264 clip (video is stream-copied by the mix, so its content doesn't matter)."""
+    args = [
+        FFMPEG_PATH, "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=30:duration={duration_sec}",
+    ]
+    if with_audio:
+        args += ["-f", "lavfi", "-i", f"sine=frequency=330:sample_rate=48000:duration={duration_sec}"]
+    args += ["-c:v", "libx264", "-preset", "ultrafast"]
+    if with_audio:
+        args += ["-c:a", "aac", "-ac", "2"]
+    subprocess.run(args + [path], check=True)
+    return path
+
+
+def bench_mix_graph(duration_sec=600):
+    """CPU cost of the old fixed graph vs the probe-driven graph, with and without clip audio."""
+    with tempfile.TemporaryDirectory() as tmp:
+        music = make_synthetic_mp3(os.path.join(tmp, "music.mp3"), duration_sec + 60, FFMPEG_PATH)
+        music_rate = probe_audio_format(music)["sample_rate"]
+
+        rows = []
+        for with_audio in (False, True):
+            clip = make_synthetic_clip(os.path.join(tmp, f"clip-{with_audio}.mp4"), duration_sec, with_audio)
+            inputs = ["-i", clip, "-i", music]
+            out = os.path.join(tmp, "out.mp4")
+
+            old = ffmpeg_cpu(inputs + legacy_mix_args(duration_sec, with_audio) + [out])
+            new = ffmpeg_cpu(inputs + build_mix_args(duration_sec, [probe_audio_format(clip)], music_rate, flip=False) + [out])
+            rows.append(("clip audio" if with_audio else "no clip audio", old, new))
+
+    print("\n=== MIX FILTER GRAPH ===")
+    print(f"{duration_sec/60:.0f} min of video, CPU seconds (user+sys) / wall seconds")
+    print(f"{'case':<14} {'legacy':>16} {'optimized':>16} {'cpu saved':>10}")
+    for name, (old_cpu, old_wall), (new_cpu, new_wall) in rows:
+        saved = (1 - new_cpu / old_cpu) * 100 if old_cpu else 0
+        print(f"{name:<14} {old_cpu:7.2f} / {old_wall:6.2f} {new_cpu:7.2f} / {new_wall:6.2f} {saved:9.0f}%")
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+def bench_upload(size_mb=64, interrupt_at=0.5, error_rate=0.0, max_chunk_mb=8):
+    """
+    Upload a random file to the offline resumable-upload stand-in, "crash"
+    part way through, then resume from the sidecar with a fresh uploader
+    (as a restarted process would) and check the server got every byte once.
+    """
+    with tempfile.TemporaryDirectory() as tmp, FakeYouTubeServer(error_rate=error_rate) as srv:
+        combined.YOUTUBE_UPLOAD_BASE = srv.upload_base_url
+        combined.UPLOAD_CHUNK_MAX_MB = max_chunk_mb
+
+        path = os.path.join(tmp, "ride.mp4")
+        expected = hashlib.sha256()
+        with open(path, "wb") as f:
+            for _ in range(size_mb):
+                block = os.urandom(1024 * 1024)
+                expected.update(block)
+                f.write(block)
+        metadata = {"snippet": {"title": "bench upload"}, "status": {"privacyStatus": "private"}}
+
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        first = ResumableUploader(requests.Session(), path, metadata)
+        send_chunk = first.send_chunk
+
+        def crashing_send_chunk():
+            if first.offset >= first.total * interrupt_at:
+                raise SimulatedCrash()
+            return send_chunk()
+
+        first.send_chunk = crashing_send_chunk
+        try:
+            first.upload()
+        except SimulatedCrash:
+            pass
+        crashed_at = first.offset
+        sidecar_written = os.path.exists(combined.upload_sidecar_path(path))
+
+        second = ResumableUploader(requests.Session(), path, metadata)
+        video = second.upload()
+
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        received = sum(u["received"] for u in srv.uploads.values())
+        hash_match = video.get("sha256") == expected.hexdigest()
+        sidecar_removed = not os.path.exists(combined.upload_sidecar_path(path))
+
+    total = size_mb * 1024 * 1024
+    print("\n=== RESUMABLE UPLOAD (offline) ===")
+    print(f"file {size_mb} MB, crash at {crashed_at/1024/1024:.1f} MB, "
+          f"resumed at {second.resumed_from/1024/1024:.1f} MB (sidecar written: {sidecar_written})")
+    print(f"sent {received/1024/1024:.1f} MB for {size_mb} MB ({(received - total)/1024/1024:.1f} MB re-sent), "
+          f"{elapsed:.2f}s, {size_mb/elapsed:.0f} MB/s")
+    print(f"peak Python memory {peak/1024/1024:.1f} MB, final chunk size {second.sizer.size/1024/1024:.1f} MB")
+    print(f"content hash match: {hash_match}  sidecar removed: {sidecar_removed}")
+
+
+def check_music_topup(tracks=5, track_sec=100, video_sec=1000, max_calls=3):
+    """
+    A playlist too short for the video: ensure_audio_matches_video() must
+    stop once the playlist is exhausted instead of topping up forever.
+    Fails (exit 1) if it calls get_limited_playlist_entries() more than
+    max_calls times.
+    """
+    catalogue = FakeCatalogue(playlists=1, min_tracks=tracks, max_tracks=tracks,
+                              min_track_sec=track_sec, max_track_sec=track_sec)
+    playlist_url = f"https://www.youtube.com/playlist?list={next(iter(catalogue.playlists))}"
+
+    calls = 0
+    real_top_up = combined.get_limited_playlist_entries
+
+    def counting_top_up(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls > max_calls:
+            raise SimulatedCrash()
+        return real_top_up(*args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        combined.set_ytdlp_backend(FakeYtDlp(catalogue, FFMPEG_PATH))
+        combined.get_limited_playlist_entries = counting_top_up
+        try:
+            total = combined.ensure_audio_matches_video(
+                None, tmp, combined.API_KEY, playlist_url, {}, buffer_sec=300, target_sec=video_sec
+            )
+            ok = True
+        except SimulatedCrash:
+            total, ok = None, False
+        finally:
+            combined.get_limited_playlist_entries = real_top_up
+            combined.set_ytdlp_backend(None)
+
+    print("\n=== MUSIC TOP-UP (exhausted playlist) ===")
+    print(f"{tracks} x {track_sec}s playlist vs {video_sec}s video: {calls} top-up call(s), "
+          f"audio {'-' if total is None else f'{total:.0f}s'}: {'OK' if ok else 'FAIL (loops)'}")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the GoPro pipeline")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("assembly", help="concat vs streaming music assembly")
+    p.add_argument("mp3_folder")
+
+    p = sub.add_parser("music-phase", help="rank/select/merge against the offline YouTube stand-in")
+    p.add_argument("--targets", type=int, nargs="+", default=[30, 90, 180], help="ride lengths in minutes")
+    p.add_argument("--latency", type=float, default=0.05, help="fake API latency per call (s)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls that fail")
+    p.add_argument("--scale", type=float, default=1.0, help="synthetic track length multiplier")
+
+    p = sub.add_parser("mix-graph", help="legacy vs probe-driven audio mix graph (CPU)")
+    p.add_argument("--duration", type=int, default=600, help="synthetic clip length in seconds")
+
+    p = sub.add_parser("upload", help="chunked resumable upload with a simulated crash (offline)")
+    p.add_argument("--size-mb", type=int, default=64)
+    p.add_argument("--interrupt-at", type=float, default=0.5, help="fraction of the file sent before the crash")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of chunk PUTs answered 503")
+    p.add_argument("--max-chunk-mb", type=int, default=8)
+
+    p = sub.add_parser("music-topup", help="check that topping up from an exhausted playlist terminates")
+    p.add_argument("--tracks", type=int, default=5)
+    p.add_argument("--track-sec", type=int, default=100)
+    p.add_argument("--video-sec", type=int, default=1000)
+
+    args = parser.parse_args()
+    if args.cmd == "assembly":
+        bench_music_assembly(args.mp3_folder)
+    elif args.cmd == "music-phase":
+        bench_music_phase(args.targets, args.latency, args.error_rate, args.scale)
+    elif args.cmd == "mix-graph":
+        bench_mix_graph(args.duration)
+    elif args.cmd == "upload":
+        bench_upload(args.size_mb, args.interrupt_at, args.error_rate, args.max_chunk_mb)
+    elif args.cmd == "music-topup":
+        check_music_topup(args.tracks, args.track_sec, args.video_sec)
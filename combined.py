@@ -9,12 +9,16 @@ import sys
 import time
 import random
 import shutil
+import hashlib
+import bisect
 import requests
 import yt_dlp
 import json
 import httplib2
 import http.client as httplib
 import threading
+import queue
+import atexit
 import wmi
 import pythoncom
 import socket
@@ -22,6 +26,7 @@ import pyperclip
 import time
 import msvcrt
 import ctypes
+import numpy as np
 
 # Win32 constants
 GENERIC_READ  = 0x80000000
@@ -30,8 +35,9 @@ FILE_SHARE_NONE = 0
 OPEN_EXISTING = 3
 
 from argparse import Namespace
+from contextlib import contextmanager
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 #from apiclient.discovery import build
 #from apiclient.errors import HttpError
 #from apiclient.http import MediaFileUpload
@@ -39,17 +45,15 @@ from oauth2client.client import flow_from_clientsecrets
 from oauth2client.file import Storage
 from oauth2client.tools import argparser, run_flow
 from pathlib import Path
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from pydub import AudioSegment
 from mutagen.mp3 import MP3
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
-from googleapiclient.http import MediaIoBaseUpload
 from googleapiclient.errors import HttpError
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import Request, AuthorizedSession
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 
@@ -67,6 +71,12 @@ try:
 except ImportError:
     playsound = None
 
+# Optional: librosa for BPM estimation in the audio feature index
+try:
+    import librosa
+except ImportError:
+    librosa = None
+
 # =========================
 # CONFIGURATION
 # =========================
@@ -89,7 +99,39 @@ DEFAULT_CONFIG = {
     "TOKEN_FILE": "token.json",
     "YOUTUBE_UPLOAD_SCOPE": ["https://www.googleapis.com/auth/youtube.upload"],
     "YOUTUBE_API_SERVICE_NAME": "youtube",
-    "YOUTUBE_API_VERSION": "v3"
+    "YOUTUBE_API_VERSION": "v3",
+    "MUSIC_ASSEMBLER": "stream",
+    "MUSIC_CROSSFADE_SEC": 4.0,
+    "MUSIC_TRIM_SILENCE": True,
+    "MUSIC_SILENCE_THRESHOLD_DB": -50.0,
+    "MUSIC_NORMALIZE": True,
+    "MUSIC_TARGET_LUFS": -16.0,
+    "MUSIC_TRUE_PEAK_DBTP": -1.5,
+    "ANALYZE_BPM": False,
+    "FLAT_PLAYLIST_TTL_SEC": 86400,
+    "YOUTUBE_API_BASE": "https://www.googleapis.com/youtube/v3",
+    "YOUTUBE_DAILY_QUOTA": 10000,
+    "YOUTUBE_API_RATE_PER_SEC": 5.0,
+    "SEARCH_CACHE_TTL_SEC": 21600,
+    "WARM_CACHE_ENABLED": True,
+    "WARM_CACHE_INTERVAL_SEC": 3600,
+    "WARM_CACHE_QUOTA_BUDGET": 2000,
+    "MUSIC_BED_ENABLED": True,
+    "MUSIC_BED_LENGTHS_MIN": [30, 60, 90, 120, 180],
+    "MUSIC_BED_BUDGET_MB": 2048,
+    "MIX_RESAMPLER": "swr",
+    "YOUTUBE_UPLOAD_BASE": "https://www.googleapis.com/upload/youtube/v3",
+    "UPLOAD_CHUNK_MB": 8,
+    "UPLOAD_CHUNK_MIN_MB": 1,
+    "UPLOAD_CHUNK_MAX_MB": 64,
+    "UPLOAD_QUEUE_ENABLED": True,
+    "UPLOAD_CONCURRENCY": 1,
+    "UPLOAD_BANDWIDTH_MB_PER_SEC": 0,
+    "UPLOAD_BUSY_SHARE": 0.5,
+    "PROGRESSIVE_UPLOAD": False,
+    "POST_UPLOAD_CLEANUP": "keep",
+    "POST_UPLOAD_HOOK_TIMEOUT_SEC": 30,
+    "POST_UPLOAD_HOOK_RETRIES": 2
 }
 
 def load_config():
@@ -151,12 +193,47 @@ CACHE_FILE = config["CACHE_FILE"]
 YOUTUBE_UPLOAD_SCOPE = config["YOUTUBE_UPLOAD_SCOPE"]
 YOUTUBE_API_SERVICE_NAME = config["YOUTUBE_API_SERVICE_NAME"]
 YOUTUBE_API_VERSION = config["YOUTUBE_API_VERSION"]
+MUSIC_ASSEMBLER = config["MUSIC_ASSEMBLER"]
+MUSIC_CROSSFADE_SEC = config["MUSIC_CROSSFADE_SEC"]
+MUSIC_TRIM_SILENCE = config["MUSIC_TRIM_SILENCE"]
+MUSIC_SILENCE_THRESHOLD_DB = config["MUSIC_SILENCE_THRESHOLD_DB"]
+MUSIC_NORMALIZE = config["MUSIC_NORMALIZE"]
+MUSIC_TARGET_LUFS = config["MUSIC_TARGET_LUFS"]
+MUSIC_TRUE_PEAK_DBTP = config["MUSIC_TRUE_PEAK_DBTP"]
+ANALYZE_BPM = config["ANALYZE_BPM"]
+AUDIO_FEATURES_FILE = os.path.join(MUSIC_FOLDER, "audio_features.json")
+FLAT_PLAYLIST_TTL_SEC = config["FLAT_PLAYLIST_TTL_SEC"]
+YOUTUBE_API_BASE = config["YOUTUBE_API_BASE"].rstrip("/")
+YOUTUBE_DAILY_QUOTA = config["YOUTUBE_DAILY_QUOTA"]
+YOUTUBE_API_RATE_PER_SEC = config["YOUTUBE_API_RATE_PER_SEC"]
+SEARCH_CACHE_TTL_SEC = config["SEARCH_CACHE_TTL_SEC"]
+WARM_CACHE_ENABLED = config["WARM_CACHE_ENABLED"]
+WARM_CACHE_INTERVAL_SEC = config["WARM_CACHE_INTERVAL_SEC"]
+WARM_CACHE_QUOTA_BUDGET = config["WARM_CACHE_QUOTA_BUDGET"]
+MUSIC_BED_ENABLED = config["MUSIC_BED_ENABLED"]
+MUSIC_BED_LENGTHS_MIN = config["MUSIC_BED_LENGTHS_MIN"]
+MUSIC_BED_BUDGET_MB = config["MUSIC_BED_BUDGET_MB"]
+MIX_RESAMPLER = config["MIX_RESAMPLER"]
+YOUTUBE_UPLOAD_BASE = config["YOUTUBE_UPLOAD_BASE"].rstrip("/")
+UPLOAD_CHUNK_MB = config["UPLOAD_CHUNK_MB"]
+UPLOAD_CHUNK_MIN_MB = config["UPLOAD_CHUNK_MIN_MB"]
+UPLOAD_CHUNK_MAX_MB = config["UPLOAD_CHUNK_MAX_MB"]
+UPLOAD_QUEUE_ENABLED = config["UPLOAD_QUEUE_ENABLED"]
+UPLOAD_CONCURRENCY = config["UPLOAD_CONCURRENCY"]
+UPLOAD_BANDWIDTH_MB_PER_SEC = config["UPLOAD_BANDWIDTH_MB_PER_SEC"]
+UPLOAD_BUSY_SHARE = config["UPLOAD_BUSY_SHARE"]
+PROGRESSIVE_UPLOAD = config["PROGRESSIVE_UPLOAD"]
+POST_UPLOAD_CLEANUP = config["POST_UPLOAD_CLEANUP"]
+POST_UPLOAD_HOOK_TIMEOUT_SEC = config["POST_UPLOAD_HOOK_TIMEOUT_SEC"]
+POST_UPLOAD_HOOK_RETRIES = config["POST_UPLOAD_HOOK_RETRIES"]
 
 # GLOBAL VARS
 files_to_delete = []
 drive_letter_global = None
 last_event_time = time.time()
 is_copying = False
+batch_idle = threading.Event()  # cleared while a batch is being processed
+batch_idle.set()
 
 with open(os.path.join(SCRIPT_FOLDER, "config.json")) as f:
     config = json.load(f)
@@ -213,7 +290,7 @@ def is_valid_mp4(filepath):
         print(f"Error validating {filepath}: {e}")
         return False
 
-def process_gopro_with_music_in_one_pass():
+def process_gopro_with_music_in_one_pass(wait_for_uploads=False):
     script_root = Path(VIDEO_FOLDER)
 
     def _random_hex_suffix(k=4):
@@ -251,9 +328,11 @@ def process_gopro_with_music_in_one_pass():
 
     print(f"📅 Days detected: {sorted_group_keys}")
 
+    progressive_uploads = []
+
     # --- Preload playlists + cache once ---
-    playlists = search_youtube_playlists(API_KEY, SEARCH_TERM)
     cache = load_cache()
+    playlists = get_search_playlists(cache)
     print("DEBUG: Raw playlist search result:")
     print(playlists)
 
@@ -285,82 +364,84 @@ def process_gopro_with_music_in_one_pass():
                 f.write(f"file '{file}'\n")
         print(f"📝 Concat list created: {list_file.name}")
 
-        # --- PLAYLIST SELECTION FOR THIS DAY ---
-        print(f"🔎 Finding playlists matching ~{day_duration_sec/60:.1f} mins for {day_key}...")
-        playlist_info = []
-
-        for pl in playlists:
-            pl_id = pl["id"]["playlistId"]
-            title = pl["snippet"]["title"]
-            duration = get_playlist_duration(API_KEY, pl_id, cache)
-            if duration is None:
-                print(f"⚠️ Skipping playlist {pl_id} — duration unavailable.")
-                continue
-
-            if day_duration_sec <= duration:
-                diff = abs(duration - day_duration_sec)
-                playlist_info.append({
-                    "title": title,
-                    "id": pl_id,
-                    "duration": duration,
-                    "diff": diff,
-                    "url": f"https://www.youtube.com/playlist?list={pl_id}"
-                })
-
-        if not playlist_info:
-            print(f"❌ No suitable playlists found for {day_key}. Skipping this day.")
-            delete_if_exists(list_file)
-            continue
+        # --- Pre-rendered music bed, if one covers the ride ---
+        music_bed = get_music_bed_pool().pick(day_duration_sec) if MUSIC_BED_ENABLED else None
 
-        playlist_info.sort(key=lambda x: x["diff"])
+        if music_bed:
+            selected = {
+                "title": music_bed_title(music_bed),
+                "url": "",
+                "duration": music_bed["duration"]
+            }
+            stream_music = False
+            output_mp3 = music_bed["file"]
+            print(f"🛏️ Using {music_bed['length_sec']/60:.0f} min music bed for {day_key} "
+                  f"({len(music_bed['tracks'])} tracks): {selected['title']}")
+        else:
+            # --- PLAYLIST SELECTION FOR THIS DAY ---
+            print(f"🔎 Finding playlists matching ~{day_duration_sec/60:.1f} mins for {day_key}...")
+            playlist_info = rank_playlists(playlists, day_duration_sec, cache)
 
-        print("🎵 Matching playlists:")
-        for i, p in enumerate(playlist_info, start=1):
-            match_pct = (p['duration'] / day_duration_sec) * 100
-            print(f"{i}. {p['title']} - {p['duration']/60:.1f} min ({match_pct:.0f}%) - {p['url']}")
+            if not playlist_info:
+                print(f"❌ No suitable playlists found for {day_key}. Skipping this day.")
+                delete_if_exists(list_file)
+                continue
 
-        # pick a random valid default choice
-        default_choice = random.randint(1, len(playlist_info))
+            print("🎵 Matching playlists:")
+            for i, p in enumerate(playlist_info, start=1):
+                match_pct = (p['duration'] / day_duration_sec) * 100
+                print(f"{i}. {p['title']} - {p['duration']/60:.1f} min ({match_pct:.0f}%) - {p['url']}")
 
-        start_alerts()
-        choice = input_with_timeout(
-            f"📝 [{day_key}] Enter the number of the playlist you want to download "
-            f"(default={default_choice}): ",
-            timeout=60, default=default_choice, cast_type=int,
-            require_input=False, retries=0
-        )
-        stop_all_alerts()
+            # pick a random valid default choice
+            default_choice = random.randint(1, len(playlist_info))
 
+            start_alerts()
+            choice = input_with_timeout(
+                f"📝 [{day_key}] Enter the number of the playlist you want to download "
+                f"(default={default_choice}): ",
+                timeout=60, default=default_choice, cast_type=int,
+                require_input=False, retries=0
+            )
+            stop_all_alerts()
 
-        if choice is None or choice < 1 or choice > len(playlist_info):
-            print(f"⚠️ Invalid or no choice for {day_key}, using default #{default_choice}.")
-            choice = default_choice
 
-        selected = playlist_info[choice - 1]
-        print(f"✅ Selected playlist for {day_key}: {selected['title']} ({selected['url']})")
+            if choice is None or choice < 1 or choice > len(playlist_info):
+                print(f"⚠️ Invalid or no choice for {day_key}, using default #{default_choice}.")
+                choice = default_choice
 
-        playlist_clean_name = sanitize_filename(selected["title"])
-        DOWNLOAD_FOLDER = os.path.join(MUSIC_FOLDER, playlist_clean_name)
+            selected = playlist_info[choice - 1]
+            print(f"✅ Selected playlist for {day_key}: {selected['title']} ({selected['url']})")
 
-        # --- Download enough audio for THIS day ---
-        print(f"⬇️ Downloading audio for {day_key} into {DOWNLOAD_FOLDER}...")
-        entry_urls = get_limited_playlist_entries(
-            API_KEY, selected['url'], day_duration_sec,
-            DOWNLOAD_FOLDER, cache, buffer_sec=300
-        )
-        unified_download_playlist(entry_urls, DOWNLOAD_FOLDER, max_workers=8)
+            playlist_clean_name = sanitize_filename(selected["title"])
+            DOWNLOAD_FOLDER = os.path.join(MUSIC_FOLDER, playlist_clean_name)
 
-        total_audio = ensure_audio_matches_video(
-            None,
-            DOWNLOAD_FOLDER,
-            API_KEY, selected['url'], cache, buffer_sec=300
-        )
-        print(f"🎧 Total audio duration available: {total_audio/60:.1f} mins")
+            # --- Download enough audio for THIS day ---
+            print(f"⬇️ Downloading audio for {day_key} into {DOWNLOAD_FOLDER}...")
+            entry_urls = get_limited_playlist_entries(
+                API_KEY, selected['url'], day_duration_sec,
+                DOWNLOAD_FOLDER, cache, buffer_sec=300
+            )
+            unified_download_playlist(entry_urls, DOWNLOAD_FOLDER, max_workers=8)
+
+            audio_ledger = get_audio_ledger(DOWNLOAD_FOLDER)
+            total_audio = ensure_audio_matches_video(
+                None,
+                DOWNLOAD_FOLDER,
+                API_KEY, selected['url'], cache, buffer_sec=300,
+                target_sec=day_duration_sec, ledger=audio_ledger
+            )
+            print(f"🎧 Total audio duration available: {total_audio/60:.1f} mins")
 
-        output_mp3 = os.path.join(DOWNLOAD_FOLDER, "combined_playlist.mp3")
-        delete_if_exists(output_mp3)
-        merge_mp3s_and_cleanup(DOWNLOAD_FOLDER, output_mp3)
-        print(f"🎼 Combined audio created: {output_mp3}")
+            stream_music = MUSIC_ASSEMBLER == "stream"
+            if stream_music:
+                music_tracks = list_music_tracks(DOWNLOAD_FOLDER)
+                music_features = build_audio_feature_index(music_tracks)
+                print(f"🎼 Streaming {len(music_tracks)} tracks into the mix (crossfade {MUSIC_CROSSFADE_SEC}s)")
+            else:
+                output_mp3 = os.path.join(DOWNLOAD_FOLDER, "combined_playlist.mp3")
+                delete_if_exists(output_mp3)
+                merge_mp3s_and_cleanup(DOWNLOAD_FOLDER, output_mp3, ledger=audio_ledger)
+                print(f"🎼 Combined audio created: {output_mp3}")
 
         # --- Output filename for THIS day (date + hex suffix) ---
         hex_suffix = _random_hex_suffix(4)
@@ -371,69 +452,142 @@ def process_gopro_with_music_in_one_pass():
 
         print(f"🎬 Merging chunks and adding music for {day_key} → {output_file.name}")
 
-        # --- Build filter_complex for THIS day ---
+        # --- Build the audio mix for THIS day from every clip's probe data ---
         duration = day_duration_sec
-        first_video = str(day_files[0])
-        if has_audio_stream(first_video):
-            filter_complex = (
-                f"[0:a]atrim=duration={duration}[a0];"
-                f"[1:a]atrim=duration={duration}[a1];"
-                f"[a0][a1]amix=inputs=2:duration=shortest:dropout_transition=2[aout]"
-            )
+        clip_formats = probe_clip_audio(day_files)
+        if stream_music:
+            music_rate = MUSIC_SAMPLE_RATE
         else:
-            filter_complex = (
-                f"anullsrc=channel_layout=stereo:sample_rate=44100[a0];"
-                f"[1:a]atrim=duration={duration}[a1];"
-                f"[a0][a1]amix=inputs=2:duration=shortest:dropout_transition=2[aout]"
-            )
+            music_format = probe_audio_format(output_mp3)
+            music_rate = music_format["sample_rate"] if music_format else None
 
-        # FFmpeg #1: concat GoPro chunks → stdout (MPEG-TS stream)
-        merge_proc = subprocess.Popen(
-            [
-                FFMPEG_PATH, "-f", "concat", "-safe", "0",
-                "-i", str(list_file),
-                "-c", "copy",
-                "-f", "mpegts",
-                "pipe:1"
-            ],
-            stdout=subprocess.PIPE
-        )
+        # --- Build chapter text for THIS day's file ---
+        # Use per-file chapters with file name as key
+        chapter_durations = [
+            (f.name, dur) for f, dur in per_file_durations
+        ]
+        chapter_text = build_youtube_chapters(chapter_durations)
 
-        # FFmpeg #2: read MPEG-TS from stdin, mix audio, write final MP4 (Option C)
-        mix_proc = subprocess.run(
-            [
-                FFMPEG_PATH, "-y",
-                "-f", "mpegts",
-                "-i", "pipe:0",
-                "-i", output_mp3,
-                "-filter_complex", filter_complex,
-                "-map", "0:v",
-                "-map", "[aout]",
-                "-metadata:s:v", "rotate=180",
-                "-c:v", "copy",
-                "-c:a", "aac",
+        # --- Progressive upload: fragmented MP4 to a pipe, teed to disk and uploaded as it lands ---
+        growing = None
+        if PROGRESSIVE_UPLOAD:
+            growing = GrowingFile(output_file)
+            output_args = [*build_mix_args(duration, clip_formats, music_rate), *FRAGMENTED_MP4_ARGS, "pipe:1"]
+            progressive_uploads.append(
+                start_progressive_upload(growing, selected["title"], selected["url"], chapter_text)
+            )
+            print(f"📡 Uploading {output_file.name} while it is muxed...")
+        else:
+            output_args = [
+                *build_mix_args(duration, clip_formats, music_rate),
                 str(output_file)
-            ],
-            stdin=merge_proc.stdout,
-            check=True
-        )
+            ]
+
+        tee_thread = None
+        if stream_music:
+            # Single ffmpeg: video straight from the concat list, music as PCM on stdin
+            mix_proc = subprocess.Popen(
+                [
+                    FFMPEG_PATH, "-y",
+                    "-f", "concat", "-safe", "0",
+                    "-i", str(list_file),
+                    *pcm_input_args(),
+                    *output_args
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE if growing else None
+            )
+            if growing:
+                tee_thread = threading.Thread(target=tee_to_file, args=(mix_proc.stdout, growing), daemon=True)
+                tee_thread.start()
+            write_music_stream(music_tracks, mix_proc.stdin, duration_sec=duration, features=music_features)
+            if mix_proc.wait() != 0:
+                print(f"❌ Mix ffmpeg exited with code {mix_proc.returncode} for {day_key}.")
+        elif growing:
+            merge_proc = subprocess.Popen(
+                [
+                    FFMPEG_PATH, "-f", "concat", "-safe", "0",
+                    "-i", str(list_file),
+                    "-c", "copy",
+                    "-f", "mpegts",
+                    "pipe:1"
+                ],
+                stdout=subprocess.PIPE
+            )
+            mix_proc = subprocess.Popen(
+                [
+                    FFMPEG_PATH, "-y",
+                    "-f", "mpegts",
+                    "-i", "pipe:0",
+                    "-i", output_mp3,
+                    *output_args
+                ],
+                stdin=merge_proc.stdout,
+                stdout=subprocess.PIPE
+            )
+            merge_proc.stdout.close()  # mix_proc owns the pipe now
+            tee_thread = threading.Thread(target=tee_to_file, args=(mix_proc.stdout, growing), daemon=True)
+            tee_thread.start()
+            if mix_proc.wait() != 0:
+                print(f"❌ Mix ffmpeg exited with code {mix_proc.returncode} for {day_key}.")
+            merge_proc.wait()
+        else:
+            # FFmpeg #1: concat GoPro chunks → stdout (MPEG-TS stream)
+            merge_proc = subprocess.Popen(
+                [
+                    FFMPEG_PATH, "-f", "concat", "-safe", "0",
+                    "-i", str(list_file),
+                    "-c", "copy",
+                    "-f", "mpegts",
+                    "pipe:1"
+                ],
+                stdout=subprocess.PIPE
+            )
+
+            # FFmpeg #2: read MPEG-TS from stdin, mix audio, write final MP4 (Option C)
+            mix_proc = subprocess.run(
+                [
+                    FFMPEG_PATH, "-y",
+                    "-f", "mpegts",
+                    "-i", "pipe:0",
+                    "-i", output_mp3,
+                    *output_args
+                ],
+                stdin=merge_proc.stdout,
+                check=True
+            )
 
-        merge_proc.wait()
+            merge_proc.wait()
         delete_if_exists(list_file)
 
+        if growing:
+            # Mux has exited: let the uploader send the last fragment and the total
+            tee_thread.join()
+            mux_ok = mix_proc.returncode == 0 and growing.size > 0
+            growing.finish(ok=mux_ok)
+            if not mux_ok:
+                # The uploader sees the abandoned file and stops; wait for it to let go of the
+                # truncated MP4, then drop it (and its upload sidecar) and keep the originals
+                print(f"❌ Progressive mux failed for {day_key}; discarding {output_file.name}.")
+                progressive_uploads.pop().join()
+                delete_if_exists(output_file)
+                sidecar = upload_sidecar_path(output_file)
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+                continue
+
+        if not growing and mix_proc.returncode != 0:
+            # A mux that died partway leaves a truncated MP4: drop it and keep the originals
+            delete_if_exists(output_file)
+            continue
+
         if not (output_file.exists() and output_file.stat().st_size > 0):
             print(f"❌ Merge + music failed or output file missing for {day_key}.")
             continue
 
-        # --- Build chapter text for THIS day's file ---
-        # Use per-file chapters with file name as key
-        chapter_durations = [
-            (f.name, dur) for f, dur in per_file_durations
-        ]
-        chapter_text = build_youtube_chapters(chapter_durations)
-
         # --- Save metadata JSON for THIS day ---
         meta = {
+            "music_bed": music_bed,
             "playlist": {
                 "title": selected["title"],
                 "url": selected["url"],
@@ -471,24 +625,29 @@ def process_gopro_with_music_in_one_pass():
 
         print(f"🎉 Final merged file with music ready for {day_key}: {output_file.name}")
 
-        # --- Upload per day ---
-        start_alerts()
-        choice = input_with_timeout(
-            f"📝 Upload the new music video for {day_key} now? (y/n): ",
-            timeout=30,
-            require_input=False,
-            default="y"
-        )
-        stop_all_alerts()
-
-        if choice and choice.lower() == "y":
-            upload_video(
-                str(output_file),
-                selected["title"],
-                selected["url"],
-                chapter_text,
-                privacy_status="unlisted"
+        # --- Upload per day (queued: overlaps with the next day's processing) ---
+        if growing:
+            print(f"📡 {output_file.name} has been uploading since the mux started.")
+        elif UPLOAD_QUEUE_ENABLED:
+            enqueue_upload(str(output_file), selected["title"], selected["url"], chapter_text)
+        else:
+            start_alerts()
+            choice = input_with_timeout(
+                f"📝 Upload the new music video for {day_key} now? (y/n): ",
+                timeout=30,
+                require_input=False,
+                default="y"
             )
+            stop_all_alerts()
+
+            if choice and choice.lower() == "y":
+                upload_video(
+                    str(output_file),
+                    selected["title"],
+                    selected["url"],
+                    chapter_text,
+                    privacy_status="unlisted"
+                )
 
         # --- Ask whether to delete originals from SD card ---
         confirm_and_delete(require_input=True)
@@ -496,6 +655,16 @@ def process_gopro_with_music_in_one_pass():
 
     # --- Save cache once after all days processed ---
     save_cache(cache)
+    get_api_client().print_report()
+
+    if progressive_uploads:
+        print(f"📡 Waiting for {len(progressive_uploads)} progressive upload(s) to finish...")
+        for t in progressive_uploads:
+            t.join()
+    if wait_for_uploads and UPLOAD_QUEUE_ENABLED:
+        # One-shot runs exit after this; the queue worker is a daemon thread
+        get_upload_worker().wait_idle()
+    get_post_upload_hooks().drain(timeout=300)
     print("✅ All days processed.")
 
 def format_ts(sec):
@@ -566,15 +735,23 @@ def load_chapter_text_for(video_path: str) -> str:
     print(f"⚠️ No meta.json file found for {video_path}")
     return ""
 
+_cache_file_lock = threading.Lock()  # the idle cache warmer shares playlist_cache.json
+
 def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
+    # Any reload of the persistent store invalidates the in-memory playlist index
+    invalidate_playlist_index()
+    with _cache_file_lock:
+        if os.path.exists(CACHE_FILE):
+            with open(CACHE_FILE, "r") as f:
+                return json.load(f)
     return {}
 
 def save_cache(cache):
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
+    with _cache_file_lock:
+        tmp = CACHE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp, CACHE_FILE)
 
 def iso8601_duration_to_seconds(duration):
     pattern = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
@@ -596,6 +773,82 @@ def has_audio_stream(video_path):
     ], capture_output=True, text=True)
     return bool(result.stdout.strip())
 
+def probe_audio_format(path):
+    """First audio stream's sample rate and channel count, or None if the file has no audio."""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=sample_rate,channels',
+        '-of', 'json',
+        str(path)
+    ], capture_output=True, text=True)
+    try:
+        streams = json.loads(result.stdout or "{}").get("streams", [])
+    except ValueError:
+        return None
+    if not streams:
+        return None
+    return {
+        "sample_rate": int(streams[0].get("sample_rate") or 0),
+        "channels": int(streams[0].get("channels") or 0)
+    }
+
+def probe_clip_audio(paths, workers=8):
+    """probe_audio_format() for every clip, in parallel, in input order."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(probe_audio_format, paths))
+
+def build_mix_args(duration, clip_formats, music_rate, flip=None, resampler=None):
+    """
+    Output options for the cheapest correct mix of video input 0 with
+    music input 1, from per-clip probe data:
+    - no original audio: map the music directly and cut it with -t (no graph)
+    - original audio on every clip: one amix, ended by the video's own audio
+    - only some clips with audio: the concat demuxer can't keep those in sync,
+      so it is treated as no original audio
+    The output sample rate and resampler are chosen once: the clips' rate
+    when mixing, otherwise the music's own rate (no resampling at all).
+    """
+    flip = FLIP_FILES if flip is None else flip
+    resampler = resampler or MIX_RESAMPLER
+
+    with_audio = [f for f in clip_formats if f]
+    mix_original = bool(clip_formats) and len(with_audio) == len(clip_formats)
+    if with_audio and not mix_original:
+        print(f"⚠️ Only {len(with_audio)}/{len(clip_formats)} clips have audio; using music only.")
+
+    if mix_original:
+        rates = [f["sample_rate"] for f in with_audio]
+        out_rate = max(set(rates), key=rates.count)
+    else:
+        out_rate = music_rate or MUSIC_SAMPLE_RATE
+
+    resample = ""
+    if music_rate and music_rate != out_rate:
+        resample = f"aresample={out_rate}" + (f":resampler={resampler}" if resampler != "swr" else "")
+
+    args = []
+    if mix_original:
+        music_chain = f"[1:a]{resample}[a1];" if resample else ""
+        music_label = "[a1]" if resample else "[1:a]"
+        args += [
+            "-filter_complex",
+            f"{music_chain}[0:a]{music_label}amix=inputs=2:duration=first:dropout_transition=2[aout]",
+            "-map", "0:v",
+            "-map", "[aout]",
+        ]
+    else:
+        args += ["-map", "0:v", "-map", "1:a"]
+        if resample:
+            args += ["-af", resample]
+        args += ["-t", f"{duration:.3f}"]
+
+    if flip:
+        args += ["-metadata:s:v", "rotate=180"]
+
+    args += ["-c:v", "copy", "-c:a", "aac", "-ar", str(out_rate)]
+    return args
+
 def get_video_duration(video_file):
     def run_ffprobe(args):
         try:
@@ -639,14 +892,326 @@ def get_video_duration(video_file):
     print(f"⏱️ Duration of {video_file}: {duration:.2f} seconds")
     return duration
 
-def search_youtube_playlists(api_key, query, max_results=49):
-    url = "https://www.googleapis.com/youtube/v3/search"
-    params = {"part": "snippet", "q": query, "type": "playlist", "maxResults": max_results, "key": api_key}
-    resp = requests.get(url, params=params)
-    resp.raise_for_status()
-    return resp.json().get("items", [])
+# =========================
+# YOUTUBE DATA API CLIENT
+# =========================
+# Units charged per call (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COSTS = {
+    "search": 100,
+    "playlistItems": 1,
+    "videos": 1,
+    "videos.insert": 1600,
+}
+QUOTA_FILE = os.path.join(SCRIPT_FOLDER, "quota_usage.json")
+
+def quota_day():
+    """YouTube quota resets at midnight Pacific time."""
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo("America/Los_Angeles")).strftime("%Y-%m-%d")
+    except Exception:
+        return (datetime.now(UTC) - timedelta(hours=8)).strftime("%Y-%m-%d")
+
+class TokenBucket:
+    """Simple thread-safe token bucket: `rate` tokens/second, up to `burst` saved up."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+class YouTubeApiClient:
+    """
+    One pooled keep-alive session for every Data API call, with:
+    - per-endpoint quota accounting persisted in quota_usage.json
+      (every SAVE_INTERVAL_SEC and at exit, not on every call)
+    - token-bucket rate limiting
+    - ETag / If-None-Match revalidation of repeated GETs
+    - a per-run report of calls, bytes and quota units
+    """
+
+    ETAG_CACHE_SIZE = 500
+    SAVE_INTERVAL_SEC = 30
+
+    def __init__(self, api_key, base_url=None, rate_per_sec=None, daily_quota=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.daily_quota = daily_quota or YOUTUBE_DAILY_QUOTA
+        self.bucket = TokenBucket(rate_per_sec or YOUTUBE_API_RATE_PER_SEC, burst=10)
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.local = threading.local()   # per-thread usage tag (see tagged())
+        self.etags = {}   # request key → {"etag", "body"}
+        self.run = {}     # endpoint → {"calls", "not_modified", "errors", "bytes", "quota"}
+        self.ledger = self._load_ledger()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.last_save = time.monotonic()
+        atexit.register(self.flush)
+
+    # ---- quota ledger ----
+    def _load_ledger(self):
+        ledger = {"day": quota_day(), "used": 0, "by_endpoint": {}}
+        if os.path.exists(QUOTA_FILE):
+            try:
+                with open(QUOTA_FILE, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("day") == ledger["day"]:
+                    ledger = saved
+            except Exception as e:
+                print(f"⚠️ quota_usage.json unreadable, starting fresh: {e}")
+        return ledger
+
+    def _save_ledger(self, text):
+        tmp = QUOTA_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, QUOTA_FILE)
+
+    def flush(self, wait=True):
+        """Write the ledger if it changed; the disk I/O happens outside the client lock."""
+        if not self.save_lock.acquire(blocking=wait):
+            return   # another thread is already saving
+        try:
+            with self.lock:
+                if not self.dirty:
+                    return
+                text = json.dumps(self.ledger, indent=2)
+                self.dirty = False
+                self.last_save = time.monotonic()
+            self._save_ledger(text)
+        finally:
+            self.save_lock.release()
+
+    def charge(self, endpoint, units=None, nbytes=0, status=200):
+        """Record one call against the run report and the persistent daily ledger."""
+        units = QUOTA_COSTS.get(endpoint, 1) if units is None else units
+        with self.lock:
+            if self.ledger["day"] != quota_day():
+                self.ledger = {"day": quota_day(), "used": 0, "by_endpoint": {}}
+            self.ledger["used"] += units
+            self.ledger["by_endpoint"][endpoint] = self.ledger["by_endpoint"].get(endpoint, 0) + units
+            tag = getattr(self.local, "tag", None)
+            if tag:
+                tags = self.ledger.setdefault("tags", {})
+                tags[tag] = tags.get(tag, 0) + units
+
+            stats = self.run.setdefault(endpoint, {"calls": 0, "not_modified": 0, "errors": 0, "bytes": 0, "quota": 0})
+            stats["calls"] += 1
+            stats["bytes"] += nbytes
+            stats["quota"] += units
+            if status == 304:
+                stats["not_modified"] += 1
+            elif status >= 400:
+                stats["errors"] += 1
+
+            self.dirty = True
+            due = time.monotonic() - self.last_save >= self.SAVE_INTERVAL_SEC
+
+        if due:
+            self.flush(wait=False)
+
+    def quota_used(self):
+        with self.lock:
+            return self.ledger["used"] if self.ledger["day"] == quota_day() else 0
+
+    def quota_remaining(self):
+        return max(0, self.daily_quota - self.quota_used())
+
+    @contextmanager
+    def tagged(self, tag):
+        """Also charge calls made by this thread inside the block to ledger["tags"][tag]."""
+        prev = getattr(self.local, "tag", None)
+        self.local.tag = tag
+        try:
+            yield self
+        finally:
+            self.local.tag = prev
+
+    def tag_used(self, tag):
+        with self.lock:
+            if self.ledger["day"] != quota_day():
+                return 0
+            return self.ledger.get("tags", {}).get(tag, 0)
+
+    # ---- requests ----
+    def get_json(self, endpoint, params, timeout=10, raise_for_status=True):
+        """GET {base}/{endpoint} and return the decoded JSON body."""
+        url = f"{self.base_url or YOUTUBE_API_BASE}/{endpoint}"
+        key = endpoint + "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+        headers = {}
+        cached = self.etags.get(key)
+        if cached:
+            headers["If-None-Match"] = cached["etag"]
+
+        self.bucket.acquire()
+        resp = self.session.get(
+            url,
+            params={**params, "key": self.api_key},
+            headers=headers,
+            timeout=timeout
+        )
+        self.charge(endpoint, nbytes=len(resp.content), status=resp.status_code)
+
+        if resp.status_code == 304 and cached:
+            return cached["body"]
+        if raise_for_status:
+            resp.raise_for_status()
+
+        body = resp.json()
+        etag = resp.headers.get("ETag") or body.get("etag")
+        if etag and resp.ok:
+            with self.lock:
+                if len(self.etags) >= self.ETAG_CACHE_SIZE:
+                    self.etags.pop(next(iter(self.etags)))
+                self.etags[key] = {"etag": etag, "body": body}
+        return body
+
+    # ---- reporting ----
+    def report(self):
+        with self.lock:
+            return {
+                "endpoints": {k: dict(v) for k, v in self.run.items()},
+                "quota_used_today": self.ledger["used"],
+                "quota_remaining": max(0, self.daily_quota - self.ledger["used"]),
+            }
+
+    def print_report(self):
+        rep = self.report()
+        if not rep["endpoints"]:
+            return
+        print("📊 YouTube API usage this run:")
+        for endpoint, st in sorted(rep["endpoints"].items()):
+            print(f"   {endpoint:<14} {st['calls']:>4} calls  {st['not_modified']:>3} not-modified  "
+                  f"{st['errors']:>3} errors  {st['bytes']/1024:8.1f} KB  {st['quota']:>5} units")
+        print(f"   Quota today: {rep['quota_used_today']} used, {rep['quota_remaining']} remaining")
+
+_api_client = None
+_api_client_lock = threading.Lock()
+
+def get_api_client():
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            _api_client = YouTubeApiClient(API_KEY)
+        return _api_client
+
+class PlaylistIndex:
+    """
+    Resolved search-result playlists sorted by total duration, so each day's
+    "between 1.0x and MAX_RATIO x this length" lookup is two bisects instead
+    of a walk over every playlist.
+    """
 
-def get_playlist_duration(api_key, playlist_id, cache):
+    def __init__(self, playlists, cache):
+        entries = []
+        for pl in playlists:
+            pl_id = pl["id"]["playlistId"]
+            duration = get_playlist_duration(pl_id, cache)
+            if duration is None:
+                print(f"⚠️ Skipping playlist {pl_id} — duration unavailable.")
+                continue
+            entries.append({
+                "title": pl["snippet"]["title"],
+                "id": pl_id,
+                "duration": duration,
+                "url": f"https://www.youtube.com/playlist?list={pl_id}"
+            })
+
+        entries.sort(key=lambda e: e["duration"])
+        self.entries = entries
+        self.durations = [e["duration"] for e in entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def between(self, low_sec, high_sec):
+        """Entries with low_sec <= duration <= high_sec, shortest first."""
+        lo = bisect.bisect_left(self.durations, low_sec)
+        hi = bisect.bisect_right(self.durations, high_sec)
+        return self.entries[lo:hi]
+
+    def query(self, target_sec, max_ratio=None):
+        """
+        Playlists at least target_sec long, closest match first. Limited to
+        max_ratio x target_sec unless nothing fits, then every longer one.
+        """
+        max_ratio = MAX_RATIO if max_ratio is None else max_ratio
+        matches = self.between(target_sec, target_sec * max_ratio)
+        if not matches:
+            matches = self.between(target_sec, float("inf"))
+            if matches:
+                print(f"⚠️ No playlist within {max_ratio:.1f}x of {target_sec/60:.1f} mins; using longer ones.")
+
+        # Sorted by duration and all >= target, so already closest first
+        return [{**e, "diff": e["duration"] - target_sec} for e in matches]
+
+_playlist_index = None
+_playlist_index_key = None
+
+def invalidate_playlist_index():
+    global _playlist_index, _playlist_index_key
+    _playlist_index = None
+    _playlist_index_key = None
+
+def get_playlist_index(playlists, cache):
+    """Build the index once per run (per search result set and cache load) and share it."""
+    global _playlist_index, _playlist_index_key
+    key = (id(cache), tuple(pl["id"]["playlistId"] for pl in playlists))
+    if _playlist_index is None or _playlist_index_key != key:
+        _playlist_index = PlaylistIndex(playlists, cache)
+        _playlist_index_key = key
+    return _playlist_index
+
+def rank_playlists(playlists, target_sec, cache):
+    """Playlists between 1.0x and MAX_RATIO x target_sec, closest match first."""
+    return get_playlist_index(playlists, cache).query(target_sec)
+
+def search_youtube_playlists(query, max_results=49):
+    params = {"part": "snippet", "q": query, "type": "playlist", "maxResults": max_results}
+    return get_api_client().get_json("search", params).get("items", [])
+
+def refresh_search_playlists(cache, query=None):
+    """Run the playlist search and store the result under cache["search_results"]."""
+    query = query or SEARCH_TERM
+    items = search_youtube_playlists(query)
+    cache["search_results"] = {"query": query, "fetched_at": time.time(), "items": items}
+    return items
+
+def get_search_playlists(cache, max_age_sec=None):
+    """
+    SEARCH_TERM playlists, served from the cache when fresh (the idle
+    cache warmer keeps them that way) and searched otherwise.
+    """
+    max_age_sec = SEARCH_CACHE_TTL_SEC if max_age_sec is None else max_age_sec
+    cached = cache.get("search_results")
+    if (cached and cached.get("query") == SEARCH_TERM
+            and time.time() - cached.get("fetched_at", 0) < max_age_sec):
+        print(f"🔎 Using cached search results ({(time.time() - cached['fetched_at'])/60:.0f} min old)")
+        return cached["items"]
+    return refresh_search_playlists(cache)
+
+def get_playlist_duration(playlist_id, cache):
     # Cache hit
     if playlist_id in cache:
         val = cache[playlist_id]
@@ -656,13 +1221,8 @@ def get_playlist_duration(api_key, playlist_id, cache):
             print(f"⚠️ Cached value for {playlist_id} was not numeric. Resetting.")
             del cache[playlist_id]
 
-    url = (
-        "https://www.googleapis.com/youtube/v3/playlistItems"
-        "?part=contentDetails"
-        f"&playlistId={playlist_id}"
-        "&maxResults=50"
-        f"&key={api_key}"
-    )
+    client = get_api_client()
+    params = {"part": "contentDetails", "playlistId": playlist_id, "maxResults": 50}
 
     total_seconds = 0
     next_page = None
@@ -676,11 +1236,11 @@ def get_playlist_duration(api_key, playlist_id, cache):
             break
 
         try:
-            resp = requests.get(
-                url + (f"&pageToken={next_page}" if next_page else ""),
-                timeout=10
+            data = client.get_json(
+                "playlistItems",
+                {**params, "pageToken": next_page} if next_page else params,
+                raise_for_status=False
             )
-            data = resp.json()
 
             # API error
             if "error" in data:
@@ -706,7 +1266,7 @@ def get_playlist_duration(api_key, playlist_id, cache):
 
     # Now fetch durations in batch using your existing helper
     if video_ids:
-        durations = fetch_video_durations(video_ids, api_key, cache)
+        durations = fetch_video_durations(video_ids, cache)
         for vid in video_ids:
             dur = durations.get(vid, 0)
             if isinstance(dur, (int, float)):
@@ -728,22 +1288,20 @@ def chunkify(lst, size):
         yield lst[i:i + size]
 
 
-def fetch_video_durations(video_ids, api_key, cache=None):
+def fetch_video_durations(video_ids, cache=None):
     durations = {}
     uncached_ids = [vid for vid in video_ids if not cache or vid not in cache]
 
     if uncached_ids:
-        url = "https://www.googleapis.com/youtube/v3/videos"
+        client = get_api_client()
         for chunk in chunkify(uncached_ids, 50):
             params = {
                 "part": "contentDetails",
-                "id": ",".join(chunk),
-                "key": api_key
+                "id": ",".join(chunk)
             }
-            resp = requests.get(url, params=params)
-            resp.raise_for_status()
+            data = client.get_json("videos", params)
 
-            for item in resp.json().get("items", []):
+            for item in data.get("items", []):
                 vid = item["id"]
                 dur = iso8601_duration_to_seconds(item["contentDetails"]["duration"])
                 durations[vid] = dur
@@ -759,32 +1317,31 @@ def fetch_video_durations(video_ids, api_key, cache=None):
     return durations
 
 
-def get_limited_playlist_entries(api_key, playlist_url, max_duration_sec, download_folder, cache=None, buffer_sec=300):
-    """
-    Download tracks one-by-one and measure REAL durations.
-    Stop only when REAL total >= max_duration_sec + buffer_sec.
-    """
-    import subprocess
+def playlist_id_from_url(playlist_url):
+    m = re.search(r"[?&]list=([\w-]+)", playlist_url or "")
+    return m.group(1) if m else None
 
-    def real_duration(path):
-        """Return actual audio duration in seconds using ffprobe."""
-        cmd = [
-            "ffprobe", "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            path
-        ]
-        try:
-            out = subprocess.check_output(cmd).decode().strip()
-            return float(out)
-        except Exception:
-            return 0.0
+# Optional stand-in for yt-dlp (see fake_youtube.py). When set, it must provide
+# extract_flat(playlist_url) -> info dict and download(url, output_path) -> info dict.
+ytdlp_backend = None
 
-    os.makedirs(download_folder, exist_ok=True)
+def set_ytdlp_backend(backend):
+    global ytdlp_backend
+    ytdlp_backend = backend
 
-    target_duration = max_duration_sec + buffer_sec
-    total_real = 0
-    selected_entries = []
+def get_flat_playlist(playlist_url, cache, ttl_sec=None):
+    """
+    Flat playlist entries (id, url, title, duration) plus a shuffled order and
+    a cursor, cached with a TTL under cache["flat_playlists"].
+    Re-extracted only when missing or stale.
+    """
+    ttl_sec = FLAT_PLAYLIST_TTL_SEC if ttl_sec is None else ttl_sec
+    store = cache.setdefault("flat_playlists", {})
+    key = playlist_id_from_url(playlist_url) or playlist_url
+
+    flat = store.get(key)
+    if flat and time.time() - flat.get("fetched_at", 0) < ttl_sec:
+        return flat
 
     print(f"Fetching flat playlist entries from: {playlist_url}")
     ydl_opts = {
@@ -793,16 +1350,72 @@ def get_limited_playlist_entries(api_key, playlist_url, max_duration_sec, downlo
         'skip_download': True,
         "extractor_args": {"youtube": {"player_client": ["default", "-tv_simply"], "player_js_version": "actual"}},
     }
+    if ytdlp_backend is not None:
+        info = ytdlp_backend.extract_flat(playlist_url)
+    else:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(playlist_url, download=False)
+
+    entries = [
+        {
+            "id": e.get("id"),
+            "url": e.get("url"),
+            "title": e.get("title", "unknown"),
+            "duration": e.get("duration"),
+        }
+        for e in (info or {}).get("entries") or []
+    ]
+    order = list(range(len(entries)))
+    random.shuffle(order)
+
+    flat = {"fetched_at": time.time(), "entries": entries, "order": order, "cursor": 0}
+    store[key] = flat
+
+    # Seed video durations when the flat listing already has them
+    for e in entries:
+        if e["id"] and isinstance(e["duration"], (int, float)) and e["id"] not in cache:
+            cache[e["id"]] = int(e["duration"])
+
+    print(f"Found {len(entries)} flat entries")
+    return flat
+
+def get_limited_playlist_entries(api_key, playlist_url, max_duration_sec, download_folder, cache=None, buffer_sec=300):
+    """
+    Download tracks one-by-one and measure REAL durations.
+    Stop only when REAL total >= max_duration_sec + buffer_sec.
+    Walks the cached shuffled order from its cursor, so top-ups continue
+    where the last call stopped and already-downloaded entries are skipped.
+    """
+    os.makedirs(download_folder, exist_ok=True)
+    ledger = get_audio_ledger(download_folder)
 
-    # Fetch playlist entries
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(playlist_url, download=False)
-        entries = info.get('entries', [])
-        random.shuffle(entries)
-        print(f"Found {len(entries)} flat entries")
+    target_duration = max_duration_sec + buffer_sec
+    total_real = 0
+    selected_entries = []
+
+    flat = get_flat_playlist(playlist_url, cache if cache is not None else {})
+    entries, order = flat["entries"], flat["order"]
+    archive = get_ydl_pool(download_folder).archive
+
+    # Tracks earlier calls already downloaded count toward the target (the ledger makes re-measuring free)
+    for i in order[:flat["cursor"]]:
+        entry = entries[i]
+        full_path = os.path.join(download_folder, sanitize_filename(f"{entry.get('title', 'unknown')}.mp3"))
+        if entry.get("url") and os.path.exists(full_path):
+            real = ledger.probe(full_path)
+            if real >= 5:
+                selected_entries.append(entry["url"])
+                total_real += real
+    print(f"Resuming at entry {flat['cursor']}/{len(order)} with {total_real:.1f}s already in the folder")
+    if total_real >= target_duration:
+        print(f"✅ REAL target met: {total_real:.1f}s ≥ {target_duration:.1f}s")
+        return selected_entries
 
     # Download + measure REAL durations
-    for entry in entries:
+    while flat["cursor"] < len(order):
+        entry = entries[order[flat["cursor"]]]
+        flat["cursor"] += 1
+
         url = entry.get('url')
         title = entry.get('title', 'unknown')
 
@@ -813,11 +1426,18 @@ def get_limited_playlist_entries(api_key, playlist_url, max_duration_sec, downlo
         filename = sanitize_filename(f"{title}.mp3")
         full_path = os.path.join(download_folder, filename)
 
-        # Download immediately
-        unified_download_playlist([url], download_folder, max_workers=1)
+        archive_id = youtube_archive_id(url) or (f"youtube {entry['id']}" if entry.get("id") else None)
+        if os.path.exists(full_path):
+            print(f"⏭️ Already downloaded: {title}")
+        elif archive_id and archive_id in archive:
+            print(f"⏭️ Already downloaded (file no longer in folder): {title}")
+            continue
+        else:
+            # Download immediately
+            unified_download_playlist([url], download_folder, max_workers=1)
 
-        # Measure REAL duration
-        real = real_duration(full_path)
+        # Measure REAL duration (recorded in the folder's ledger)
+        real = ledger.probe(full_path)
 
         if real < 5:
             print(f"⚠️ Skipping broken/short file: {title} ({real:.1f}s)")
@@ -831,6 +1451,8 @@ def get_limited_playlist_entries(api_key, playlist_url, max_duration_sec, downlo
         if total_real >= target_duration:
             print(f"✅ REAL target met: {total_real:.1f}s ≥ {target_duration:.1f}s")
             break
+    else:
+        print(f"⚠️ Playlist exhausted after {len(order)} entries.")
 
     return selected_entries
 
@@ -878,31 +1500,91 @@ def download_playlist_parallel(entry_urls, output_path, max_workers=4):
 
 # NEW
 
-def unified_download_playlist(entry_urls, output_path, max_workers=8):
+# =========================
+# YT-DLP POOL + DOWNLOAD ARCHIVE
+# =========================
+ARCHIVE_FLUSH_EVERY = 10
+YDL_POOL_SIZE = 8
+
+class DownloadArchive:
     """
-    Unified downloader:
-    - Parallel
-    - No duplicates
-    - Normalized filenames
-    - Always produces *.mp3 (never .mp3.mp3)
-    - Uses archive.txt to avoid re-downloading
+    Process-wide in-memory view of one archive.txt.
+    Loaded once, appended under a lock and flushed to disk in batches,
+    so parallel workers never race on the file.
     """
-    os.makedirs(output_path, exist_ok=True)
-    archive_path = os.path.join(output_path, "archive.txt")
 
-    print(f"🚀 Unified parallel download with {max_workers} workers...")
-    results = []
+    def __init__(self, path, flush_every=ARCHIVE_FLUSH_EVERY):
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.pending = []
+        self.ids = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.ids = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, archive_id):
+        return archive_id in self.ids
+
+    def add(self, archive_id):
+        with self.lock:
+            if archive_id in self.ids:
+                return
+            self.ids.add(archive_id)
+            self.pending.append(archive_id)
+            if len(self.pending) >= self.flush_every:
+                self._flush_locked()
 
-    def worker(url):
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{a}\n" for a in self.pending))
+        self.pending.clear()
+
+def youtube_archive_id(url):
+    """archive.txt key ("youtube <id>") for a YouTube video URL, or None."""
+    m = re.search(r"(?:[?&]v=|youtu\.be/|/shorts/)([\w-]{11})", url or "")
+    return f"youtube {m.group(1)}" if m else None
+
+def info_archive_id(info):
+    """archive.txt key for a yt-dlp info dict (same format yt-dlp writes)."""
+    extractor = info.get("extractor_key") or info.get("ie_key") or "youtube"
+    return f"{extractor.lower()} {info['id']}"
+
+class YoutubeDLPool:
+    """
+    A few long-lived YoutubeDL instances for one output folder.
+    Each instance is used by one thread at a time; extractors stay initialised between tracks.
+    """
+
+    def __init__(self, output_path, size=YDL_POOL_SIZE):
+        self.output_path = output_path
+        self.size = size
+        self.archive = DownloadArchive(os.path.join(output_path, "archive.txt"))
+        self.idle = queue.Queue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _options(self):
         # yt-dlp sometimes includes ".mp3" in the title → strip it
         def strip_mp3(name):
             return name[:-4] if name.lower().endswith(".mp3") else name
 
+        def skip_archived(info, *args, incomplete=False):
+            if info.get("id") and info_archive_id(info) in self.archive:
+                return "already in archive"
+            return None
+
         # Template: always output *.mp3, never *.mp3.mp3
-        ydl_opts = {
+        return {
             'format': 'bestaudio/best',
-            'outtmpl': f'{output_path}/%(title)s.%(ext)s',
-            'download_archive': archive_path,
+            'outtmpl': f'{self.output_path}/%(title)s.%(ext)s',
+            'match_filter': skip_archived,
             'overwriteskip': True,
             'quiet': True,
             'no_warnings': True,
@@ -924,9 +1606,76 @@ def unified_download_playlist(entry_urls, output_path, max_workers=8):
             }
         }
 
+    @contextmanager
+    def borrow(self):
+        try:
+            ydl = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            ydl = yt_dlp.YoutubeDL(self._options()) if create else self.idle.get()
+        try:
+            yield ydl
+        finally:
+            self.idle.put(ydl)
+
+    def close(self):
+        self.archive.flush()
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+            except Exception:
+                pass
+
+_ydl_pools = {}
+_ydl_pools_lock = threading.Lock()
+
+def get_ydl_pool(output_path):
+    key = os.path.normcase(os.path.abspath(output_path))
+    with _ydl_pools_lock:
+        if key not in _ydl_pools:
+            _ydl_pools[key] = YoutubeDLPool(output_path)
+        return _ydl_pools[key]
+
+@atexit.register
+def close_ydl_pools():
+    with _ydl_pools_lock:
+        for pool in _ydl_pools.values():
+            pool.close()
+        _ydl_pools.clear()
+
+def unified_download_playlist(entry_urls, output_path, max_workers=8):
+    """
+    Unified downloader:
+    - Parallel, on pooled long-lived YoutubeDL instances
+    - No duplicates
+    - Normalized filenames
+    - Always produces *.mp3 (never .mp3.mp3)
+    - Uses a shared in-memory archive.txt index to avoid re-downloading
+    """
+    os.makedirs(output_path, exist_ok=True)
+    pool = get_ydl_pool(output_path)
+
+    print(f"🚀 Unified parallel download with {max_workers} workers...")
+    results = []
+
+    def worker(url):
+        archive_id = youtube_archive_id(url)
+        if archive_id and archive_id in pool.archive:
+            return f"⏭️ {url} (archived)"
+
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            if ytdlp_backend is not None:
+                info = ytdlp_backend.download(url, output_path)
+            else:
+                with pool.borrow() as ydl:
+                    info = ydl.extract_info(url, download=True)
+            if info and info.get("id"):
+                pool.archive.add(info_archive_id(info))
             return f"⬇️ {url}"
         except Exception as e:
             return f"❌ {url} — {e}"
@@ -937,6 +1686,8 @@ def unified_download_playlist(entry_urls, output_path, max_workers=8):
         for future in as_completed(futures):
             results.append(future.result())
 
+    pool.archive.flush()
+
     print("🎧 Unified download complete:")
     for r in results:
         print(r)
@@ -973,99 +1724,762 @@ def get_total_audio_duration(file_list, workers=8):
     print(f"🎯 Total audio duration: {total/60:.2f} minutes")
     return total
 
-def ensure_audio_matches_video(video_file, mp3_folder, api_key, playlist_url, cache, buffer_sec=300):
+class AudioDurationLedger:
+    """
+    Per-folder record of MP3 durations. Each file is probed once; later
+    refreshes only probe files that are new or changed (size/mtime), so
+    top-ups and the merge cost O(new files).
+    """
+
+    def __init__(self, mp3_folder):
+        self.folder = mp3_folder
+        self.entries = {}   # path -> (size, mtime_ns, duration)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _stat_key(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def record(self, path, duration):
+        """Store a duration measured elsewhere (e.g. right after a download)."""
+        try:
+            size, mtime = self._stat_key(path)
+        except OSError:
+            return
+        with self.lock:
+            self.entries[path] = (size, mtime, duration)
+
+    def probe(self, path):
+        """Duration of one file, probing only if it is new or changed."""
+        try:
+            size, mtime = self._stat_key(path)
+        except OSError:
+            return 0.0
+        with self.lock:
+            known = self.entries.get(path)
+        if known and known[:2] == (size, mtime):
+            return known[2]
+        dur = fast_audio_duration(path)
+        with self.lock:
+            self.entries[path] = (size, mtime, dur)
+        return dur
+
+    def refresh(self, workers=8):
+        """Sync with the folder: drop deleted files, probe new/changed ones in parallel."""
+        paths = [
+            os.path.join(self.folder, f)
+            for f in os.listdir(self.folder)
+            if f.lower().endswith('.mp3') and f != "combined_playlist.mp3"
+        ] if os.path.isdir(self.folder) else []
+
+        with self.lock:
+            for gone in set(self.entries) - set(paths):
+                del self.entries[gone]
+
+        stale = []
+        for p in paths:
+            try:
+                key = self._stat_key(p)
+            except OSError:
+                continue
+            with self.lock:
+                known = self.entries.get(p)
+            if not known or known[:2] != key:
+                stale.append(p)
+
+        if stale:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for p, dur in zip(stale, executor.map(fast_audio_duration, stale)):
+                    if dur > 0:
+                        print(f"✅ {p}: {dur:.2f}s")
+                    self.record(p, dur)
+        return self
+
+    def durations(self):
+        with self.lock:
+            return {p: e[2] for p, e in self.entries.items()}
+
+    def total(self):
+        with self.lock:
+            return sum(e[2] for e in self.entries.values() if e[2] > 0)
+
+_audio_ledgers = {}
+_audio_ledgers_lock = threading.Lock()
+
+def get_audio_ledger(mp3_folder):
+    """One ledger per music folder, shared by download, top-up and merge."""
+    key = os.path.abspath(mp3_folder)
+    with _audio_ledgers_lock:
+        if key not in _audio_ledgers:
+            _audio_ledgers[key] = AudioDurationLedger(mp3_folder)
+        return _audio_ledgers[key]
+
+def ensure_audio_matches_video(video_file, mp3_folder, api_key, playlist_url, cache, buffer_sec=300,
+                               target_sec=None, ledger=None):
+    """
+    Ensure REAL audio duration >= REAL video duration.
+    If short, download more tracks until target is met.
+    target_sec skips probing video_file (the one-pass path has no file yet).
+    """
+    video_duration = target_sec if target_sec is not None else fast_audio_duration(video_file)
+    ledger = ledger or get_audio_ledger(mp3_folder)
+
+    # Get REAL total audio duration (only unseen files are probed)
+    total_audio = ledger.refresh().total()
+    print(f"🎯 Total audio duration: {total_audio/60:.2f} minutes")
+
+    # Keep topping up until REAL duration is enough
+    while total_audio + buffer_sec < video_duration:
+        missing = video_duration - total_audio
+        print(f"⚠️ Audio too short ({total_audio:.1f}s vs video {video_duration:.1f}s). Need +{missing:.1f}s")
+
+        extra_urls = get_limited_playlist_entries(
+            api_key, playlist_url,
+            missing,
+            mp3_folder, cache,
+            buffer_sec=buffer_sec
+        )
+
+        # Already downloaded inside get_limited_playlist_entries()
+        if not extra_urls:
+            print("❌ No more playlist entries to download, continuing with what we have.")
+            break
+
+        # New downloads were recorded in the ledger as they finished. The returned list also
+        # counts tracks already in the folder, so only a growing total means progress.
+        previous = total_audio
+        total_audio = ledger.refresh().total()
+        if total_audio <= previous:
+            print("❌ Top-up added no new audio (playlist exhausted), continuing with what we have.")
+            break
+
+    return total_audio
+
+def merge_mp3s_and_cleanup(mp3_folder, output_mp3, ledger=None):
+    # Collect and shuffle MP3 files
+    mp3_files = [
+        f for f in os.listdir(mp3_folder)
+        if f.lower().endswith('.mp3') and f != os.path.basename(output_mp3)
+    ]
+    random.shuffle(mp3_files)
+
+    # Audit duration from the ledger (probes only files it hasn't seen)
+    ledger = ledger or get_audio_ledger(mp3_folder)
+    actual_duration = ledger.refresh().total()
+    print(f"🧮 Actual total audio duration: {actual_duration/60:.2f} minutes")
+
+    # Write shuffled file list for ffmpeg
+    filelist_path = os.path.join(mp3_folder, 'filelist.txt')
+    with open(filelist_path, 'w', encoding='utf-8') as filelist:
+        for mp3 in mp3_files:
+            path = os.path.join(mp3_folder, mp3).replace('\\', '/')
+            safe_path = path.replace("'", "'\\''")
+            filelist.write(f"file '{safe_path}'\n")
+
+    # Merge with ffmpeg
+    subprocess.run(['ffmpeg','-f','concat','-safe','0','-i',filelist_path,'-c','copy',output_mp3], check=True)
+
+    # Cleanup
+    os.remove(filelist_path)
+
+# =========================
+# STREAMING MUSIC ASSEMBLY
+# =========================
+MUSIC_SAMPLE_RATE = 44100
+MUSIC_CHANNELS = 2
+PCM_BLOCK_FRAMES = 32768  # ~0.75s of audio per block
+SILENCE_HOLD_SEC = 10     # interior silence longer than this is kept, not held back
+
+def list_music_tracks(mp3_folder):
+    """Return the folder's MP3s as full paths in a random order."""
+    tracks = [
+        os.path.join(mp3_folder, f)
+        for f in os.listdir(mp3_folder)
+        if f.lower().endswith('.mp3') and f != "combined_playlist.mp3"
+    ]
+    random.shuffle(tracks)
+    return tracks
+
+def iter_pcm_blocks(path, block_frames=PCM_BLOCK_FRAMES, start_sec=None, end_sec=None, gain=1.0):
+    """
+    Decode one track through an ffmpeg pipe.
+    Yields float32 arrays shaped (frames, channels), at most block_frames long.
+    start_sec/end_sec cut the decode window, gain is a linear factor.
+    """
+    frame_bytes = MUSIC_CHANNELS * 4
+    window = []
+    if start_sec:
+        window += ["-ss", f"{start_sec:.3f}"]
+    if end_sec:
+        window += ["-to", f"{end_sec:.3f}"]
+    proc = subprocess.Popen(
+        [
+            FFMPEG_PATH, "-v", "error",
+            "-i", str(path),
+            *window,
+            "-vn",
+            "-f", "f32le",
+            "-ac", str(MUSIC_CHANNELS),
+            "-ar", str(MUSIC_SAMPLE_RATE),
+            "pipe:1"
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            buf = proc.stdout.read(block_frames * frame_bytes)
+            if not buf:
+                break
+            usable = len(buf) - (len(buf) % frame_bytes)
+            if usable:
+                block = np.frombuffer(buf[:usable], dtype="<f4").reshape(-1, MUSIC_CHANNELS)
+                yield block * np.float32(gain) if gain != 1.0 else block
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+def trim_silence_blocks(blocks, threshold):
+    """
+    Drop leading and trailing silence from a block stream.
+    Silent stretches are held back until we know whether more audio follows,
+    but never more than SILENCE_HOLD_SEC of them.
+    """
+    max_hold = SILENCE_HOLD_SEC * MUSIC_SAMPLE_RATE
+    started = False
+    held = []
+    held_frames = 0
+
+    for block in blocks:
+        loud = np.flatnonzero(np.abs(block).max(axis=1) > threshold)
+
+        if not started:
+            if loud.size == 0:
+                continue
+            block = block[loud[0]:]
+            loud = loud - loud[0]
+            started = True
+
+        if loud.size == 0:
+            held.append(block)
+            held_frames += len(block)
+            if held_frames > max_hold:
+                yield from held
+                held.clear()
+                held_frames = 0
+            continue
+
+        # Audio resumed → the held silence was interior, keep it
+        yield from held
+        held.clear()
+        held_frames = 0
+
+        end = loud[-1] + 1
+        yield block[:end]
+        if end < len(block):
+            held.append(block[end:])
+            held_frames = len(block) - end
+
+    # Whatever is still held is trailing silence → dropped
+
+def equal_power_mix(tail, head):
+    """Equal-power crossfade of two equally long (frames, channels) arrays."""
+    theta = np.linspace(0.0, np.pi / 2, len(tail), dtype=np.float32)[:, None]
+    return tail * np.cos(theta) + head * np.sin(theta)
+
+def _crossfaded_blocks(tracks, crossfade_frames, threshold, features):
+    tail = np.zeros((0, MUSIC_CHANNELS), dtype=np.float32)
+
+    for path in tracks:
+        feat = features.get(path) if features else None
+        if feat:
+            # Precomputed bounds + gain → no runtime silence detection needed
+            blocks = iter_pcm_blocks(
+                path,
+                start_sec=feat["lead_silence_sec"] if threshold is not None else None,
+                end_sec=feat["audio_end_sec"] if threshold is not None else None,
+                gain=track_gain(feat)
+            )
+        else:
+            blocks = iter_pcm_blocks(path)
+            if threshold is not None:
+                blocks = trim_silence_blocks(blocks, threshold)
+
+        try:
+            # Collect just enough of the new track to fade into
+            head_parts = []
+            head_len = 0
+            for block in blocks:
+                head_parts.append(block)
+                head_len += len(block)
+                if head_len >= crossfade_frames:
+                    break
+
+            if not head_parts:
+                print(f"⚠️ No audio decoded from {path}, skipping.")
+                continue
+
+            head = np.concatenate(head_parts)
+            n = min(len(tail), len(head), crossfade_frames)
+            if n:
+                if len(tail) > n:
+                    yield tail[:-n]
+                yield equal_power_mix(tail[-n:], head[:n])
+                head = head[n:]
+            elif len(tail):
+                yield tail
+
+            # Stream the body, always holding back the last crossfade_frames
+            carry = head
+            for block in blocks:
+                carry = np.concatenate((carry, block))
+                cut = len(carry) - crossfade_frames
+                if cut > 0:
+                    yield carry[:cut]
+                    carry = carry[cut:]
+            tail = carry
+        finally:
+            blocks.close()
+
+    if len(tail):
+        yield tail
+
+def assemble_music_stream(tracks, duration_sec=None,
+                          crossfade_sec=MUSIC_CROSSFADE_SEC,
+                          trim_silence=MUSIC_TRIM_SILENCE,
+                          features=None):
+    """
+    Gapless/crossfaded soundtrack as a stream of float32 PCM blocks.
+    Only one block per track plus the crossfade window is ever held in memory.
+    When duration_sec is given the stream is cut (or padded with silence) to exactly that length.
+    features maps track path → audio feature entry (per-track gain + silence bounds).
+    """
+    crossfade_frames = int(crossfade_sec * MUSIC_SAMPLE_RATE)
+    threshold = 10 ** (MUSIC_SILENCE_THRESHOLD_DB / 20) if trim_silence else None
+    limit = None if duration_sec is None else int(duration_sec * MUSIC_SAMPLE_RATE)
+    emitted = 0
+
+    source = _crossfaded_blocks(tracks, crossfade_frames, threshold, features)
+    try:
+        for block in source:
+            if limit is not None and emitted + len(block) >= limit:
+                yield block[:limit - emitted]
+                emitted = limit
+                break
+            yield block
+            emitted += len(block)
+    finally:
+        source.close()
+
+    if limit is not None and emitted < limit:
+        print(f"⚠️ Music ran out {(limit - emitted) / MUSIC_SAMPLE_RATE:.1f}s early, padding with silence.")
+        silence = np.zeros((PCM_BLOCK_FRAMES, MUSIC_CHANNELS), dtype=np.float32)
+        while emitted < limit:
+            n = min(PCM_BLOCK_FRAMES, limit - emitted)
+            yield silence[:n]
+            emitted += n
+
+def write_music_stream(tracks, stream, duration_sec=None, should_abort=None, **kwargs):
+    """
+    Write the assembled soundtrack as raw f32le PCM into stream (e.g. ffmpeg's stdin).
+    should_abort is polled per block; returning True stops early.
+    """
+    written = 0
+    try:
+        for block in assemble_music_stream(tracks, duration_sec, **kwargs):
+            if should_abort and should_abort():
+                break
+            stream.write(np.ascontiguousarray(block, dtype="<f4").tobytes())
+            written += len(block)
+    except BrokenPipeError:
+        print("⚠️ Mix ffmpeg closed its input early.")
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+    return written / MUSIC_SAMPLE_RATE
+
+def pcm_input_args():
+    """ffmpeg input options matching what write_music_stream() produces."""
+    return [
+        "-f", "f32le",
+        "-ar", str(MUSIC_SAMPLE_RATE),
+        "-ac", str(MUSIC_CHANNELS),
+        "-i", "pipe:0"
+    ]
+
+# =========================
+# AUDIO FEATURE INDEX
+# =========================
+AUDIO_FEATURES_VERSION = 1
+
+def file_hash(path, chunk_size=1024*1024):
+    """SHA-1 of the file contents (index key, survives renames)."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(chunk_size)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+def estimate_bpm(path):
+    """Optional tempo estimate, None when librosa is not installed."""
+    if librosa is None:
+        return None
+    try:
+        y, sr = librosa.load(path, sr=22050, mono=True)
+        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
+        return round(float(np.atleast_1d(tempo)[0]), 1)
+    except Exception as e:
+        print(f"⚠️ BPM estimate failed for {path}: {e}")
+        return None
+
+def analyze_track(path, with_bpm=False):
+    """
+    One ffmpeg pass per track: EBU R128 loudness, true peak and silence bounds.
+    Runs inside a worker process, so it must stay a plain top-level function.
+    """
+    threshold = f"{MUSIC_SILENCE_THRESHOLD_DB}dB"
+    result = subprocess.run(
+        [
+            FFMPEG_PATH, "-hide_banner", "-nostats",
+            "-i", str(path),
+            "-vn",
+            "-af", f"ebur128=peak=true,silencedetect=n={threshold}:d=0.5",
+            "-f", "null", "-"
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace"
+    )
+    log = result.stderr
+    duration = fast_audio_duration(path)
+
+    # The ebur128 summary is printed last, so take the final matches
+    integrated = re.findall(r"I:\s+(-?[\d.]+|-inf) LUFS", log)
+    lra = re.findall(r"LRA:\s+(-?[\d.]+) LU", log)
+    peak = re.findall(r"Peak:\s+(-?[\d.]+|-inf) dBFS", log)
+
+    def last_float(values):
+        if not values or values[-1] == "-inf":
+            return None
+        return float(values[-1])
+
+    # Silence bounds: a silence starting at ~0 is lead-in, one that never ends is the tail
+    starts = [float(v) for v in re.findall(r"silence_start: (-?[\d.]+)", log)]
+    ends = [float(v) for v in re.findall(r"silence_end: (-?[\d.]+)", log)]
+    lead = ends[0] if starts and ends and starts[0] <= 0.05 else 0.0
+    audio_end = duration
+    if starts and len(starts) > len(ends):
+        audio_end = starts[-1]
+    elif starts and ends and ends[-1] >= duration - 0.05:
+        audio_end = starts[-1]
+    if audio_end <= lead:
+        lead, audio_end = 0.0, duration
+
+    return {
+        "version": AUDIO_FEATURES_VERSION,
+        "file": os.path.basename(path),
+        "duration_sec": duration,
+        "integrated_lufs": last_float(integrated),
+        "loudness_range_lu": last_float(lra),
+        "true_peak_dbtp": last_float(peak),
+        "lead_silence_sec": round(lead, 3),
+        "audio_end_sec": round(audio_end, 3),
+        "bpm": estimate_bpm(path) if with_bpm else None,
+    }
+
+def load_audio_features():
+    if os.path.exists(AUDIO_FEATURES_FILE):
+        try:
+            with open(AUDIO_FEATURES_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == AUDIO_FEATURES_VERSION:
+                return data.get("tracks", {})
+        except Exception as e:
+            print(f"⚠️ audio_features.json unreadable, rebuilding: {e}")
+    return {}
+
+def save_audio_features(tracks):
+    tmp = AUDIO_FEATURES_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": AUDIO_FEATURES_VERSION, "tracks": tracks}, f, indent=2)
+    os.replace(tmp, AUDIO_FEATURES_FILE)
+
+def build_audio_feature_index(paths, workers=None, with_bpm=ANALYZE_BPM):
+    """
+    Return {path: features} for every track, analysing only tracks whose
+    content hash is not in the persisted index yet.
+    """
+    index = load_audio_features()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        hashes = dict(zip(paths, executor.map(file_hash, paths)))
+
+    todo = [p for p in paths if hashes[p] not in index]
+    if todo:
+        print(f"🔬 Analysing {len(todo)} new track(s) for loudness/silence...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(analyze_track, p, with_bpm): p for p in todo}
+            for future in as_completed(futures):
+                p = futures[future]
+                try:
+                    index[hashes[p]] = future.result()
+                except Exception as e:
+                    print(f"⚠️ Analysis failed for {p}: {e}")
+        save_audio_features(index)
+
+    return {p: index[hashes[p]] for p in paths if hashes[p] in index}
+
+def track_gain(feat, target_lufs=MUSIC_TARGET_LUFS, ceiling_dbtp=MUSIC_TRUE_PEAK_DBTP):
+    """Linear gain that brings a track to target_lufs without pushing its true peak over the ceiling."""
+    if not MUSIC_NORMALIZE or feat.get("integrated_lufs") is None:
+        return 1.0
+    gain_db = target_lufs - feat["integrated_lufs"]
+    if feat.get("true_peak_dbtp") is not None:
+        gain_db = min(gain_db, ceiling_dbtp - feat["true_peak_dbtp"])
+    return 10 ** (gain_db / 20)
+
+# =========================
+# MUSIC BED POOL
+# =========================
+MUSIC_BED_FOLDER = os.path.join(MUSIC_FOLDER, "beds")
+MUSIC_BED_INDEX = os.path.join(MUSIC_BED_FOLDER, "beds.json")
+MUSIC_BED_BITRATE = "192k"
+MUSIC_BED_HEADROOM = 1.15  # gather this much more library audio than the bed length
+
+def list_library_tracks():
+    """Every downloaded MP3 in the music library, with its playlist folder and duration."""
+    library = []
+    if not os.path.isdir(MUSIC_FOLDER):
+        return library
+    for name in sorted(os.listdir(MUSIC_FOLDER)):
+        folder = os.path.join(MUSIC_FOLDER, name)
+        if not os.path.isdir(folder) or os.path.abspath(folder) == os.path.abspath(MUSIC_BED_FOLDER):
+            continue
+        for path, dur in get_audio_ledger(folder).refresh().durations().items():
+            if dur > 0:
+                library.append({"path": path, "playlist": name, "duration": dur})
+    return library
+
+class MusicBedPool:
     """
-    Ensure REAL audio duration >= REAL video duration.
-    If short, download more tracks until target is met.
+    Ready-made soundtracks at common lengths, assembled from the local
+    library with the streaming crossfade assembler and encoded to AAC.
+    The mux stage takes the smallest bed that covers the ride; disk use is
+    held under MUSIC_BED_BUDGET_MB by evicting least recently used beds.
     """
-    video_duration = fast_audio_duration(video_file)
 
-    # Get REAL total audio duration
-    mp3_files = [
-        str(Path(mp3_folder) / f)
-        for f in os.listdir(mp3_folder)
-        if f.lower().endswith('.mp3')
-    ]
-    total_audio = get_total_audio_duration(mp3_files)
+    def __init__(self, folder=MUSIC_BED_FOLDER, lengths_min=None, budget_mb=None):
+        self.folder = folder
+        self.index_path = os.path.join(folder, "beds.json")
+        self.lengths_sec = [m * 60 for m in sorted(lengths_min or MUSIC_BED_LENGTHS_MIN)]
+        self.budget_bytes = (MUSIC_BED_BUDGET_MB if budget_mb is None else budget_mb) * 1024 * 1024
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.beds = self._load()
+
+    # ---- index ----
+    def _load(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    beds = json.load(f).get("beds", [])
+                return [b for b in beds if os.path.exists(b["file"])]
+            except Exception as e:
+                print(f"⚠️ beds.json unreadable, starting fresh: {e}")
+        return []
 
-    # Keep topping up until REAL duration is enough
-    while total_audio + buffer_sec < video_duration:
-        missing = video_duration - total_audio
-        print(f"⚠️ Audio too short ({total_audio:.1f}s vs video {video_duration:.1f}s). Need +{missing:.1f}s")
+    def _save(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"beds": self.beds}, f, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def disk_usage(self):
+        with self.lock:
+            return sum(b["size"] for b in self.beds)
+
+    # ---- consumer side ----
+    def pick(self, duration_sec):
+        """
+        Smallest bed at least duration_sec long, preferring ones not used yet.
+        Marks it used (so the producer renders a fresh one) and most recently used.
+        """
+        with self.lock:
+            covering = [b for b in self.beds if b["duration"] >= duration_sec]
+            if not covering:
+                return None
+            bed = min(covering, key=lambda b: (b["used"], b["duration"]))
+            bed["used"] = True
+            bed["last_used"] = time.time()
+            self._save()
+            return dict(bed)
+
+    # ---- producer side ----
+    def missing_lengths(self):
+        """Configured lengths without an unused bed, shortest first."""
+        with self.lock:
+            ready = {b["length_sec"] for b in self.beds if not b["used"]}
+        return [l for l in self.lengths_sec if l not in ready]
+
+    def evict(self, needed_bytes=0):
+        """Drop least recently used beds until needed_bytes fits in the budget."""
+        with self.lock:
+            by_age = sorted(self.beds, key=lambda b: b["last_used"] or b["created"])
+            total = sum(b["size"] for b in self.beds)
+            for bed in by_age:
+                if total + needed_bytes <= self.budget_bytes:
+                    break
+                delete_if_exists(bed["file"])
+                self.beds.remove(bed)
+                total -= bed["size"]
+                print(f"🗑️ Evicted music bed {os.path.basename(bed['file'])}")
+            self._save()
+            return total + needed_bytes <= self.budget_bytes
+
+    def build(self, length_sec, library=None, should_abort=None):
+        """Render one bed of exactly length_sec. Returns the bed record, or None."""
+        estimated = length_sec * int(MUSIC_BED_BITRATE.rstrip("k")) * 1000 // 8
+        if not self.evict(estimated):
+            print(f"⚠️ A {length_sec/60:.0f} min bed does not fit in MUSIC_BED_BUDGET_MB, skipping.")
+            return None
 
-        extra_urls = get_limited_playlist_entries(
-            api_key, playlist_url,
-            missing,
-            mp3_folder, cache,
-            buffer_sec=buffer_sec
+        library = list_library_tracks() if library is None else list(library)
+        random.shuffle(library)
+        chosen, total = [], 0.0
+        for track in library:
+            chosen.append(track)
+            total += track["duration"]
+            if total >= length_sec * MUSIC_BED_HEADROOM:
+                break
+        if total < length_sec:
+            print(f"⚠️ Library has only {total/60:.1f} min of music, can't build a {length_sec/60:.0f} min bed.")
+            return None
+
+        paths = [t["path"] for t in chosen]
+        features = build_audio_feature_index(paths)
+        bed_id = f"bed-{length_sec // 60:03d}m-{int(time.time())}-{random.randrange(16**4):04x}"
+        final = os.path.join(self.folder, bed_id + ".m4a")
+        tmp = final + ".partial"
+
+        proc = subprocess.Popen(
+            [
+                FFMPEG_PATH, "-v", "error", "-y",
+                *pcm_input_args(),
+                "-c:a", "aac", "-b:a", MUSIC_BED_BITRATE,
+                "-f", "mp4", tmp
+            ],
+            stdin=subprocess.PIPE
         )
+        written = write_music_stream(paths, proc.stdin, duration_sec=length_sec,
+                                     features=features, should_abort=should_abort)
+        if proc.wait() != 0 or written < length_sec or (should_abort and should_abort()):
+            delete_if_exists(tmp)
+            return None
+        os.replace(tmp, final)
+
+        bed = {
+            "id": bed_id,
+            "file": final,
+            "length_sec": length_sec,
+            "duration": written,
+            "size": os.path.getsize(final),
+            "created": time.time(),
+            "last_used": None,
+            "used": False,
+            "tracks": [
+                {"title": Path(t["path"]).stem, "playlist": t["playlist"], "duration": t["duration"]}
+                for t in chosen
+            ],
+        }
+        with self.lock:
+            self.beds.append(bed)
+            self._save()
+        print(f"🛏️ Music bed ready: {length_sec/60:.0f} min from {len(chosen)} tracks ({bed['size']/1024/1024:.0f} MB)")
+        return bed
 
-        # Already downloaded inside get_limited_playlist_entries()
+_music_bed_pool = None
 
-        # Recalculate REAL duration
-        mp3_files = [
-            str(Path(mp3_folder) / f)
-            for f in os.listdir(mp3_folder)
-            if f.lower().endswith('.mp3')
-        ]
-        total_audio = get_total_audio_duration(mp3_files)
+def get_music_bed_pool():
+    global _music_bed_pool
+    if _music_bed_pool is None:
+        _music_bed_pool = MusicBedPool()
+    return _music_bed_pool
 
-    return total_audio
+def music_bed_title(bed):
+    playlists = list(dict.fromkeys(t["playlist"] for t in bed["tracks"]))
+    return "Music bed: " + ", ".join(playlists[:3]) + (f" +{len(playlists) - 3} more" if len(playlists) > 3 else "")
 
-def merge_mp3s_and_cleanup(mp3_folder, output_mp3):
-    # Collect and shuffle MP3 files
-    mp3_files = [f for f in os.listdir(mp3_folder) if f.lower().endswith('.mp3')]
-    random.shuffle(mp3_files)
+class MusicBedProducer(threading.Thread):
+    """
+    Watch-mode background task: while idle, renders a bed for every
+    configured length that has no unused one, one at a time, and abandons
+    the render as soon as a batch starts.
+    """
 
-    # Optional: audit duration before shuffle (if you want to keep this)
-    full_paths = [os.path.join(mp3_folder, f) for f in mp3_files]
-    actual_duration = get_total_audio_duration(full_paths)
-    print(f"🧮 Actual total audio duration: {actual_duration/60:.2f} minutes")
+    IDLE_GRACE_SEC = 120
+    RETRY_SEC = 1800
 
-    # Write shuffled file list for ffmpeg
-    filelist_path = os.path.join(mp3_folder, 'filelist.txt')
-    with open(filelist_path, 'w', encoding='utf-8') as filelist:
-        for mp3 in mp3_files:
-            path = os.path.join(mp3_folder, mp3).replace('\\', '/')
-            safe_path = path.replace("'", "'\\''")
-            filelist.write(f"file '{safe_path}'\n")
+    def __init__(self, pool=None):
+        super().__init__(daemon=True, name="music-bed-producer")
+        self.pool = pool or get_music_bed_pool()
+        self.stop_event = threading.Event()
 
-    # Merge with ffmpeg
-    subprocess.run(['ffmpeg','-f','concat','-safe','0','-i',filelist_path,'-c','copy',output_mp3], check=True)
+    def stop(self):
+        self.stop_event.set()
 
-    # Cleanup
-    os.remove(filelist_path)
+    def busy(self):
+        return self.stop_event.is_set() or not batch_idle.is_set() or is_copying
+
+    def run(self):
+        try:
+            ctypes.windll.kernel32.SetThreadPriority(ctypes.windll.kernel32.GetCurrentThread(), -2)
+        except Exception:
+            pass
+
+        while not self.stop_event.is_set():
+            batch_idle.wait()
+            if self.stop_event.wait(self.IDLE_GRACE_SEC) or self.busy():
+                continue
+            missing = self.pool.missing_lengths()
+            if not missing:
+                self.stop_event.wait(self.RETRY_SEC)
+                continue
+            try:
+                bed = self.pool.build(missing[0], should_abort=self.busy)
+            except Exception as e:
+                print(f"⚠️ Music bed producer: {e}")
+                bed = None
+            if bed is None and not self.busy():
+                self.stop_event.wait(self.RETRY_SEC)
 
 def mix_audio_with_video(video_file, new_audio_file):
     base, ext = os.path.splitext(video_file)
     output_file = f"{base}-music{ext}"
     duration = get_video_duration(video_file)
-    video_duration = get_video_duration(video_file)
     audio_duration = get_video_duration(new_audio_file)
-    print(f"🎬 Video duration: {video_duration:.1f}s")
+    print(f"🎬 Video duration: {duration:.1f}s")
     print(f"🎵 Audio duration: {audio_duration:.1f}s")
-    if has_audio_stream(video_file):
-        filter_complex = (
-            f"[0:a]atrim=duration={duration}[a0];"
-            f"[1:a]atrim=duration={duration}[a1];"
-            f"[a0][a1]amix=inputs=2:duration=shortest:dropout_transition=2[aout]"
-        )
-    else:
-        filter_complex = (
-            f"anullsrc=channel_layout=stereo:sample_rate=44100[a0];"
-            f"[1:a]atrim=duration={duration}[a1];"
-            f"[a0][a1]amix=inputs=2:duration=shortest:dropout_transition=2[aout]"
-        )
 
+    music_format = probe_audio_format(new_audio_file)
     command = [
         'ffmpeg', '-y',
         '-i', video_file,
         '-i', new_audio_file,
-        '-filter_complex', filter_complex,
-        '-map', '0:v',
-        '-map', '[aout]',
-        '-c:v', 'copy',
-        '-c:a', 'aac',
+        *build_mix_args(
+            duration,
+            [probe_audio_format(video_file)],
+            music_format["sample_rate"] if music_format else None,
+            flip=False  # add-music mode never set a rotation
+        ),
         output_file
     ]
     subprocess.run(command, check=True)
@@ -1092,24 +2506,9 @@ def run_add_music(video_file):
     duration_sec = get_video_duration(video_file)
     print(f"Duration of combined video: {duration_sec/60:.1f} mins")
 
-    playlists = search_youtube_playlists(API_KEY, SEARCH_TERM)
-    playlist_info = []
     cache = load_cache()
-
-    for pl in playlists:
-        pl_id = pl["id"]["playlistId"]
-        title = pl["snippet"]["title"]
-        duration = get_playlist_duration(API_KEY, pl_id, cache)
-        if duration_sec <= duration:
-            diff = abs(duration - duration_sec)
-            playlist_info.append({
-                "title": title,
-                "id": pl_id,
-                "duration": duration,
-                "diff": diff,
-                "url": f"https://www.youtube.com/playlist?list={pl_id}"
-            })
-    playlist_info.sort(key=lambda x: x["diff"])
+    playlists = get_search_playlists(cache)
+    playlist_info = rank_playlists(playlists, duration_sec, cache)
 
     for i, p in enumerate(playlist_info, start=1):
         match_pct = (p['duration'] / duration_sec) * 100
@@ -1134,20 +2533,23 @@ def run_add_music(video_file):
     )
     unified_download_playlist(entry_urls, DOWNLOAD_FOLDER, max_workers=8)
 
+    audio_ledger = get_audio_ledger(DOWNLOAD_FOLDER)
     total_audio = ensure_audio_matches_video(
         video_file, DOWNLOAD_FOLDER,
-        API_KEY, selected['url'], cache, buffer_sec=300
+        API_KEY, selected['url'], cache, buffer_sec=300,
+        target_sec=duration_sec, ledger=audio_ledger
     )
 
     output_mp3 = os.path.join(DOWNLOAD_FOLDER, "combined_playlist.mp3")
     delete_if_exists(output_mp3)
-    merge_mp3s_and_cleanup(DOWNLOAD_FOLDER, output_mp3)
+    merge_mp3s_and_cleanup(DOWNLOAD_FOLDER, output_mp3, ledger=audio_ledger)
     final_file = mix_audio_with_video(video_file, output_mp3)
 
     print(f'Created {final_file} with music')
     if DELETE_ORIGINALS:
         delete_if_exists(video_file)
     save_cache(cache)
+    get_api_client().print_report()
 
     return selected["title"], final_file, selected["url"]
 
@@ -1155,26 +2557,6 @@ def run_add_music(video_file):
 # =========================
 # STEP 3: UPLOAD FUNCTIONS
 # =========================
-class ProgressFile:
-    def __init__(self, file_path, progress_state):
-        self.f = open(file_path, "rb")
-        self.progress_state = progress_state
-
-    def read(self, size=-1):
-        chunk = self.f.read(size)
-        self.progress_state["uploaded"] += len(chunk)
-        #print("READ:", len(chunk))
-        return chunk
-
-    def seek(self, offset, whence=0):
-        return self.f.seek(offset, whence)
-
-    def tell(self):
-        return self.f.tell()
-
-    def close(self):
-        return self.f.close()
-
 _last_len = 0
 
 def safe_print_line(text):
@@ -1245,159 +2627,535 @@ def start_real_timer_thread(stop_event, progress_state):
     # ❌ REMOVE THIS — it prints the blank padded line
     # safe_print_line("")
 
-def get_authenticated_service():
-    creds = None
+TOKEN_REFRESH_MARGIN_SEC = 300   # refresh when the access token has less than this left
 
-    # Load existing token
-    if os.path.exists(TOKEN_FILE):
-        try:
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, YOUTUBE_UPLOAD_SCOPE)
-        except Exception as e:
-            print(f"⚠️ token.json corrupted, deleting: {e}")
-            os.remove(TOKEN_FILE)
-            creds = None
+_youtube_creds = None
+_youtube_service = None
+_youtube_lock = threading.RLock()
+
+def credentials_need_refresh(creds, margin_sec=TOKEN_REFRESH_MARGIN_SEC):
+    """True if the token is invalid or expires within margin_sec (creds.expiry is naive UTC)."""
+    if not creds.valid:
+        return True
+    if creds.expiry is None:
+        return False
+    remaining = creds.expiry - datetime.now(UTC).replace(tzinfo=None)
+    return remaining < timedelta(seconds=margin_sec)
+
+def save_token(creds):
+    tmp = TOKEN_FILE + ".tmp"
+    with open(tmp, "w") as token:
+        token.write(creds.to_json())
+    os.replace(tmp, TOKEN_FILE)
+
+def get_youtube_credentials():
+    """
+    OAuth credentials, cached for the life of the process and refreshed
+    (and written back to token.json) only when they are near expiry.
+    """
+    global _youtube_creds, _youtube_service
+
+    with _youtube_lock:
+        creds = _youtube_creds
+        if creds and not credentials_need_refresh(creds):
+            return creds
 
-    # If missing or invalid, try refresh
-    if not creds or not creds.valid:
-        if creds and creds.refresh_token:
+        # Load existing token
+        if creds is None and os.path.exists(TOKEN_FILE):
             try:
-                print("🔄 Refreshing YouTube OAuth token...")
-                creds.refresh(Request())
+                creds = Credentials.from_authorized_user_file(TOKEN_FILE, YOUTUBE_UPLOAD_SCOPE)
             except Exception as e:
-                print(f"❌ Refresh failed ({e}). Token revoked or expired.")
-                print("🧹 Deleting token.json and re-authenticating...")
-                if os.path.exists(TOKEN_FILE):
-                    os.remove(TOKEN_FILE)
+                print(f"⚠️ token.json corrupted, deleting: {e}")
+                os.remove(TOKEN_FILE)
+                creds = None
+
+        # Missing, invalid or about to expire: try refresh
+        if creds and credentials_need_refresh(creds):
+            if creds.refresh_token:
+                try:
+                    print("🔄 Refreshing YouTube OAuth token...")
+                    creds.refresh(Request())
+                    save_token(creds)
+                except Exception as e:
+                    print(f"❌ Refresh failed ({e}). Token revoked or expired.")
+                    print("🧹 Deleting token.json and re-authenticating...")
+                    if os.path.exists(TOKEN_FILE):
+                        os.remove(TOKEN_FILE)
+                    creds = None
+            elif not creds.valid:
                 creds = None
 
-        if not creds or not creds.valid:
+        if not creds:
             print("🌐 Opening browser for YouTube OAuth login...")
             flow = InstalledAppFlow.from_client_secrets_file(
                 CLIENT_SECRETS_FILE, YOUTUBE_UPLOAD_SCOPE
             )
             creds = flow.run_local_server(port=8080)
+            save_token(creds)
 
-        with open(TOKEN_FILE, "w") as token:
-            token.write(creds.to_json())
+        if creds is not _youtube_creds:
+            _youtube_service = None  # rebuilt around the new credentials
+        _youtube_creds = creds
+        return creds
 
-    # ---- FORCE REFRESH BEFORE EVERY UPLOAD ----
-    if creds and creds.refresh_token:
-        try:
-            print("🔄 Forcing OAuth token refresh before upload...")
-            creds.refresh(Request())
-            print("✅ OAuth token refreshed.")
-            with open(TOKEN_FILE, "w") as token:
-                token.write(creds.to_json())
-        except Exception as e:
-            print(f"❌ Forced refresh failed: {e}")
-            print("🧹 Deleting token.json and re-authenticating...")
-            if os.path.exists(TOKEN_FILE):
-                os.remove(TOKEN_FILE)
-            return get_authenticated_service()
+def get_authenticated_service():
+    """
+    The YouTube service, built once per process from the packaged discovery
+    document (no network fetch). Each call only makes sure the cached
+    credentials are fresh; requests read the current token at send time.
+    """
+    global _youtube_service
+
+    with _youtube_lock:
+        creds = get_youtube_credentials()
+        if _youtube_service is not None:
+            return _youtube_service
+
+        # ---- FAST PATH BELOW ----
+        authed_http = httplib2.Http()
+        original_request = authed_http.request
+
+        def auth_request(uri, method="GET", body=None, headers=None,
+                         redirections=5, connection_type=None):
+            if headers is None:
+                headers = {}
+            headers["Authorization"] = f"Bearer {get_youtube_credentials().token}"
+            return original_request(uri, method, body, headers, redirections, connection_type)
+
+        authed_http.request = auth_request
+
+        youtube = build(
+            YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
+            http=authed_http,
+            static_discovery=True,
+            cache_discovery=False
+        )
+        youtube.credentials = creds  # the chunked upload engine authenticates with these
+        _youtube_service = youtube
+        return youtube
+
+# =========================
+# CHUNKED UPLOAD ENGINE
+# =========================
+UPLOAD_CHUNK_ALIGN = 256 * 1024   # resumable protocol: every chunk but the last is a multiple of this
+UPLOAD_RETRIABLE_STATUS = (500, 502, 503, 504)
+UPLOAD_SESSION_MAX_AGE_SEC = 6 * 24 * 3600   # session URIs are good for about a week
+
+def upload_sidecar_path(path):
+    return str(path) + ".upload.json"
+
+def file_identity(path, sample=1024 * 1024):
+    """Cheap identity for a large file: size, mtime and a hash of its first and last MiB."""
+    st = os.stat(path)
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        h.update(f.read(sample))
+        if st.st_size > sample:
+            f.seek(max(sample, st.st_size - sample))
+            h.update(f.read(sample))
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sample_sha1": h.hexdigest()}
+
+class UploadInterrupted(Exception):
+    """Raised by ResumableUploader.upload() when should_stop() asks it to stop (e.g. paused)."""
+
+def align_chunk(size):
+    return max(UPLOAD_CHUNK_ALIGN, (int(size) // UPLOAD_CHUNK_ALIGN) * UPLOAD_CHUNK_ALIGN)
+
+class ChunkReader:
+    """
+    Reads file ranges into one reusable buffer with readinto(), so memory
+    stays at max_chunk bytes however large the file is.
+    """
 
-    # ---- FAST PATH BELOW ----
-    authed_http = httplib2.Http()
-    original_request = authed_http.request
+    def __init__(self, path, max_chunk):
+        self.f = open(path, "rb")
+        self.size = os.fstat(self.f.fileno()).st_size
+        self.buf = bytearray(max_chunk)
+
+    def view(self, offset, length):
+        """memoryview of file[offset:offset+length] (valid until the next call)."""
+        length = min(length, len(self.buf))
+        self.f.seek(offset)
+        got = 0
+        mv = memoryview(self.buf)
+        while got < length:
+            n = self.f.readinto(mv[got:length])
+            if not n:
+                break
+            got += n
+        return mv[:got]
 
-    def auth_request(uri, method="GET", body=None, headers=None,
-                     redirections=5, connection_type=None):
-        if headers is None:
-            headers = {}
-        headers["Authorization"] = f"Bearer {creds.token}"
-        return original_request(uri, method, body, headers, redirections, connection_type)
+    def close(self):
+        self.f.close()
 
-    authed_http.request = auth_request
+class GrowingFile:
+    """
+    An output file still being appended to by tee_to_file(). Readers wait
+    on it for bytes to land; final_size is set once the writer finishes.
+    """
 
-    return build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, http=authed_http)
+    def __init__(self, path):
+        self.path = str(path)
+        self.size = 0
+        self.final_size = None
+        self.failed = False
+        self.cond = threading.Condition()
+        open(self.path, "wb").close()
+
+    def appended(self, nbytes):
+        with self.cond:
+            self.size += nbytes
+            self.cond.notify_all()
+
+    def finish(self, ok=True):
+        with self.cond:
+            if ok:
+                self.final_size = self.size
+            else:
+                self.failed = True
+            self.cond.notify_all()
+
+    def wait_for(self, end):
+        """Block until end bytes exist (or the writer is done); returns the current size."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.size >= end or self.final_size is not None or self.failed)
+            return self.size
+
+def tee_to_file(stream, growing, block_size=1024 * 1024):
+    """Copy a pipe (e.g. ffmpeg stdout) into growing.path with one reusable buffer."""
+    buf = bytearray(block_size)
+    mv = memoryview(buf)
+    with open(growing.path, "wb") as f:
+        while True:
+            n = stream.readinto(buf)
+            if not n:
+                break
+            f.write(mv[:n])
+            f.flush()
+            growing.appended(n)
 
-def resumable_upload(insert_request, file_size):
-    response, error, retry = None, None, 0
-    start_time = time.time()
+class TailingChunkReader(ChunkReader):
+    """
+    ChunkReader over a GrowingFile: view() waits until the requested range
+    has been written. size stays None until the writer has finished, and
+    until then every chunk is a whole number of 256 KiB blocks.
+    """
 
-    # --- REUSE TIMER + PROGRESS STATE CREATED IN initialize_upload() ---
-    stop_event = insert_request.stop_event
-    timer_thread = insert_request.timer_thread
-    progress_state = insert_request.progress_state
+    def __init__(self, growing, max_chunk):
+        self.growing = growing
+        self.f = open(growing.path, "rb")
+        self.buf = bytearray(max_chunk)
+
+    @property
+    def size(self):
+        return self.growing.final_size
+
+    def view(self, offset, length):
+        available = self.growing.wait_for(offset + length)
+        if self.growing.failed:
+            raise UploadInterrupted("source file was abandoned by its writer")
+        if self.growing.final_size is None:
+            length = min(length, ((available - offset) // UPLOAD_CHUNK_ALIGN) * UPLOAD_CHUNK_ALIGN)
+        else:
+            length = min(length, self.growing.final_size - offset)
+        return ChunkReader.view(self, offset, length)
 
-    try:
-        while response is None:
-            try:
-                status, response = insert_request.next_chunk()
-
-                # ProgressFile updates progress_state["uploaded"] automatically
-
-                if response and "id" in response:
-                    # Upload finished
-                    stop_event.set()
-                    timer_thread.join()
-
-                    total_time = time.time() - start_time
-                    video_url = f"https://youtu.be/{response['id']}"
-
-                    # Strava webhook
-                    strava_activity_id = get_latest_strava_activity()
-                    strava_url = (
-                        f"https://www.strava.com/activities/{strava_activity_id}"
-                        if strava_activity_id else ""
-                    )
-                    if strava_activity_id and video_url:
-                        webhook_url = (
-                            f"https://dylix.org/stravaWebhook?youtube"
-                            f"&activityid={strava_activity_id}&url={video_url}"
-                        )
-                        resp = requests.get(webhook_url)
-                        print(f"📡 Webhook called: {webhook_url} (status {resp.status_code})")
-
-                    print(f"✅ Uploaded: {video_url}")
-
-                    # Pretty total time
-                    seconds = int(total_time)
-                    mins, secs = divmod(seconds, 60)
-                    hours, mins = divmod(mins, 60)
-
-                    if hours > 0:
-                        readable = f"{hours}h {mins}m {secs}s"
-                    elif mins > 0:
-                        readable = f"{mins}m {secs}s"
-                    else:
-                        readable = f"{secs}s"
+class AdaptiveChunkSizer:
+    """
+    Picks the next chunk size from measured throughput and retries: each
+    chunk is sized to take about TARGET_SEC at the smoothed upload rate (or
+    the last chunk's, if lower), growing at most 2x per chunk, and halves
+    on failure, so a retry never
+    costs more than ~TARGET_HIGH_SEC of transfer.
+    """
+
+    TARGET_HIGH_SEC = 20.0
+    TARGET_SEC = TARGET_HIGH_SEC / 2
+
+    def __init__(self, initial, minimum, maximum):
+        self.min = align_chunk(minimum)
+        self.max = align_chunk(maximum)
+        self.size = min(max(align_chunk(initial), self.min), self.max)
+        self.throughput = None   # bytes/sec, smoothed
+
+    def success(self, nbytes, seconds):
+        if seconds <= 0 or nbytes <= 0:
+            return
+        rate = nbytes / seconds
+        self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+        # The lower of the average and the last chunk's rate, so a slowdown takes effect at once
+        target = min(min(self.throughput, rate) * self.TARGET_SEC, self.size * 2)
+        self.size = min(self.max, max(self.min, align_chunk(target)))
+
+    def failure(self):
+        self.size = max(self.min, align_chunk(self.size // 2))
 
-                    print(f"⏱️ Total time: {readable}")
+class ResumableUploader:
+    """
+    YouTube resumable upload over requests, sending 256 KiB-aligned chunks
+    sized by AdaptiveChunkSizer. A failed chunk is retried from the offset
+    the server confirmed, not from zero.
+
+    The session URI, file identity and confirmed offset are kept in a
+    <file>.upload.json sidecar, so after a process or machine restart the
+    upload asks the server for its committed range and carries on.
+
+    With growing= (a GrowingFile) the upload tails a file that is still
+    being written: chunks go out as Content-Range "bytes s-e/*" and the
+    total is only sent once the writer has finished. Such sessions are
+    not persisted.
+    """
 
+    def __init__(self, session, path, metadata, progress_state=None, base_url=None, persist=True,
+                 throttle=None, should_stop=None, growing=None):
+        self.session = session
+        self.path = path
+        self.metadata = metadata
+        self.progress_state = progress_state if progress_state is not None else {"uploaded": 0}
+        self.base_url = (base_url or YOUTUBE_UPLOAD_BASE).rstrip("/")
+        self.sizer = AdaptiveChunkSizer(
+            UPLOAD_CHUNK_MB * 1024 * 1024,
+            UPLOAD_CHUNK_MIN_MB * 1024 * 1024,
+            UPLOAD_CHUNK_MAX_MB * 1024 * 1024
+        )
+        if growing is not None:
+            self.reader = TailingChunkReader(growing, self.sizer.max)
+            persist = False
+        else:
+            self.reader = ChunkReader(path, self.sizer.max)
+        self.total = self.reader.size   # None while a growing source is still being written
+        self.session_uri = None
+        self.offset = 0
+        self.retries = 0
+        self.persist = persist
+        self.throttle = throttle          # callable(nbytes), blocks to enforce a bandwidth share
+        self.should_stop = should_stop    # callable() -> True to stop between chunks
+        self.sidecar = upload_sidecar_path(path)
+        self.identity = file_identity(path) if persist else None
+        self.created = None
+        self.resumed_from = None
+
+    # ---- sidecar ----
+    def save_session(self):
+        if not self.persist or not self.session_uri:
+            return
+        state = {
+            "session_uri": self.session_uri,
+            "file": os.path.abspath(self.path),
+            "identity": self.identity,
+            "offset": self.offset,
+            "total": self.total,
+            "created": self.created or time.time(),
+            "updated": time.time(),
+        }
+        tmp = self.sidecar + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.sidecar)
+
+    def clear_session(self):
+        delete_if_exists(self.sidecar)
+
+    def resume_session(self):
+        """Pick up a persisted session for this exact file. Returns True if resumed."""
+        if not self.persist or not os.path.exists(self.sidecar):
+            return False
+        try:
+            with open(self.sidecar, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Unreadable upload sidecar, starting over: {e}")
+            self.clear_session()
+            return False
+
+        if state.get("identity") != self.identity:
+            print("⚠️ File changed since the interrupted upload, starting over.")
+            self.clear_session()
+            return False
+        if time.time() - state.get("created", 0) > UPLOAD_SESSION_MAX_AGE_SEC:
+            print("⚠️ Interrupted upload session expired, starting over.")
+            self.clear_session()
+            return False
+
+        self.session_uri = state["session_uri"]
+        self.created = state.get("created", time.time())
+        try:
+            self.offset, self.completed = self.query_offset()
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code in (404, 410):
+                print("⚠️ Server no longer knows the upload session, starting over.")
+                self.session_uri = None
+                self.clear_session()
+                return False
+            raise
+        self.resumed_from = self.offset
+        self.progress_state["uploaded"] = self.offset
+        print(f"⏯️ Resuming upload at {self.offset / 1024 / 1024:.1f}/{self.total / 1024 / 1024:.1f} MB")
+        self.save_session()
+        return True
+
+    def start(self):
+        """Open the upload session; returns its URI."""
+        headers = {"X-Upload-Content-Type": "video/mp4"}
+        if self.total is not None:
+            headers["X-Upload-Content-Length"] = str(self.total)
+        resp = self.session.post(
+            f"{self.base_url}/videos",
+            params={"uploadType": "resumable", "part": ",".join(self.metadata.keys())},
+            json=self.metadata,
+            headers=headers,
+            timeout=60
+        )
+        resp.raise_for_status()
+        self.session_uri = resp.headers["Location"]
+        self.created = time.time()
+        self.save_session()
+        return self.session_uri
+
+    @staticmethod
+    def _committed(resp):
+        """Next offset from a 308 response's Range header ("bytes=0-N")."""
+        rng = resp.headers.get("Range")
+        return int(rng.rsplit("-", 1)[1]) + 1 if rng else 0
+
+    def query_offset(self):
+        """Ask the server how much it has (empty PUT with Content-Range: bytes */total)."""
+        resp = self.session.put(
+            self.session_uri,
+            headers={"Content-Range": f"bytes */{self.total if self.total is not None else '*'}",
+                     "Content-Length": "0"},
+            timeout=60
+        )
+        if resp.status_code in (200, 201):
+            return self.total, resp.json()
+        if resp.status_code == 308:
+            return self._committed(resp), None
+        resp.raise_for_status()
+        raise RuntimeError(f"Unexpected status {resp.status_code} querying upload offset")
+
+    def send_chunk(self):
+        """PUT the next chunk. Returns the video resource once the upload is complete."""
+        chunk = self.reader.view(self.offset, self.sizer.size)
+        if self.total is None:
+            self.total = self.reader.size
+        if not len(chunk):
+            # Growing source finished exactly on a chunk boundary: just declare the total
+            self.offset, response = self.query_offset()
+            return response
+        if self.throttle:
+            self.throttle(len(chunk))
+        end = self.offset + len(chunk) - 1
+        started = time.monotonic()
+        resp = self.session.put(
+            self.session_uri,
+            data=chunk,
+            headers={"Content-Range": f"bytes {self.offset}-{end}/{self.total if self.total is not None else '*'}"},
+            timeout=max(120, self.sizer.TARGET_HIGH_SEC * 4)
+        )
+        if resp.status_code in UPLOAD_RETRIABLE_STATUS:
+            raise ConnectionError(f"Retriable HTTP error {resp.status_code}")
+        if resp.status_code == 308:
+            new_offset = self._committed(resp)
+            self.sizer.success(new_offset - self.offset, time.monotonic() - started)
+            self.offset = new_offset
+            self.progress_state["uploaded"] = self.offset
+            self.save_session()
+            return None
+        resp.raise_for_status()
+        self.offset = self.total
+        self.progress_state["uploaded"] = self.total
+        return resp.json()
+
+    def upload(self, max_retries=10):
+        """Run the upload to completion; returns the created video resource."""
+        self.completed = None
+        if not self.session_uri and not self.resume_session():
+            self.start()
+        if self.completed is not None:
+            self.clear_session()
+            self.reader.close()
+            return self.completed
+        try:
+            while True:
+                if self.should_stop and self.should_stop():
+                    raise UploadInterrupted(f"stopped at {self.offset}/{self.total} bytes")
+                try:
+                    response = self.send_chunk()
+                    if response is not None:
+                        self.clear_session()
+                        return response
+                    self.retries = 0
+                except (ConnectionError, requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout) as e:
+                    self.retries += 1
+                    self.sizer.failure()
+                    if self.retries > max_retries:
+                        raise RuntimeError("Upload failed after max retries.")
+                    sleep_seconds = random.random() * (2 ** self.retries)
+                    print(f"\n{e}, sleeping {sleep_seconds:.1f}s "
+                          f"(next chunk {self.sizer.size // 1024 // 1024} MB)...")
+                    time.sleep(sleep_seconds)
                     try:
-                        pyperclip.copy(video_url)
-                    except Exception:
-                        print("Clipboard copy not available.")
+                        self.offset, response = self.query_offset()
+                        self.progress_state["uploaded"] = self.offset
+                        self.save_session()
+                        if response is not None:
+                            self.clear_session()
+                            return response
+                    except Exception as qe:
+                        print(f"⚠️ Could not query upload offset, resending chunk: {qe}")
+        finally:
+            self.reader.close()
+
+def resumable_upload(uploader):
+    start_time = time.time()
 
-                    return video_url
+    # --- REUSE TIMER + PROGRESS STATE CREATED IN initialize_upload() ---
+    stop_event = uploader.stop_event
+    timer_thread = uploader.timer_thread  # None for background (queued) uploads
 
-            except HttpError as e:
-                if e.resp.status in [500, 502, 503, 504]:
-                    error = f"Retriable HTTP error {e.resp.status}"
-                else:
-                    raise
+    try:
+        # Chunking, retries and backoff happen inside the uploader
+        response = uploader.upload()
+
+        if response and "id" in response:
+            # Upload finished
+            stop_event.set()
+            if timer_thread:
+                timer_thread.join()
+
+            total_time = time.time() - start_time
+            video_url = f"https://youtu.be/{response['id']}"
+
+            # Webhook, clipboard and cleanup run as post-upload hooks (see upload_video)
+            print(f"✅ Uploaded: {video_url}")
+
+            # Pretty total time
+            seconds = int(total_time)
+            mins, secs = divmod(seconds, 60)
+            hours, mins = divmod(mins, 60)
+
+            if hours > 0:
+                readable = f"{hours}h {mins}m {secs}s"
+            elif mins > 0:
+                readable = f"{mins}m {secs}s"
+            else:
+                readable = f"{secs}s"
 
-            except Exception as e:
-                error = f"Retriable error: {e}"
+            print(f"⏱️ Total time: {readable}")
 
-            if error:
-                retry += 1
-                if retry > 10:
-                    raise RuntimeError("Upload failed after max retries.")
-                sleep_seconds = random.random() * (2 ** retry)
-                print(f"{error}, sleeping {sleep_seconds:.1f}s...")
-                time.sleep(sleep_seconds)
-                error = None
+            return video_url
 
     finally:
         # --- ALWAYS CLEAN UP TIMER THREAD ---
         stop_event.set()
         try:
-            timer_thread.join(timeout=1)
+            if timer_thread:
+                timer_thread.join(timeout=1)
         except Exception:
             pass
 
-def initialize_upload(youtube, options):
+def initialize_upload(youtube, options, show_progress=True, throttle=None, should_stop=None, growing=None):
     # --- KILL ANY PREVIOUS TIMER THREAD (THE REAL FIX) ---
     if hasattr(youtube, "active_stop_event"):
         try:
@@ -1418,7 +3176,7 @@ def initialize_upload(youtube, options):
         )
     )
 
-    file_size = os.path.getsize(options.file)
+    file_size = os.path.getsize(options.file) if growing is None else None
 
     # --- REAL PROGRESS STATE ---
     progress_state = {
@@ -1429,48 +3187,45 @@ def initialize_upload(youtube, options):
         "start_time": time.time()
     }
 
-    # --- WRAP THE FILE ---
-    wrapped_file = ProgressFile(options.file, progress_state)
-
-    # --- USE MediaIoBaseUpload ---
-    media_body = MediaIoBaseUpload(
-        wrapped_file,
-        mimetype="video/mp4",
-        chunksize=-1,
-        resumable=True
-    )
-
-    insert_request = youtube.videos().insert(
-        part=",".join(body.keys()),
-        body=body,
-        media_body=media_body
+    # --- CHUNKED RESUMABLE UPLOAD (bounded memory, adaptive chunk size) ---
+    uploader = ResumableUploader(
+        AuthorizedSession(youtube.credentials),
+        options.file,
+        body,
+        progress_state,
+        throttle=throttle,
+        should_stop=should_stop,
+        growing=growing
     )
 
-    # --- START REAL TIMER THREAD (ONLY ONE ALLOWED) ---
+    # --- START REAL TIMER THREAD (ONLY ONE ALLOWED; NONE FOR BACKGROUND UPLOADS) ---
     stop_event = threading.Event()
-    timer_thread = threading.Thread(
-        target=start_real_timer_thread,
-        args=(stop_event, progress_state),
-        daemon=True
-    )
-    timer_thread.start()
+    timer_thread = None
+    if show_progress:
+        timer_thread = threading.Thread(
+            target=start_real_timer_thread,
+            args=(stop_event, progress_state),
+            daemon=True
+        )
+        timer_thread.start()
 
     # --- STORE ACTIVE TIMER FOR NEXT RUN ---
     youtube.active_stop_event = stop_event
     youtube.active_timer_thread = timer_thread
 
-    # --- ATTACH TIMER + STATE TO REQUEST ---
-    insert_request.stop_event = stop_event
-    insert_request.timer_thread = timer_thread
-    insert_request.progress_state = progress_state
+    # --- ATTACH TIMER TO UPLOADER ---
+    uploader.stop_event = stop_event
+    uploader.timer_thread = timer_thread
 
     # --- RUN UPLOAD ---
-    resumable_upload(insert_request, file_size)
+    video_url = resumable_upload(uploader)
+    get_api_client().charge("videos.insert")
 
     # --- CLEANUP ---
     stop_event.set()
-    timer_thread.join()
-    wrapped_file.close()
+    if timer_thread:
+        timer_thread.join()
+    return video_url
 
 def format_time(seconds):
     """Convert seconds into H:MM:SS format."""
@@ -1481,9 +3236,11 @@ def format_time(seconds):
     else:
         return f"{m:02d}:{s:02d}"
 
+STRAVA_WEBHOOK_URL = "https://dylix.org/stravaWebhook"
+
 def get_latest_strava_activity():
-    url = "https://dylix.org/stravaWebhook?lastride"
-    resp = requests.get(url)
+    url = f"{STRAVA_WEBHOOK_URL}?lastride"
+    resp = requests.get(url, timeout=POST_UPLOAD_HOOK_TIMEOUT_SEC)
     resp.raise_for_status()
     data = resp.json()
 
@@ -1493,8 +3250,131 @@ def get_latest_strava_activity():
 
     return None
 
-def upload_video(video_file, playlist_title, playlist_url, chapter_text, privacy_status="unlisted"):
-    strava_activity_id = get_latest_strava_activity()
+# =========================
+# POST-UPLOAD HOOKS
+# =========================
+class PostUploadHooks:
+    """
+    Actions to run once a video is on YouTube (Strava webhook, clipboard,
+    cleanup). submit() returns immediately; each hook runs on a small
+    executor, every attempt is bounded by its timeout, and failed or
+    timed-out attempts are retried with backoff. A hook that still hangs
+    is abandoned rather than holding up the pipeline.
+
+    Hooks take one context dict: video_url, video_file, meta_path,
+    strava_activity_id (looked up once, before the upload) and background.
+    """
+
+    def __init__(self, workers=2):
+        self.hooks = []
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="post-upload")
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def register(self, name, fn, timeout=None, retries=None):
+        self.hooks.append({
+            "name": name,
+            "fn": fn,
+            "timeout": timeout if timeout is not None else POST_UPLOAD_HOOK_TIMEOUT_SEC,
+            "retries": retries if retries is not None else POST_UPLOAD_HOOK_RETRIES,
+        })
+
+    def _attempt(self, hook, context):
+        """Run one attempt in its own daemon thread so a hang can be timed out."""
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = hook["fn"](context)
+            except Exception as e:
+                outcome["error"] = e
+
+        t = threading.Thread(target=target, name=f"hook-{hook['name']}", daemon=True)
+        t.start()
+        t.join(hook["timeout"])
+        if t.is_alive():
+            raise TimeoutError(f"timed out after {hook['timeout']}s")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    def _run(self, hook, context):
+        for attempt in range(hook["retries"] + 1):
+            try:
+                return self._attempt(hook, context)
+            except Exception as e:
+                if attempt == hook["retries"]:
+                    print(f"⚠️ Post-upload hook '{hook['name']}' failed: {e}")
+                    return None
+                time.sleep(min(30, 2 ** attempt))
+
+    def submit(self, context):
+        """Queue every registered hook for one finished upload."""
+        futures = [self.executor.submit(self._run, hook, context) for hook in self.hooks]
+        with self.lock:
+            self.pending = [f for f in self.pending if not f.done()] + futures
+        return futures
+
+    def drain(self, timeout=None):
+        """Wait for outstanding hooks, e.g. before the process exits."""
+        with self.lock:
+            pending = list(self.pending)
+        deadline = None if timeout is None else time.time() + timeout
+        for f in pending:
+            try:
+                f.result(None if deadline is None else max(0, deadline - time.time()))
+            except Exception:
+                pass
+
+def strava_webhook_hook(context):
+    if not (context["strava_activity_id"] and context["video_url"]):
+        return None
+    webhook_url = (
+        f"{STRAVA_WEBHOOK_URL}?youtube"
+        f"&activityid={context['strava_activity_id']}&url={context['video_url']}"
+    )
+    resp = requests.get(webhook_url, timeout=POST_UPLOAD_HOOK_TIMEOUT_SEC)
+    resp.raise_for_status()
+    print(f"📡 Webhook called: {webhook_url} (status {resp.status_code})")
+    return resp.status_code
+
+def clipboard_hook(context):
+    if context["background"]:
+        return None
+    try:
+        pyperclip.copy(context["video_url"])
+    except Exception:
+        print("Clipboard copy not available.")
+
+def cleanup_hook(context):
+    # "ask" was already resolved on the calling thread (see upload_video)
+    return cleanup_final_outputs(context["video_file"], context["meta_path"], policy=context["cleanup"])
+
+_post_upload_hooks = None
+
+def get_post_upload_hooks():
+    global _post_upload_hooks
+    if _post_upload_hooks is None:
+        _post_upload_hooks = PostUploadHooks()
+        _post_upload_hooks.register("strava-webhook", strava_webhook_hook)
+        _post_upload_hooks.register("clipboard", clipboard_hook, retries=0)
+        # "ask" waits on a timed prompt; give it room beyond the hook timeout
+        _post_upload_hooks.register("cleanup", cleanup_hook, timeout=120, retries=0)
+    return _post_upload_hooks
+
+def upload_video(video_file, playlist_title, playlist_url, chapter_text, privacy_status="unlisted",
+                 background=False, throttle=None, should_stop=None, growing=None):
+    """
+    Upload one finished video; returns its URL, or None on an HTTP error.
+    background=True (upload queue) hides the progress bar and never
+    prompts. growing= uploads a file still being muxed. Post-upload hooks
+    are queued, not awaited.
+    """
+    try:
+        strava_activity_id = get_latest_strava_activity()
+    except Exception as e:
+        print(f"⚠️ Strava lookup failed: {e}")
+        strava_activity_id = None
     strava_url = f"https://www.strava.com/activities/{strava_activity_id}" if strava_activity_id else ""
 
     args = Namespace(
@@ -1503,8 +3383,8 @@ def upload_video(video_file, playlist_title, playlist_url, chapter_text, privacy
         description=(
             f"=== Chapters ===\n{chapter_text}\n\n"
             f"Raw GoPro footage with music automatically added from '{playlist_title}' and then uploaded.\n"
-            f"🎵 Listen to the full playlist here: {playlist_url}\n"
-            f"🚴 Strava activity: {strava_url}"
+            + (f"🎵 Listen to the full playlist here: {playlist_url}\n" if playlist_url else "")
+            + f"🚴 Strava activity: {strava_url}"
         ),
         category="22",
         privacyStatus=privacy_status
@@ -1513,16 +3393,405 @@ def upload_video(video_file, playlist_title, playlist_url, chapter_text, privacy
     youtube = get_authenticated_service()
 
     try:
-        initialize_upload(youtube, args)
+        video_url = initialize_upload(
+            youtube, args,
+            show_progress=not background, throttle=throttle, should_stop=should_stop,
+            growing=growing
+        )
 
-        # NEW: cleanup using meta.json instead of chapters.txt
-        meta_path = Path(str(video_file) + ".meta.json")
-        cleanup_final_outputs(video_file, meta_path)
+        if video_url:
+            # Prompt here, not on a hook thread, so it never competes with the main console
+            cleanup = POST_UPLOAD_CLEANUP
+            if cleanup == "ask":
+                cleanup = "keep" if background else ask_cleanup_policy()
+            get_post_upload_hooks().submit({
+                "video_url": video_url,
+                "video_file": str(video_file),
+                "meta_path": str(video_file) + ".meta.json",
+                "strava_activity_id": strava_activity_id,
+                "background": background,
+                "cleanup": cleanup,
+            })
+        return video_url
 
     except HttpError as e:
         print(f"🚨 HTTP error {e.resp.status} occurred:\n{e.content}")
+    except requests.exceptions.HTTPError as e:
+        print(f"🚨 HTTP error {e.response.status_code} occurred:\n{e.response.text}")
+
+
+
+# =========================
+# PROGRESSIVE UPLOAD (while muxing)
+# =========================
+FRAGMENTED_MP4_ARGS = ["-f", "mp4", "-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+
+def start_progressive_upload(growing, playlist_title, playlist_url, chapter_text, privacy_status="unlisted"):
+    """
+    Upload growing.path while the mux is still writing it; returns the
+    thread. If the live upload fails but the mux finished, the complete
+    file goes to the upload queue instead.
+    """
+    def run():
+        name = Path(growing.path).name
+        try:
+            video_url = upload_video(
+                growing.path, playlist_title, playlist_url, chapter_text,
+                privacy_status=privacy_status, background=True, growing=growing
+            )
+            if video_url:
+                print(f"\n✅ Progressive upload done: {name} → {video_url}")
+                return
+        except Exception as e:
+            print(f"\n❌ Progressive upload failed: {name} — {e}")
+
+        growing.wait_for(float("inf"))
+        if growing.final_size and UPLOAD_QUEUE_ENABLED:
+            enqueue_upload(growing.path, playlist_title, playlist_url, chapter_text, privacy_status)
+
+    t = threading.Thread(target=run, name=f"progressive-upload-{Path(growing.path).stem}")
+    t.start()
+    return t
+
+# =========================
+# BACKGROUND UPLOAD QUEUE
+# =========================
+UPLOAD_QUEUE_FILE = os.path.join(SCRIPT_FOLDER, "upload_queue.json")
+
+class UploadQueue:
+    """
+    Persistent, ordered upload queue in upload_queue.json. The file is the
+    source of truth, so `combined.py uploads ...` in another console can
+    pause, resume or reorder jobs while the worker is running.
+
+    Job states: queued → uploading → done | failed, plus paused.
+    """
 
+    def __init__(self, path=UPLOAD_QUEUE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {"paused": False, "jobs": []}
+        self._mtime = None
+        self.reload()
 
+    def reload(self):
+        """Re-read the file if someone else changed it."""
+        with self.lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+                self._mtime = mtime
+            except Exception as e:
+                print(f"⚠️ upload_queue.json unreadable: {e}")
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _find(self, job_id):
+        for job in self.state["jobs"]:
+            if job["id"] == job_id:
+                return job
+        raise KeyError(f"No upload job {job_id}")
+
+    def enqueue(self, video_file, playlist_title, playlist_url, chapter_text, privacy_status="unlisted"):
+        self.reload()
+        video_file = os.path.abspath(str(video_file))
+        with self.lock:
+            for job in self.state["jobs"]:
+                if job["file"] == video_file and job["state"] in ("queued", "uploading", "paused"):
+                    return job
+            job = {
+                "id": f"{int(time.time())}-{random.randrange(16**4):04x}",
+                "file": video_file,
+                "playlist_title": playlist_title,
+                "playlist_url": playlist_url,
+                "chapter_text": chapter_text,
+                "privacy_status": privacy_status,
+                "state": "queued",
+                "added": time.time(),
+                "error": None,
+                "video_url": None,
+            }
+            self.state["jobs"].append(job)
+            self._save()
+            return dict(job)
+
+    def claim_next(self):
+        """Mark the first queued job as uploading and return it (None if paused/empty)."""
+        self.reload()
+        with self.lock:
+            if self.state.get("paused"):
+                return None
+            for job in self.state["jobs"]:
+                if job["state"] == "queued":
+                    job["state"] = "uploading"
+                    job["started"] = time.time()
+                    self._save()
+                    return dict(job)
+        return None
+
+    def update(self, job_id, **fields):
+        self.reload()
+        with self.lock:
+            self._find(job_id).update(fields)
+            self._save()
+
+    def requeue(self, job_id):
+        """Put an interrupted 'uploading' job back in line (no-op if it was paused or removed)."""
+        self.reload()
+        with self.lock:
+            try:
+                job = self._find(job_id)
+            except KeyError:
+                return
+            if job["state"] == "uploading":
+                job["state"] = "queued"
+                self._save()
+
+    def recover(self):
+        """Jobs left 'uploading' by a crash go back in line (their sidecar resumes the bytes)."""
+        self.reload()
+        with self.lock:
+            for job in self.state["jobs"]:
+                if job["state"] == "uploading":
+                    job["state"] = "queued"
+            self._save()
+
+    def is_paused(self, job_id):
+        self.reload()
+        with self.lock:
+            if self.state.get("paused"):
+                return True
+            try:
+                return self._find(job_id)["state"] == "paused"
+            except KeyError:
+                return True  # removed while uploading
+
+    def set_paused(self, paused, job_id=None):
+        """Pause/resume the whole queue, or one job (resuming a failed job retries it)."""
+        self.reload()
+        with self.lock:
+            if job_id is None:
+                self.state["paused"] = paused
+            else:
+                job = self._find(job_id)
+                if paused and job["state"] in ("queued", "uploading"):
+                    job["state"] = "paused"
+                elif not paused and job["state"] in ("paused", "failed"):
+                    job["state"] = "queued"
+                    job["error"] = None
+            self._save()
+
+    def move(self, job_id, position):
+        """Put a job at 1-based position in the upload order."""
+        self.reload()
+        with self.lock:
+            job = self._find(job_id)
+            jobs = self.state["jobs"]
+            jobs.remove(job)
+            jobs.insert(max(0, min(len(jobs), position - 1)), job)
+            self._save()
+
+    def remove(self, job_id):
+        self.reload()
+        with self.lock:
+            self.state["jobs"].remove(self._find(job_id))
+            self._save()
+
+    def pending(self):
+        self.reload()
+        with self.lock:
+            return [dict(j) for j in self.state["jobs"] if j["state"] in ("queued", "uploading")]
+
+    def print_status(self):
+        self.reload()
+        with self.lock:
+            jobs = [dict(j) for j in self.state["jobs"]]
+            paused = self.state.get("paused")
+        print(f"📤 Upload queue{' (PAUSED)' if paused else ''}: {len(jobs)} job(s)")
+        for i, job in enumerate(jobs, start=1):
+            detail = job.get("video_url") or job.get("error") or ""
+            sidecar = upload_sidecar_path(job["file"])
+            if job["state"] in ("uploading", "paused", "queued") and os.path.exists(sidecar):
+                try:
+                    with open(sidecar, "r", encoding="utf-8") as f:
+                        sc = json.load(f)
+                    detail = f"{sc['offset'] / sc['total'] * 100:5.1f}% of {sc['total'] / 1024 / 1024:.0f} MB"
+                except Exception:
+                    pass
+            print(f"{i:>3}. [{job['state']:<9}] {job['id']}  {Path(job['file']).name}  {detail}")
+
+class UploadBandwidth:
+    """
+    Shared byte budget for all running uploads (UPLOAD_BANDWIDTH_MB_PER_SEC,
+    0 = unlimited). Concurrent uploads split it between them; while a batch
+    is processing only UPLOAD_BUSY_SHARE of it is used.
+    """
+
+    def __init__(self, mb_per_sec=None, busy_share=None):
+        self.mb_per_sec = UPLOAD_BANDWIDTH_MB_PER_SEC if mb_per_sec is None else mb_per_sec
+        self.busy_share = UPLOAD_BUSY_SHARE if busy_share is None else busy_share
+        self.bucket = TokenBucket(1, 1)
+
+    def rate(self):
+        if not self.mb_per_sec:
+            return 0
+        share = 1.0 if batch_idle.is_set() else self.busy_share
+        return self.mb_per_sec * share * 1024 * 1024
+
+    def consume(self, nbytes):
+        rate = self.rate()
+        if not rate:
+            return
+        with self.bucket.lock:
+            self.bucket.rate = rate
+            self.bucket.burst = max(self.bucket.burst, nbytes)
+        self.bucket.acquire(nbytes)
+
+class UploadWorker(threading.Thread):
+    """Services the upload queue in the background, UPLOAD_CONCURRENCY jobs at a time."""
+
+    POLL_SEC = 5
+
+    def __init__(self, queue=None, concurrency=None, bandwidth=None):
+        super().__init__(daemon=True, name="upload-worker")
+        self.queue = queue or UploadQueue()
+        self.concurrency = max(1, UPLOAD_CONCURRENCY if concurrency is None else concurrency)
+        self.bandwidth = bandwidth or UploadBandwidth()
+        self.stop_event = threading.Event()
+        self.wake = threading.Event()
+        self.active = {}   # job_id -> thread
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+
+    def notify(self):
+        """Call after enqueueing to start without waiting for the next poll."""
+        self.wake.set()
+
+    def wait_idle(self):
+        """Block until nothing is uploading and nothing runnable is queued (a paused queue counts as idle)."""
+        announced = False
+        while True:
+            pending = self.queue.pending()
+            running = any(t.is_alive() for t in list(self.active.values()))
+            if not running and (not pending or self.queue.state.get("paused")):
+                return
+            if not announced:
+                print(f"📤 Waiting for {len(pending)} queued upload(s) to finish...")
+                announced = True
+            time.sleep(self.POLL_SEC)
+
+    def run(self):
+        self.queue.recover()
+        while not self.stop_event.is_set():
+            for job_id, t in list(self.active.items()):
+                if not t.is_alive():
+                    del self.active[job_id]
+
+            while len(self.active) < self.concurrency:
+                job = self.queue.claim_next()
+                if not job:
+                    break
+                t = threading.Thread(target=self._upload, args=(job,), daemon=True, name=f"upload-{job['id']}")
+                self.active[job["id"]] = t
+                t.start()
+
+            self.wake.wait(self.POLL_SEC)
+            self.wake.clear()
+
+    def _upload(self, job):
+        name = Path(job["file"]).name
+        print(f"\n📤 Background upload started: {name}")
+        if not os.path.exists(job["file"]):
+            self.queue.update(job["id"], state="failed", error="file missing")
+            print(f"❌ Upload skipped, file missing: {name}")
+            return
+        try:
+            video_url = upload_video(
+                job["file"],
+                job["playlist_title"],
+                job["playlist_url"],
+                job["chapter_text"],
+                privacy_status=job["privacy_status"],
+                background=True,
+                throttle=self.bandwidth.consume,
+                should_stop=lambda: self.stop_event.is_set() or self.queue.is_paused(job["id"])
+            )
+        except UploadInterrupted:
+            # Paused (or shutting down): the sidecar keeps the session for later
+            self.queue.requeue(job["id"])
+            print(f"\n⏸️ Upload paused: {name}")
+            return
+        except Exception as e:
+            self.queue.update(job["id"], state="failed", error=str(e))
+            print(f"\n❌ Background upload failed: {name} — {e}")
+            return
+
+        if video_url:
+            self.queue.update(job["id"], state="done", video_url=video_url, finished=time.time())
+            print(f"\n✅ Background upload done: {name} → {video_url}")
+        else:
+            self.queue.update(job["id"], state="failed", error="upload failed (see log)")
+
+_upload_worker = None
+
+def get_upload_worker():
+    """Start the background upload worker once and return it."""
+    global _upload_worker
+    if _upload_worker is None or not _upload_worker.is_alive():
+        _upload_worker = UploadWorker()
+        _upload_worker.start()
+    return _upload_worker
+
+def enqueue_upload(video_file, playlist_title, playlist_url, chapter_text, privacy_status="unlisted"):
+    worker = get_upload_worker()
+    job = worker.queue.enqueue(video_file, playlist_title, playlist_url, chapter_text, privacy_status)
+    worker.notify()
+    print(f"📤 Queued for upload ({job['id']}): {Path(video_file).name} — "
+          f"'python combined.py uploads' shows the queue")
+    return job
+
+def upload_queue_cli(argv):
+    """combined.py uploads [status | pause [ID] | resume [ID] | move ID POS | remove ID | run]"""
+    queue = UploadQueue()
+    cmd = argv[0] if argv else "status"
+    try:
+        if cmd == "status":
+            pass
+        elif cmd == "pause":
+            queue.set_paused(True, argv[1] if len(argv) > 1 else None)
+        elif cmd == "resume":
+            queue.set_paused(False, argv[1] if len(argv) > 1 else None)
+        elif cmd == "move":
+            queue.move(argv[1], int(argv[2]))
+        elif cmd == "remove":
+            queue.remove(argv[1])
+        elif cmd == "run":
+            # Drain the queue in the foreground
+            worker = UploadWorker(queue)
+            worker.start()
+            worker.wait_idle()
+            worker.stop()
+        else:
+            print(upload_queue_cli.__doc__)
+            return
+    except (KeyError, IndexError, ValueError) as e:
+        print(f"❌ {e}")
+        print(upload_queue_cli.__doc__)
+        return
+    queue.print_status()
 
 # =========================
 # Generates dummy GoPro-style videos with overlays and sets file modification times.
@@ -1643,7 +3912,8 @@ def process_video_file(video_file, meta_json_path):
 
         start_alerts()
         choice = input_with_timeout(
-            "🛠️ Would you like to upload the video? This uses a lot of API daily credits. 1600 out of 10000. (y/n): ",
+            f"🛠️ Would you like to upload the video? This uses a lot of API daily credits. "
+            f"{QUOTA_COSTS['videos.insert']} of {get_api_client().quota_remaining()} remaining today. (y/n): ",
             timeout=30, require_input=False, default="y"
         )
         stop_all_alerts()
@@ -2032,14 +4302,23 @@ def wait_for_settle():
         else:
             break
 
-def cleanup_final_outputs(final_video_path, meta_json_path):
+def ask_cleanup_policy():
+    """Timed prompt for the "ask" cleanup policy; "keep" if nobody answers."""
+    choice = input_with_timeout("🗑️ Delete merged MP4 and metadata? (y/N): ", timeout=30, default="n")
+    return "delete" if str(choice).strip().lower() == "y" else "keep"
+
+def cleanup_final_outputs(final_video_path, meta_json_path, policy=None):
     """
-    Ask user whether to delete the merged final MP4 and its metadata file.
+    Delete the merged final MP4 and its metadata file according to policy
+    (POST_UPLOAD_CLEANUP by default): "keep", "delete", or "ask" (timed
+    prompt that keeps the files if nobody answers).
     Returns True if files were deleted, False otherwise.
     """
-    choice = input("🗑️ Delete merged MP4 and metadata? (y/N): ").strip().lower()
+    policy = policy or POST_UPLOAD_CLEANUP
+    if policy == "ask":
+        policy = ask_cleanup_policy()
 
-    if choice != "y":
+    if policy != "delete":
         print("❎ Keeping merged MP4 + metadata.")
         return False
 
@@ -2070,6 +4349,99 @@ def cleanup_final_outputs(final_video_path, meta_json_path):
 
     return deleted_any
 
+# ============================
+#  IDLE CACHE WARMER
+# ============================
+
+class CacheWarmer(threading.Thread):
+    """
+    Low-priority background task for watch mode. While no batch is running
+    it refreshes SEARCH_TERM results, resolves playlist/video durations and
+    pre-extracts flat entry lists, so the playlist prompt is instant when a
+    card goes in. API spend is capped by WARM_CACHE_QUOTA_BUDGET per day.
+    """
+
+    IDLE_GRACE_SEC = 60        # wait this long after a batch before warming
+    MIN_PLAYLIST_UNITS = 2     # one playlistItems page + one videos chunk
+
+    def __init__(self, interval_sec=None, quota_budget=None):
+        super().__init__(daemon=True, name="cache-warmer")
+        self.interval_sec = WARM_CACHE_INTERVAL_SEC if interval_sec is None else interval_sec
+        self.quota_budget = WARM_CACHE_QUOTA_BUDGET if quota_budget is None else quota_budget
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def busy(self):
+        return self.stop_event.is_set() or not batch_idle.is_set() or is_copying
+
+    def budget_left(self):
+        client = get_api_client()
+        return min(self.quota_budget - client.tag_used("warmer"), client.quota_remaining())
+
+    def run(self):
+        try:
+            # THREAD_PRIORITY_LOWEST, so warming never competes with ffmpeg/ui
+            ctypes.windll.kernel32.SetThreadPriority(ctypes.windll.kernel32.GetCurrentThread(), -2)
+        except Exception:
+            pass
+
+        while not self.stop_event.is_set():
+            batch_idle.wait()
+            if self.stop_event.wait(self.IDLE_GRACE_SEC) or self.busy():
+                continue
+            try:
+                self.warm_once()
+            except Exception as e:
+                print(f"⚠️ Cache warmer: {e}")
+            self.stop_event.wait(self.interval_sec)
+
+    def warm_once(self):
+        cache = load_cache()
+        client = get_api_client()
+        resolved = extracted = 0
+
+        with client.tagged("warmer"):
+            searched = cache.get("search_results") or {}
+            stale = (searched.get("query") != SEARCH_TERM
+                     or time.time() - searched.get("fetched_at", 0) >= SEARCH_CACHE_TTL_SEC)
+            if stale and self.budget_left() >= QUOTA_COSTS["search"]:
+                refresh_search_playlists(cache)
+            playlists = (cache.get("search_results") or {}).get("items", [])
+
+            for pl in playlists:
+                if self.busy():
+                    break
+                pl_id = pl["id"]["playlistId"]
+                if pl_id in cache:
+                    continue
+                if self.budget_left() < self.MIN_PLAYLIST_UNITS:
+                    print("🧊 Cache warmer: daily quota budget used up.")
+                    break
+                get_playlist_duration(pl_id, cache)
+                resolved += 1
+
+            # Flat entries cost no API quota; get_flat_playlist honours its TTL
+            for pl in playlists:
+                if self.busy():
+                    break
+                pl_id = pl["id"]["playlistId"]
+                if not isinstance(cache.get(pl_id), (int, float)):
+                    continue
+                if pl_id not in cache.get("flat_playlists", {}):
+                    extracted += 1
+                get_flat_playlist(f"https://www.youtube.com/playlist?list={pl_id}", cache)
+
+        if self.busy():
+            # A batch loaded the cache meanwhile; its save must win
+            print("🧊 Cache warmer interrupted by a batch, discarding partial work.")
+            return
+
+        save_cache(cache)
+        print(f"🧊 Cache warmed: {len(playlists)} playlists, {resolved} durations resolved, "
+              f"{extracted} flat lists extracted, {client.tag_used('warmer')}/{self.quota_budget} units used today.")
+
 def start_watcher_then_process():
     global last_event_time
 
@@ -2082,6 +4454,20 @@ def start_watcher_then_process():
     # USB listener stays as-is
     threading.Thread(target=usb_listener, daemon=True).start()
 
+    warmer = None
+    if WARM_CACHE_ENABLED:
+        warmer = CacheWarmer()
+        warmer.start()
+
+    bed_producer = None
+    if MUSIC_BED_ENABLED:
+        bed_producer = MusicBedProducer()
+        bed_producer.start()
+
+    # Resume anything left in the upload queue
+    if UPLOAD_QUEUE_ENABLED:
+        get_upload_worker()
+
     try:
         while True:
             # Only trigger processing if:
@@ -2099,7 +4485,11 @@ def start_watcher_then_process():
                 if real_files:
                     print(f"📦 Processing batch of {len(real_files)} new files...")
 
-                    result = process_all_new_files()
+                    batch_idle.clear()
+                    try:
+                        result = process_all_new_files()
+                    finally:
+                        batch_idle.set()
                     if result:
                         final_output, _, _, _ = result
 
@@ -2122,6 +4512,10 @@ def start_watcher_then_process():
         print("❌ Watcher stopped by user.")
 
     finally:
+        if warmer:
+            warmer.stop()
+        if bed_producer:
+            bed_producer.stop()
         observer.stop()
         observer.join()
 
@@ -2310,6 +4704,10 @@ def stop_all_alerts():
 # MAIN PIPELINE
 # =========================
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "uploads":
+        upload_queue_cli(sys.argv[2:])
+        exit()
+
     script_root = Path(VIDEO_FOLDER).resolve()
 
     all_mp4s = list(script_root.glob("*.mp4"))
@@ -2339,7 +4737,7 @@ if __name__ == "__main__":
 
     # 1) If raw chunks exist → merge
     if raw_chunks:
-        video_file, chapter_text, playlist_title, playlist_url = process_gopro_with_music_in_one_pass()
+        video_file, chapter_text, playlist_title, playlist_url = process_gopro_with_music_in_one_pass(wait_for_uploads=True)
         if not video_file:
             print("❌ Merge failed. Exiting.")
             exit()
@@ -2396,8 +4794,6 @@ if __name__ == "__main__":
                 privacy_status="unlisted"
             )
 
-            cleanup_final_outputs(final_video, meta_path)
-
         start_watcher_then_process()
         exit()
 
@@ -2416,7 +4812,7 @@ if __name__ == "__main__":
         if choice.lower() == "y":
             generate_dummy_gopro_clips(VIDEO_FOLDER)
             print("✅ Dummy clips generated. Starting merge...")
-            video_file, chapter_text, playlist_title, playlist_url = process_gopro_with_music_in_one_pass()
+            video_file, chapter_text, playlist_title, playlist_url = process_gopro_with_music_in_one_pass(wait_for_uploads=True)
         else:
             print("⏳ Entering watch mode...")
             start_watcher_then_process()
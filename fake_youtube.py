@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+"""
+Offline stand-in for the parts of YouTube the music phase talks to.
+
+- FakeYouTubeServer: local HTTP server implementing the Data API v3
+  `search`, `playlistItems` and `videos` endpoints, with configurable
+  latency, page size, error injection and ETag / 304 revalidation.
+- The same server also implements the resumable upload protocol
+  (POST uploadType=resumable, PUT Content-Range chunks, 308 + Range),
+  keeping only a running hash per session, with optional partial commits
+  and injected 503s to exercise interruption and recovery.
+- FakeYtDlp: drop-in for combined.set_ytdlp_backend(); answers flat
+  playlist extraction from the same catalogue and "downloads" by writing
+  synthetic MP3s of the catalogue durations with ffmpeg.
+
+Everything is generated from a seed, so runs are repeatable.
+"""
+
+import hashlib
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def seconds_to_iso8601(sec):
+    h, rem = divmod(int(sec), 3600)
+    m, s = divmod(rem, 60)
+    return "PT" + (f"{h}H" if h else "") + (f"{m}M" if m else "") + f"{s}S"
+
+
+class FakeCatalogue:
+    """Seeded set of playlists and videos with known durations."""
+
+    def __init__(self, playlists=40, min_tracks=8, max_tracks=60,
+                 min_track_sec=120, max_track_sec=330, seed=1234):
+        rng = random.Random(seed)
+        self.playlists = {}   # playlist_id -> {"title", "videos": [video_id, ...]}
+        self.videos = {}      # video_id -> {"title", "duration"}
+
+        for p in range(playlists):
+            pl_id = f"PLfake{p:04d}"
+            videos = []
+            for t in range(rng.randint(min_tracks, max_tracks)):
+                vid = f"v{p:04d}t{t:03d}".ljust(11, "x")[:11]
+                self.videos[vid] = {
+                    "title": f"Fake Track {p:04d} {t:03d}",
+                    "duration": rng.randint(min_track_sec, max_track_sec),
+                }
+                videos.append(vid)
+            self.playlists[pl_id] = {"title": f"Fake EDM Mix {p:04d}", "videos": videos}
+
+    def playlist_duration(self, pl_id):
+        return sum(self.videos[v]["duration"] for v in self.playlists[pl_id]["videos"])
+
+
+class FakeYouTubeServer:
+    """
+    Local HTTP server for the Data API endpoints used by the music phase.
+    Point combined.YOUTUBE_API_BASE at `server.base_url`.
+
+    latency_sec: added to every response
+    page_size:   caps maxResults for paged endpoints
+    error_rate:  fraction of requests answered with error_status
+    """
+
+    def __init__(self, catalogue=None, latency_sec=0.0, page_size=50,
+                 error_rate=0.0, error_status=503, seed=1234, port=0):
+        self.catalogue = catalogue or FakeCatalogue(seed=seed)
+        self.latency_sec = latency_sec
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.not_modified = 0
+        self.uploads = {}     # upload_id -> session state
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/youtube/v3"
+
+    @property
+    def upload_base_url(self):
+        """Point combined.YOUTUBE_UPLOAD_BASE here."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/upload/youtube/v3"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ------------------------------------------------------------
+    # ENDPOINTS
+    # ------------------------------------------------------------
+
+    def _page(self, items, params):
+        size = min(int(params.get("maxResults", 5)), self.page_size, 50)
+        offset = int(params.get("pageToken") or 0)
+        body = {"items": items[offset:offset + size]}
+        if offset + size < len(items):
+            body["nextPageToken"] = str(offset + size)
+        return body
+
+    def search(self, params):
+        # Every catalogue playlist matches whatever SEARCH_TERM is configured
+        items = [
+            {
+                "kind": "youtube#searchResult",
+                "id": {"kind": "youtube#playlist", "playlistId": pl_id},
+                "snippet": {"title": pl["title"]},
+            }
+            for pl_id, pl in self.catalogue.playlists.items()
+        ]
+        return 200, self._page(items, params)
+
+    def playlist_items(self, params):
+        pl = self.catalogue.playlists.get(params.get("playlistId"))
+        if pl is None:
+            return 404, {"error": {"code": 404, "message": "playlistNotFound"}}
+        items = [{"contentDetails": {"videoId": vid}} for vid in pl["videos"]]
+        return 200, self._page(items, params)
+
+    def videos(self, params):
+        ids = [v for v in params.get("id", "").split(",") if v]
+        items = [
+            {"id": vid, "contentDetails": {"duration": seconds_to_iso8601(self.catalogue.videos[vid]["duration"])}}
+            for vid in ids[:50]
+            if vid in self.catalogue.videos
+        ]
+        return 200, {"items": items}
+
+    # ------------------------------------------------------------
+    # RESUMABLE UPLOADS
+    # ------------------------------------------------------------
+
+    def start_upload(self, params, headers, body):
+        if params.get("uploadType") != "resumable":
+            return 400, {"error": {"code": 400, "message": "only uploadType=resumable is supported"}}, {}
+        upload_id = "%016x" % self.rng.getrandbits(64)
+        with self.lock:
+            self.uploads[upload_id] = {
+                # None until a chunk or status query names it (progressive uploads)
+                "total": int(headers["X-Upload-Content-Length"]) if "X-Upload-Content-Length" in headers else None,
+                "committed": 0,
+                "received": 0,      # every body byte that arrived, including re-sent ones
+                "sha256": hashlib.sha256(),
+                "metadata": json.loads(body or b"{}"),
+                "video": None,
+            }
+        location = f"{self.upload_base_url}/videos?uploadType=resumable&upload_id={upload_id}"
+        return 200, {}, {"Location": location}
+
+    def put_chunk(self, params, headers, body):
+        sess = self.uploads.get(params.get("upload_id", ""))
+        if sess is None:
+            return 404, {"error": {"code": 404, "message": "upload session not found"}}, {}
+
+        content_range = headers.get("Content-Range", "")
+        with self.lock:
+            sess["received"] += len(body)
+            span, _, total = content_range[len("bytes "):].partition("/")
+            if total != "*":
+                sess["total"] = int(total)
+            if span == "*":
+                return self._upload_status(sess)
+
+            start, _, end = span.partition("-")
+            start, end = int(start), int(end)
+            if start > sess["committed"]:
+                return 400, {"error": {"code": 400, "message": "chunk starts past the committed offset"}}, {}
+            data = body[sess["committed"] - start:]
+
+            if self.rng.random() < self.error_rate:
+                # Commit a 256 KiB-aligned prefix, then fail, like a dropped connection
+                keep = (self.rng.randrange(len(data) + 1) // (256 * 1024)) * (256 * 1024)
+                sess["sha256"].update(data[:keep])
+                sess["committed"] += keep
+                return self.error_status, {"error": {"code": self.error_status, "message": "injected error"}}, {}
+
+            sess["sha256"].update(data)
+            sess["committed"] += len(data)
+            return self._upload_status(sess)
+
+    def _upload_status(self, sess):
+        if sess["total"] is not None and sess["committed"] >= sess["total"]:
+            if sess["video"] is None:
+                sess["video"] = {
+                    "kind": "youtube#video",
+                    "id": "%011x" % self.rng.getrandbits(44),
+                    "snippet": sess["metadata"].get("snippet", {}),
+                    "status": sess["metadata"].get("status", {}),
+                    "sha256": sess["sha256"].hexdigest(),
+                }
+            return 200, sess["video"], {}
+        extra = {"Range": f"bytes=0-{sess['committed'] - 1}"} if sess["committed"] else {}
+        return 308, None, extra
+
+    def _handler_class(self):
+        server = self
+        routes = {
+            "search": server.search,
+            "playlistItems": server.playlist_items,
+            "videos": server.videos,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                if body is not None:
+                    self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _upload_request(self, handler):
+                parsed = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with server.lock:
+                    key = f"upload.{self.command}"
+                    server.calls[key] = server.calls.get(key, 0) + 1
+                if server.latency_sec:
+                    time.sleep(server.latency_sec)
+                if not parsed.path.startswith("/upload/"):
+                    return self._send(404, {"error": {"code": 404, "message": "not found"}})
+                status, resp, headers = handler(params, self.headers, body)
+                self._send(status, resp, headers)
+
+            def do_POST(self):
+                self._upload_request(server.start_upload)
+
+            def do_PUT(self):
+                self._upload_request(server.put_chunk)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                endpoint = parsed.path.rstrip("/").rsplit("/", 1)[-1]
+                params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+                with server.lock:
+                    server.calls[endpoint] = server.calls.get(endpoint, 0) + 1
+                    fail = server.rng.random() < server.error_rate
+
+                if server.latency_sec:
+                    time.sleep(server.latency_sec)
+
+                if endpoint not in routes:
+                    status, body = 404, {"error": {"code": 404, "message": f"unknown endpoint {endpoint}"}}
+                elif fail:
+                    status, body = server.error_status, {"error": {"code": server.error_status, "message": "injected error"}}
+                else:
+                    status, body = routes[endpoint](params)
+
+                data = json.dumps(body).encode("utf-8")
+                etag = '"' + hashlib.md5(data).hexdigest() + '"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    with server.lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 200:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+class FakeYtDlp:
+    """
+    yt-dlp stand-in for combined.set_ytdlp_backend().
+    Downloads become synthetic sine-wave MP3s with the catalogue duration
+    (times duration_scale, to keep long benchmarks short).
+    """
+
+    def __init__(self, catalogue, ffmpeg="ffmpeg", duration_scale=1.0, latency_sec=0.0):
+        self.catalogue = catalogue
+        self.ffmpeg = ffmpeg
+        self.duration_scale = duration_scale
+        self.latency_sec = latency_sec
+
+    def extract_flat(self, playlist_url):
+        pl_id = parse_qs(urlparse(playlist_url).query).get("list", [""])[0]
+        pl = self.catalogue.playlists.get(pl_id, {"title": "unknown", "videos": []})
+        return {
+            "id": pl_id,
+            "title": pl["title"],
+            "entries": [
+                {
+                    "id": vid,
+                    "ie_key": "Youtube",
+                    "url": f"https://www.youtube.com/watch?v={vid}",
+                    "title": self.catalogue.videos[vid]["title"],
+                    "duration": self.catalogue.videos[vid]["duration"],
+                }
+                for vid in pl["videos"]
+            ],
+        }
+
+    def download(self, url, output_path):
+        vid = parse_qs(urlparse(url).query).get("v", [""])[0]
+        video = self.catalogue.videos.get(vid)
+        if video is None:
+            raise ValueError(f"unknown fake video {url}")
+
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+
+        target = os.path.join(output_path, f"{video['title']}.mp3")
+        if not os.path.exists(target):
+            make_synthetic_mp3(target, video["duration"] * self.duration_scale, self.ffmpeg,
+                               freq=220 + (sum(map(ord, vid)) % 660))
+        return {"id": vid, "extractor_key": "Youtube", "title": video["title"]}
+
+
+def make_synthetic_mp3(path, duration_sec, ffmpeg="ffmpeg", freq=440):
+    """Write a sine-wave MP3 of the given length (small bitrate, fast to encode)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    subprocess.run(
+        [
+            ffmpeg, "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency={freq}:sample_rate=44100:duration={duration_sec:.3f}",
+            "-ac", "2",
+            "-c:a", "libmp3lame", "-b:a", "64k",
+            path
+        ],
+        check=True
+    )
+    return path
+
+
+if __name__ == "__main__":
+    # Run the stand-in on its own, e.g. to point a config.json at it
+    srv = FakeYouTubeServer(latency_sec=0.05).start()
+    print(f"Fake YouTube Data API listening on {srv.base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        srv.stop()